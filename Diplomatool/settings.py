@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/1.10/ref/settings/
 """
 
 import os
+import tempfile
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -40,11 +41,14 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'site_app.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'site_app.middleware.RoleCacheMiddleware',
+    'site_app.profiling.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -53,7 +57,8 @@ ROOT_URLCONF = 'Diplomatool.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # Measures the rendering time of requests, see site_app.metrics
+        'BACKEND': 'site_app.metrics.TimedDjangoTemplates',
         'DIRS': [os.path.join(BASE_DIR, 'templates')]
         ,
         'APP_DIRS': True,
@@ -120,6 +125,83 @@ STATIC_URL = '/static/'
 
 CRISPY_TEMPLATE_PACK = 'bootstrap3'
 
+# Cache
+# Worker processes share the versions of the cached pages, the supervisor directory and the profiling rules and the
+# request metrics through the cache, so it must not be kept in the memory of each process (LocMemCache). The file
+# based cache is shared by the workers of one host, memcached has to be used when they run on several hosts.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(tempfile.gettempdir(), 'diplomatool_cache'),
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    }
+}
+
+# User roles
+# Keeps group names of the logged in user in the session. Requires a cache backend shared by all workers,
+# since group membership changes are propagated through it.
+ROLE_SESSION_CACHE = False
+
+# Cached pages
+# Seconds the rendered tables and forms of the topic and review lists are kept for. They are made stale by every change
+# of the rows they show, so the timeout only limits the memory they use.
+FRAGMENT_CACHE_TIMEOUT = 600
+
+# JSON API
+# Objects on a page when the limit parameter is not given, the largest allowed limit and the most objects created or
+# updated by a single request
+API_PAGE_SIZE = 50
+API_MAX_PAGE_SIZE = 500
+API_MAX_BULK_SIZE = 500
+
+# Reviews
+# Number of days reviewers have for reviewing a finished thesis. Run refresh_review_deadlines after changing it.
+REVIEW_PERIOD_DAYS = 14
+
+# Topics
+# Estimated similarity (0 to 1) of the words of two topics from which a proposal is flagged as a likely duplicate
+TOPIC_DUPLICATE_THRESHOLD = 0.5
+
+# Theses
+# Estimated similarity (0 to 1) of the texts of two theses from which they are reported to the reviewers
+PLAGIARISM_THRESHOLD = 0.3
+
+# E-mail
+# Messages are queued and sent by the send_queued_mail management command through MAIL_QUEUE_BACKEND
+EMAIL_BACKEND = 'site_app.mail.QueuedEmailBackend'
+MAIL_QUEUE_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+MAIL_QUEUE_BATCH_SIZE = 100
+MAIL_QUEUE_MAX_ATTEMPTS = 5
+# Delay before the first retry in seconds, doubled after every failed attempt
+MAIL_QUEUE_RETRY_DELAY = 60
+
+# Background jobs
+# Jobs are run by the run_jobs management command in JOB_QUEUE_WORKERS processes, None for one per CPU
+JOB_QUEUE_WORKERS = None
+JOB_QUEUE_BATCH_SIZE = 20
+JOB_QUEUE_MAX_ATTEMPTS = 5
+# Delay before the first retry in seconds, doubled after every failed attempt
+JOB_QUEUE_RETRY_DELAY = 30
+
+# Roster import
+# Largest roster imported through the administration site, larger ones are imported with the import_roster command
+ROSTER_IMPORT_MAX_ROWS = 500
+
+# Exports
+# Number of rows read by one query of the streamed exports of theses, reviews and defenses
+EXPORT_BATCH_SIZE = 2000
+
+# Request metrics
+# Every request is logged to the site_app.metrics logger. Histograms of the requests are served to administrators at
+# /metrics, every worker adds its measurements to the database every METRICS_FLUSH_INTERVAL seconds.
+METRICS_FLUSH_INTERVAL = 10
+# Upper bounds of the buckets of the time histograms in seconds
+METRICS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Profiling
+# Requests selected by the profiling rules of the administration site are sampled every PROFILING_INTERVAL seconds
+PROFILING_INTERVAL = 0.005
+
 # Logging in/out
 LOGIN_REDIRECT_URL = '/'
 LOGIN_URL = 'login'
@@ -128,3 +210,19 @@ LOGOUT_REDIRECT_URL = '/'
 PROJECT_ROOT_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), os.path.pardir))
 MEDIA_ROOT = os.path.join(PROJECT_ROOT_PATH, '')
 MEDIA_URL = '/files/'
+# Identical files are stored once, see site_app.storage
+DEFAULT_FILE_STORAGE = 'site_app.storage.ContentAddressedStorage'
+
+# Chunked uploads
+# Partial files are kept on the same filesystem as MEDIA_ROOT, so that completed uploads are moved, not copied.
+CHUNKED_UPLOAD_DIR = os.path.join(MEDIA_ROOT, 'partial')
+CHUNKED_UPLOAD_MAX_CHUNK_SIZE = 8 * 1024 * 1024
+# Largest file accepted by a chunked upload
+MAX_UPLOAD_SIZE = 200 * 1024 * 1024
+CHUNKED_UPLOAD_EXPIRY_HOURS = 24
+
+# Protected downloads
+# Set to 'nginx' (X-Accel-Redirect) or 'xsendfile' (X-Sendfile) to let the front-end server send the files.
+# With nginx, SENDFILE_URL_PREFIX has to be an internal location aliased to MEDIA_ROOT.
+SENDFILE_BACKEND = None
+SENDFILE_URL_PREFIX = '/protected/'
@@ -15,11 +15,10 @@ Including another URLconf
 """
 from django.conf.urls import url, include
 from django.contrib import admin
-from django.conf import settings
-from django.conf.urls.static import static
 
+# Uploaded files are not served from MEDIA_URL, they are sent by the protected download views of site_app
 urlpatterns = [
     url(r'^admin/', admin.site.urls),
     url(r'^', include('site_app.urls')),
-] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+]
 
@@ -0,0 +1 @@
+default_app_config = 'site_app.apps.SiteAppConfig'
@@ -1,22 +1,110 @@
-from django.contrib import admin
+from django.conf import settings
+from django.conf.urls import url
+from django.contrib import admin, messages
+from django.contrib.admin import helpers
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
-from site_app.models import User, Faculty, Topic, Thesis, Review, Defense
+from django.core.exceptions import PermissionDenied
+from django.db import connection
+from django.db.models import BooleanField
+from django.db.models.expressions import RawSQL
+from django.http import HttpResponse
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.html import format_html
+from site_app.models import User, Faculty, Topic, Thesis, Review, Defense, QueuedMail, Job, Statistic, ProfilingRule, \
+    RequestProfile
 from site_app import forms
+from site_app import assignment
+from site_app import exports
+from site_app import pagination
+from site_app import profiling
+from site_app import roster
+from site_app import scheduling
+from site_app import statistics
 
 
-class FacultyAdmin(admin.ModelAdmin):
+def exists_expression(outer_model, model, field_name):
+    """
+    Builds an expression checking whether any row of the model references the row of the outer model.
+
+    :param outer_model: (Model) Model of the annotated queryset
+    :param model: (Model) Model referencing the outer model
+    :param field_name: (string) Name of the foreign key of the model
+    :return: EXISTS subquery usable as a queryset annotation
+    :rtype: RawSQL
+    """
+    qn = connection.ops.quote_name
+    sql = 'EXISTS (SELECT 1 FROM {0} WHERE {0}.{1} = {2}.{3})'.format(
+        qn(model._meta.db_table), qn(model._meta.get_field(field_name).column),
+        qn(outer_model._meta.db_table), qn(outer_model._meta.pk.column))
+    return RawSQL(sql, (), output_field=BooleanField())
+
+
+def export_action(name, file_format):
+    """
+    Builds an admin action exporting the selected rows.
+
+    :param name: (string) Name of the export, a key of exports.EXPORTS
+    :param file_format: (string) Either 'csv' or 'xlsx'
+    :return: The action
+    :rtype: callable
+    """
+    def export(modeladmin, request, queryset):
+        try:
+            return exports.export_response(name, file_format, queryset)
+        except exports.ExportError as e:
+            modeladmin.message_user(request, str(e), messages.ERROR)
+
+    export.__name__ = 'export_{}'.format(file_format)
+    export.short_description = 'Export the selected {} as {}'.format(name, file_format.upper())
+    return export
+
+
+class DeadlineListFilter(admin.SimpleListFilter):
+    """
+    Filter of the review changelist selecting overdue reviews and reviews due this week.
+    """
+    title = 'deadline'
+    parameter_name = 'due'
+
+    def lookups(self, request, model_admin):
+        return (('overdue', 'Overdue'), ('week', 'Due this week'))
+
+    def queryset(self, request, queryset):
+        if self.value() == 'overdue':
+            return queryset.overdue()
+        if self.value() == 'week':
+            return queryset.due_within(7)
+        return queryset
+
+
+class AnnotatedChangeListAdmin(admin.ModelAdmin):
+    """
+    Base of the admin classes computing their columns with the changelist query. The changelists of large tables are
+    paginated using an estimated row count.
+    """
+    paginator = pagination.EstimatedCountPaginator
+    show_full_result_count = False
+
+
+class FacultyAdmin(AnnotatedChangeListAdmin):
     form = forms.FacultyChangeForm
     add_form = forms.FacultyCreationForm
     list_display = ('code', 'name')
 
 
-class TopicAdmin(admin.ModelAdmin):
+class TopicAdmin(AnnotatedChangeListAdmin):
     form = forms.TopicChangeForm
     add_form = forms.TopicCreationForm
-    list_display = ('name', 'student', 'supervisor', 'level', 'short_description', 'voted_for', 'available', 'checked')
+    list_display = ('name', 'student', 'supervisor', 'level', 'short_description', 'voted_for', 'available', 'checked',
+                    'similar_to')
+    list_select_related = ('student', 'supervisor', 'similar_to')
+    raw_id_fields = ('similar_to',)
 
 
-class UserAdmin(BaseUserAdmin):
+class UserAdmin(AnnotatedChangeListAdmin, BaseUserAdmin):
     # The forms to add and change user instances
     form = forms.UserChangeForm
     add_form = forms.UserCreationForm
@@ -27,6 +115,7 @@ class UserAdmin(BaseUserAdmin):
     list_display = ('email', 'first_name', 'last_name', 'index_number', 'degree',
                     'faculty', 'department', 'has_proposed_topic', 'is_admin')
     list_filter = ('is_admin',)
+    list_select_related = ('faculty',)
     fieldsets = (
         (None, {'fields': ('email', 'password')}),
         ('Personal info',
@@ -50,23 +139,226 @@ class UserAdmin(BaseUserAdmin):
     ordering = ('email', 'first_name', 'last_name')
     filter_horizontal = ()
 
+    def get_queryset(self, request):
+        return super(UserAdmin, self).get_queryset(request).annotate(
+            proposed_topic=exists_expression(User, Topic, 'student'))
+
+    def has_proposed_topic(self, obj):
+        return obj.proposed_topic
+    has_proposed_topic.boolean = True
+    has_proposed_topic.admin_order_field = 'proposed_topic'
+
+    change_list_template = 'admin/site_app/user/change_list.html'
+
+    def get_urls(self):
+        return [
+            url(r'^import/$', self.admin_site.admin_view(self.import_roster), name='site_app_user_import'),
+        ] + super(UserAdmin, self).get_urls()
+
+    def import_roster(self, request):
+        """
+        View importing a roster of users uploaded through the administration site.
 
-class ThesisAdmin(admin.ModelAdmin):
+        :param request: (HttpRequest) The request performed by user
+        :return: The import form or a redirect to the user list after the import
+        :rtype: HttpResponse
+        """
+        if not self.has_add_permission(request) or not self.has_change_permission(request):
+            raise PermissionDenied
+        form = forms.RosterImportForm(request.POST or None, request.FILES or None)
+        if request.method == 'POST' and form.is_valid():
+            upload = form.cleaned_data['roster']
+            groups = [group.name for group in form.cleaned_data['groups']]
+            try:
+                # Passwords are hashed in this process, the size of the roster bounds the time of the request
+                result = roster.import_roster(upload.file, upload.name, workers=0, groups=groups,
+                                              max_rows=settings.ROSTER_IMPORT_MAX_ROWS)
+            except roster.RosterError as e:
+                form.add_error('roster', str(e))
+            else:
+                for line, message in result.errors[:20]:
+                    self.message_user(request, 'Line {}: {}'.format(line, message), messages.WARNING)
+                self.message_user(request, str(result))
+                return redirect('admin:site_app_user_changelist')
+        context = dict(self.admin_site.each_context(request), opts=self.model._meta, form=form,
+                       title='Import users')
+        return TemplateResponse(request, 'admin/site_app/user/import_roster.html', context)
+
+
+class ThesisAdmin(AnnotatedChangeListAdmin):
     form = forms.ThesisChangeForm
     add_form = forms.ThesisChangeForm
     list_display = ('supervisor', 'student', 'topic', 'finished', 'reviewed')
+    list_select_related = ('supervisor', 'student', 'topic')
+
+    def get_queryset(self, request):
+        return super(ThesisAdmin, self).get_queryset(request).annotate(
+            has_review=exists_expression(Thesis, Review, 'thesis'))
+
+    def reviewed(self, obj):
+        return obj.has_review
+    reviewed.boolean = True
+    reviewed.admin_order_field = 'has_review'
+
+    actions = ['assign_reviewers', export_action('theses', 'csv'), export_action('theses', 'xlsx')]
 
+    def assign_reviewers(self, request, queryset):
+        """
+        Action assigning reviewers to the selected theses. The computed assignment is shown for confirmation first.
+        """
+        try:
+            plan = assignment.plan_assignment(queryset)
+        except assignment.AssignmentError as e:
+            self.message_user(request, str(e), messages.ERROR)
+            return None
+        if request.POST.get('apply'):
+            reviews = assignment.apply_assignment(plan)
+            self.message_user(request, 'Created {} reviews'.format(len(reviews)))
+            if plan.unassigned:
+                self.message_user(request, '{} theses have no eligible reviewer'.format(len(plan.unassigned)),
+                                  messages.WARNING)
+            return None
+        context = dict(self.admin_site.each_context(request), opts=self.model._meta, title='Assign reviewers',
+                       lines=assignment.describe(plan), queryset=queryset, plan=plan,
+                       action_checkbox_name=helpers.ACTION_CHECKBOX_NAME)
+        return TemplateResponse(request, 'admin/site_app/thesis/assign_reviewers.html', context)
+    assign_reviewers.short_description = 'Assign reviewers to the selected theses'
 
-class ReviewAdmin(admin.ModelAdmin):
+
+class ReviewAdmin(AnnotatedChangeListAdmin):
     form = forms.ReviewChangeForm
     add_form = forms.ReviewCreationForm
-    list_display = ('author', 'thesis', 'file', 'finished_date', 'deadline')
+    list_display = ('author', 'thesis', 'file_link', 'finished_date', 'deadline')
+    list_select_related = ('author', 'thesis__student', 'thesis__topic')
+    list_filter = (DeadlineListFilter,)
+    actions = [export_action('reviews', 'csv'), export_action('reviews', 'xlsx')]
+
+    def file_link(self, obj):
+        # Uploaded files are sent by the protected download view
+        if not obj.file:
+            return ''
+        return format_html('<a href="{}">{}</a>', reverse('review_file', args=[obj.pk]), obj.file.name)
+    file_link.short_description = 'file'
+    file_link.admin_order_field = 'file'
 
 
-class DefenseAdmin(admin.ModelAdmin):
+class DefenseAdmin(AnnotatedChangeListAdmin):
     form = forms.DefenseChangeForm
     add_form = forms.DefenseCreationForm
-    list_display = ('thesis', 'date', 'successful', 'second_defense')
+    list_display = ('thesis', 'date', 'room', 'scheduled', 'successful', 'second_defense')
+    list_filter = ('scheduled', 'successful')
+    list_select_related = ('thesis__student', 'thesis__topic')
+    actions = ['export_schedule', export_action('defenses', 'csv'), export_action('defenses', 'xlsx')]
+
+    def export_schedule(self, request, queryset):
+        """
+        Action exporting the schedule of the selected defenses as CSV.
+        """
+        response = HttpResponse(content_type='text/csv')
+        response['Content-Disposition'] = 'attachment; filename="defenses.csv"'
+        scheduling.export_csv(queryset, response)
+        return response
+    export_schedule.short_description = 'Export the schedule of the selected defenses'
+
+
+class QueuedMailAdmin(AnnotatedChangeListAdmin):
+    list_display = ('subject', 'to', 'status', 'attempts', 'next_attempt', 'sent')
+    list_filter = ('status',)
+    readonly_fields = ('claim', 'last_error', 'created', 'sent')
+    actions = ['retry']
+
+    def retry(self, request, queryset):
+        updated = queryset.exclude(status=QueuedMail.STATUSES.sent).update(
+            status=QueuedMail.STATUSES.queued, attempts=0, next_attempt=timezone.now(), claim='')
+        self.message_user(request, '{} messages queued again'.format(updated))
+    retry.short_description = 'Queue the selected messages again'
+
+
+class JobAdmin(AnnotatedChangeListAdmin):
+    list_display = ('kind', 'arguments', 'priority', 'status', 'attempts', 'next_attempt', 'finished')
+    list_filter = ('status', 'kind')
+    readonly_fields = ('claim', 'last_error', 'created', 'finished')
+    actions = ['retry']
+
+    def retry(self, request, queryset):
+        updated = queryset.exclude(status=Job.STATUSES.done).update(
+            status=Job.STATUSES.queued, attempts=0, next_attempt=timezone.now(), claim='')
+        self.message_user(request, '{} jobs queued again'.format(updated))
+    retry.short_description = 'Queue the selected jobs again'
+
+
+class StatisticAdmin(admin.ModelAdmin):
+    """
+    Statistics dashboard, shown instead of the changelist of the counters.
+    """
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+    def changelist_view(self, request, extra_context=None):
+        """
+        View showing the counters summed in total and by faculty, level and supervisor. A POST request recounts them.
+
+        :param request: (HttpRequest) The request performed by user
+        :return: The dashboard or a redirect to it after the recount
+        :rtype: HttpResponse
+        """
+        if not self.has_change_permission(request):
+            raise PermissionDenied
+        if request.method == 'POST':
+            self.message_user(request, 'Stored {} counters'.format(statistics.rebuild()))
+            return redirect('admin:site_app_statistic_changelist')
+        form = forms.StatisticsFilterForm(request.GET or None)
+        level = faculty = None
+        if form.is_valid():
+            level, faculty = form.cleaned_data['level'], form.cleaned_data['faculty']
+        context = dict(self.admin_site.each_context(request), opts=self.model._meta, form=form, title='Statistics',
+                       metrics=[label for metric, label in Statistic.METRICS],
+                       summary=statistics.dashboard(level=level, faculty=faculty.pk if faculty else None))
+        context.update(extra_context or {})
+        return TemplateResponse(request, 'admin/site_app/statistic/dashboard.html', context)
+
+
+class ProfilingRuleAdmin(AnnotatedChangeListAdmin):
+    list_display = ('__str__', 'user', 'path_pattern', 'percentage', 'enabled', 'expires')
+    list_editable = ('enabled',)
+    list_select_related = ('user',)
+    raw_id_fields = ('user',)
+
+
+class RequestProfileAdmin(AnnotatedChangeListAdmin):
+    """
+    Profiles of live requests, each shown as a flame graph.
+    """
+    list_display = ('created', 'method', 'path', 'view', 'user', 'status', 'duration', 'samples')
+    list_select_related = ('user',)
+    fields = ('created', 'rule', 'user', 'method', 'path', 'view', 'status', 'duration', 'samples')
+    readonly_fields = fields
+    change_form_template = 'admin/site_app/requestprofile/change_form.html'
+    actions = ['download_stacks']
+
+    def has_add_permission(self, request):
+        return False
+
+    def change_view(self, request, object_id, form_url='', extra_context=None):
+        obj = self.get_object(request, object_id)
+        extra_context = dict(extra_context or {})
+        if obj is not None:
+            extra_context['flame_graph'] = profiling.flame_graph(profiling.parse_stacks(obj.stacks))
+        return super(RequestProfileAdmin, self).change_view(request, object_id, form_url, extra_context)
+
+    def download_stacks(self, request, queryset):
+        """
+        Action downloading the summed stacks of the selected profiles in the collapsed format.
+        """
+        stacks = profiling.merge_profiles(queryset.select_related(None).only('stacks'))
+        response = HttpResponse(profiling.format_stacks(stacks), content_type='text/plain; charset=utf-8')
+        response['Content-Disposition'] = 'attachment; filename="profiles.folded"'
+        return response
+    download_stacks.short_description = 'Download the stacks of the selected profiles'
 
 
 # Registering models
@@ -76,3 +368,8 @@ admin.site.register(Topic, TopicAdmin)
 admin.site.register(Thesis, ThesisAdmin)
 admin.site.register(Review, ReviewAdmin)
 admin.site.register(Defense, DefenseAdmin)
+admin.site.register(QueuedMail, QueuedMailAdmin)
+admin.site.register(Job, JobAdmin)
+admin.site.register(Statistic, StatisticAdmin)
+admin.site.register(ProfilingRule, ProfilingRuleAdmin)
+admin.site.register(RequestProfile, RequestProfileAdmin)
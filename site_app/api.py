@@ -0,0 +1,567 @@
+"""
+JSON API over topics, theses, reviews and defenses. Every resource is served at /api/<name>/ and its objects at
+/api/<name>/<id>:
+
+* GET of a resource returns a page of objects, {"results": [...], "next": URL of the next page or null}. The page is
+  selected by the cursor and limit parameters, the order by the sort parameter and the fields of the objects by the
+  comma-separated fields parameter.
+* POST of a resource creates an object, or several objects if the body is a list, in a single transaction.
+* PATCH of a resource updates several objects, each identified by its id, in a single transaction. PATCH of an object
+  updates that object.
+
+Users are authenticated by their session, unsafe requests need the CSRF token in the X-CSRFToken header. Access is
+checked by the same role rules as the pages: a resource requires the role of the pages showing it and users only see
+the objects those pages show them. Administrators see and may change everything.
+
+Pages are read with keyset pagination as a single query of the selected columns, joined with the related tables the
+fields need, so every page costs the same number of queries. Referenced objects of bulk writes are checked with one
+query per reference field.
+"""
+import json
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Q
+from django.http import JsonResponse
+from django.urls import reverse
+from django.utils.decorators import method_decorator
+from django.views.decorators.csrf import ensure_csrf_cookie
+from django.views.generic import View
+
+from . import models
+from . import pagination
+from . import roles
+from . import similarity
+
+
+class ApiError(Exception):
+    """
+    Error of an API request. Attributes:
+    status, details
+    """
+
+    def __init__(self, message, status=400, details=None):
+        super(ApiError, self).__init__(message)
+        self.status = status
+        self.details = details
+
+
+def page_size(request):
+    """
+    Gets the number of objects on a page, requested by the limit parameter or configured by the API_PAGE_SIZE setting,
+    at most API_MAX_PAGE_SIZE.
+
+    :param request: (HttpRequest) The request performed by user
+    :raises: ApiError
+    :return: Number of objects
+    :rtype: int
+    """
+    maximum = getattr(settings, 'API_MAX_PAGE_SIZE', 500)
+    try:
+        limit = int(request.GET.get('limit', getattr(settings, 'API_PAGE_SIZE', 50)))
+    except ValueError:
+        raise ApiError('Invalid limit')
+    if limit < 1:
+        raise ApiError('Invalid limit')
+    return min(limit, maximum)
+
+
+def _full_name(first_name, last_name):
+    return '{} {}'.format(first_name or '', last_name or '').strip()
+
+
+class Resource(object):
+    """
+    Model exposed by the API. Attributes:
+    model, role, fields, computed, orderings, writable
+    fields maps the name of a field in the API to the lookup it is read with, computed maps the name of a derived field
+    to the lookups it is computed from and the function computing it. writable lists the fields administrators may
+    set, references are set by the IDs of the referenced objects.
+    """
+
+    model = None
+    role = None
+    fields = {'id': 'id'}
+    computed = {}
+    orderings = {'id': ('id',)}
+    writable = ()
+
+    def get_queryset(self, user):
+        """
+        Gets the objects user may see.
+
+        :param user: (User) The requesting user
+        :return: The objects
+        :rtype: QuerySet
+        """
+        queryset = self.model._default_manager.all()
+        return queryset if user.is_admin else self.restrict(queryset, user)
+
+    def restrict(self, queryset, user):
+        """
+        Restricts the objects to those shown to a user who is not an administrator.
+
+        :param queryset: (QuerySet) All objects
+        :param user: (User) The requesting user
+        :return: The objects shown to user
+        :rtype: QuerySet
+        """
+        return queryset.none()
+
+    def writable_fields(self, user, creating):
+        """
+        Gets the fields user may set.
+
+        :param user: (User) The requesting user
+        :param creating: (bool) Indicator whether an object is created or updated
+        :return: Names of the fields
+        :rtype: tuple
+        """
+        return self.writable if user.is_admin else ()
+
+    def prepare(self, instance, user, creating):
+        """
+        Sets the fields user can not choose before an object is validated and saved.
+
+        :param instance: (Model) The object
+        :param user: (User) The requesting user
+        :param creating: (bool) Indicator whether the object is created or updated
+        """
+
+    def select(self, names):
+        """
+        Gets the lookups a selection of fields is read with.
+
+        :param names: (list) Names of the fields, None for all
+        :raises: ApiError
+        :return: The lookups
+        :rtype: list
+        """
+        names = list(self.fields) + list(self.computed) if names is None else names
+        unknown = [name for name in names if name not in self.fields and name not in self.computed]
+        if unknown:
+            raise ApiError('Unknown fields: {}'.format(', '.join(unknown)))
+        lookups = []
+        for name in names:
+            for lookup in (self.fields[name],) if name in self.fields else self.computed[name][0]:
+                if lookup not in lookups:
+                    lookups.append(lookup)
+        return lookups
+
+    def serialize(self, row, names):
+        """
+        Converts a row read with the lookups of the fields into the object returned by the API.
+
+        :param row: (dict) The row
+        :param names: (list) Names of the fields
+        :return: The object
+        :rtype: dict
+        """
+        data = {}
+        for name in names:
+            if name in self.fields:
+                data[name] = row[self.fields[name]]
+            else:
+                lookups, compute = self.computed[name]
+                data[name] = compute(*[row[lookup] for lookup in lookups])
+        return data
+
+    def read(self, queryset, names):
+        """
+        Reads objects with a single query.
+
+        :param queryset: (QuerySet) The objects
+        :param names: (list) Names of the fields, None for all
+        :return: The objects returned by the API
+        :rtype: list
+        """
+        names = list(self.fields) + list(self.computed) if names is None else names
+        return [self.serialize(row, names) for row in queryset.values(*self.select(names))]
+
+
+class TopicResource(Resource):
+    """
+    Topics, shown to students. Students see the available topics and their own proposals and may propose topics.
+    """
+
+    model = models.Topic
+    role = 'Student'
+    fields = {
+        'id': 'id', 'name': 'name', 'short_description': 'short_description', 'level': 'level',
+        'available': 'available', 'checked': 'checked', 'voted_for': 'voted_for', 'supervisor': 'supervisor',
+        'student': 'student', 'similar_to': 'similar_to',
+    }
+    computed = {
+        'supervisor_name': (('supervisor__first_name', 'supervisor__last_name'), _full_name),
+    }
+    orderings = {'id': ('id',), 'name': ('name', 'id')}
+    writable = ('name', 'short_description', 'level', 'available', 'checked', 'voted_for', 'supervisor', 'student')
+    proposal_fields = ('name', 'short_description', 'supervisor')
+
+    def restrict(self, queryset, user):
+        return queryset.filter(Q(available=True) | Q(student=user))
+
+    def writable_fields(self, user, creating):
+        if user.is_admin:
+            return self.writable
+        return self.proposal_fields if creating else ()
+
+    def prepare(self, instance, user, creating):
+        if user.is_admin or not creating:
+            return
+        # Proposals are made the same way as in the topic list
+        instance.student_id, instance.level = user.id, user.degree
+        if instance.supervisor_id not in dict(roles.get_supervisor_choices()):
+            raise ValidationError({'supervisor': ['Select a supervisor.']})
+        duplicates = similarity.find_duplicates(instance.name, instance.short_description, limit=1)
+        instance.similar_to = duplicates[0][0] if duplicates else None
+
+
+class ThesisResource(Resource):
+    """
+    Theses, shown to reviewers. Reviewers see the theses they review, supervise or wrote.
+    """
+
+    model = models.Thesis
+    role = 'Reviewer'
+    fields = {
+        'id': 'id', 'topic': 'topic', 'student': 'student', 'supervisor': 'supervisor', 'finished': 'finished',
+        'finished_date': 'finished_date',
+    }
+    computed = {
+        'topic_name': (('topic__name',), lambda name: name),
+        'student_name': (('student__first_name', 'student__last_name'), _full_name),
+        'file_url': (('id', 'file'), lambda pk, file: reverse('thesis_file', args=[pk]) if file else None),
+    }
+    writable = ('topic', 'student', 'supervisor', 'finished', 'finished_date')
+
+    def restrict(self, queryset, user):
+        reviewed = models.Review.objects.filter(author=user).values('thesis_id')
+        return queryset.filter(Q(student=user) | Q(supervisor=user) | Q(id__in=reviewed))
+
+
+class ReviewResource(Resource):
+    """
+    Reviews, shown to reviewers. Reviewers see their own reviews.
+    """
+
+    model = models.Review
+    role = 'Reviewer'
+    fields = {
+        'id': 'id', 'thesis': 'thesis', 'author': 'author', 'finished_date': 'finished_date', 'deadline': 'deadline',
+    }
+    computed = {
+        'finished': (('file',), bool),
+        'file_url': (('id', 'file'), lambda pk, file: reverse('review_file', args=[pk]) if file else None),
+    }
+    writable = ('thesis', 'author', 'finished_date')
+
+    def restrict(self, queryset, user):
+        return queryset.filter(author=user)
+
+
+class DefenseResource(Resource):
+    """
+    Defenses, shown to reviewers. Reviewers see the defenses of the theses they see.
+    """
+
+    model = models.Defense
+    role = 'Reviewer'
+    fields = {
+        'id': 'id', 'thesis': 'thesis', 'date': 'date', 'room': 'room', 'successful': 'successful',
+        'second_defense': 'second_defense',
+    }
+    writable = ('thesis', 'date', 'room', 'successful', 'second_defense')
+
+    def restrict(self, queryset, user):
+        return queryset.filter(thesis__in=RESOURCES['theses'].restrict(models.Thesis.objects.all(), user))
+
+
+RESOURCES = {
+    'topics': TopicResource(),
+    'theses': ThesisResource(),
+    'reviews': ReviewResource(),
+    'defenses': DefenseResource(),
+}
+
+
+def _is_id(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _references(resource, items, writable):
+    # One query per reference field checks that all referenced objects exist
+    missing = {}
+    for name in writable:
+        field = resource.model._meta.get_field(name)
+        if not field.is_relation:
+            continue
+        ids = {item[name] for item in items if _is_id(item.get(name))}
+        found = set(field.related_model._default_manager.filter(pk__in=ids).values_list('pk', flat=True))
+        missing[name] = ids - found
+    return missing
+
+
+def write(resource, user, items, instances=None):
+    """
+    Validates and saves objects in a single transaction. Nothing is saved if any of the objects is invalid. Objects
+    are saved one by one, so that the signal receivers keeping the derived data up to date run.
+
+    :param resource: (Resource) The resource
+    :param user: (User) The requesting user
+    :param items: (list) Values of the fields of the objects
+    :param instances: (list) Objects updated by the items, None to create new objects
+    :raises: ApiError
+    :return: IDs of the saved objects
+    :rtype: list
+    """
+    creating = instances is None
+    writable = resource.writable_fields(user, creating)
+    if not writable:
+        raise ApiError('You can not {} {}'.format('create' if creating else 'change',
+                                                  resource.model._meta.verbose_name_plural), status=403)
+    missing = _references(resource, items, writable)
+    errors, saved = {}, []
+    for index, item in enumerate(items):
+        instance = resource.model() if creating else instances[index]
+        item_errors = {name: ['This field can not be set.'] for name in item if name not in writable and name != 'id'}
+        for name in writable:
+            if name not in item:
+                continue
+            field = resource.model._meta.get_field(name)
+            if field.is_relation:
+                if item[name] is not None and not _is_id(item[name]):
+                    item_errors[name] = ['Expected the ID of an object.']
+                elif item[name] in missing[name]:
+                    item_errors[name] = ['Object {} does not exist.'.format(item[name])]
+                else:
+                    setattr(instance, field.attname, item[name])
+            else:
+                setattr(instance, field.attname, item[name])
+        exclude = [field.name for field in resource.model._meta.fields
+                   if field.is_relation or (not creating and field.name not in item)]
+        try:
+            # The values are converted to the types of the fields before prepare uses them
+            instance.clean_fields(exclude=exclude)
+            resource.prepare(instance, user, creating)
+            instance.full_clean(exclude=exclude, validate_unique=False)
+            if creating:
+                for field in resource.model._meta.fields:
+                    if field.is_relation and not field.null and getattr(instance, field.attname) is None:
+                        raise ValidationError({field.name: ['This field is required.']})
+        except ValidationError as e:
+            for name, messages in e.message_dict.items():
+                item_errors.setdefault(name, []).extend(messages)
+        if item_errors:
+            errors[index] = item_errors
+        saved.append(instance)
+    if errors:
+        raise ApiError('Invalid objects', details=errors)
+    with transaction.atomic():
+        for instance, item in zip(saved, items):
+            instance.save()
+    return [instance.pk for instance in saved]
+
+
+def _load_body(request):
+    try:
+        return json.loads(request.body.decode('utf-8'))
+    except (ValueError, UnicodeError):
+        raise ApiError('The body is not valid JSON')
+
+
+def _bulk_size(items):
+    if len(items) > getattr(settings, 'API_MAX_BULK_SIZE', 500):
+        raise ApiError('Too many objects')
+    if not items or not all(isinstance(item, dict) for item in items):
+        raise ApiError('Expected an object or a list of objects')
+    return items
+
+
+class ResourceMixin(object):
+    """
+    Mixin for API views checking the role of the user and turning API errors into JSON responses.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        """
+        Checks that user is logged in and has the role the resource requires, and handles the request.
+
+        :param request: (HttpRequest) The request performed by user
+        :return: The JSON response
+
+        :rtype JsonResponse
+
+        """
+        self.resource = RESOURCES[kwargs.pop('resource')]
+        if not request.user.is_authenticated:
+            return JsonResponse({'error': 'Authentication required'}, status=401)
+        if not roles.has_role(request.user, self.resource.role):
+            return JsonResponse({'error': 'You can not access this resource'}, status=403)
+        try:
+            return super(ResourceMixin, self).dispatch(request, *args, **kwargs)
+        except ApiError as e:
+            content = {'error': str(e)}
+            if e.details is not None:
+                content['errors'] = e.details
+            return JsonResponse(content, status=e.status)
+
+    def respond(self, data, status=200):
+        """
+        Builds a JSON response, encoding dates and times in ISO 8601.
+
+        :param data: The content of the response
+        :param status: (int) The status code
+        :return: The response
+        :rtype: JsonResponse
+        """
+        return JsonResponse(data, status=status, safe=False, encoder=DjangoJSONEncoder)
+
+    def get_fields(self):
+        """
+        Gets the fields selected by the fields parameter.
+
+        :return: Names of the fields, None for all
+        :rtype: list
+        """
+        fields = self.request.GET.get('fields')
+        return [name for name in fields.split(',') if name] if fields else None
+
+
+@method_decorator(ensure_csrf_cookie, name='dispatch')
+class ResourceListView(ResourceMixin, View):
+    """
+    View class responsible for listing, creating and bulk updating the objects of an API resource.
+
+    """
+
+    def get(self, request):
+        """
+        Handles the get request of a page of objects
+
+        :param request: (HttpRequest) The request performed by user
+        :return: The response containing the objects and the URL of the next page
+
+        :rtype JsonResponse
+
+        """
+        resource, names = self.resource, self.get_fields()
+        sort = request.GET.get('sort', 'id')
+        prefix, column = ('-', sort[1:]) if sort.startswith('-') else ('', sort)
+        if column not in resource.orderings:
+            raise ApiError('Invalid sort')
+        ordering = [prefix + field for field in resource.orderings[column]]
+        # The ordering fields are read besides the selected ones, they make the cursor of the next page
+        select = resource.select(names)
+        queryset = resource.get_queryset(request.user).values(*(select + [field for field in resource.orderings[column]
+                                                                          if field not in select]))
+        try:
+            page = pagination.KeysetPage(queryset, ordering, request.GET.get('cursor'), page_size(request))
+        except ValueError:
+            raise ApiError('Invalid cursor')
+        names = names or list(resource.fields) + list(resource.computed)
+        next_url = None
+        if page.has_next:
+            query = request.GET.copy()
+            query['cursor'] = page.next_cursor
+            next_url = request.path + '?' + query.urlencode()
+        return self.respond({'results': [resource.serialize(row, names) for row in page], 'next': next_url})
+
+    def post(self, request):
+        """
+        Handles the post request creating one or several objects
+
+        :param request: (HttpRequest) The request performed by user
+        :return: The response containing the created objects
+
+        :rtype JsonResponse
+
+        """
+        body = _load_body(request)
+        items = _bulk_size(body if isinstance(body, list) else [body])
+        ids = write(self.resource, request.user, items)
+        objects = self.resource.read(self.resource.model._default_manager.filter(pk__in=ids).order_by('id'),
+                                     self.get_fields())
+        return self.respond(objects if isinstance(body, list) else objects[0], status=201)
+
+    def patch(self, request):
+        """
+        Handles the patch request updating several objects, each identified by its id
+
+        :param request: (HttpRequest) The request performed by user
+        :return: The response containing the updated objects
+
+        :rtype JsonResponse
+
+        """
+        items = _load_body(request)
+        items = _bulk_size(items if isinstance(items, list) else [])
+        ids = [item.get('id') for item in items]
+        if any(not isinstance(pk, int) for pk in ids) or len(set(ids)) != len(ids):
+            raise ApiError('Every object needs a distinct id')
+        instances = self.resource.get_queryset(request.user).in_bulk(ids)
+        unknown = [pk for pk in ids if pk not in instances]
+        if unknown:
+            raise ApiError('No such objects: {}'.format(', '.join(map(str, unknown))), status=404)
+        write(self.resource, request.user, items, [instances[pk] for pk in ids])
+        return self.respond(self.resource.read(self.resource.model._default_manager.filter(pk__in=ids).order_by('id'),
+                                               self.get_fields()))
+
+
+class ResourceDetailView(ResourceMixin, View):
+    """
+    View class responsible for reading and updating an object of an API resource.
+
+    """
+
+    def get_object(self, pk):
+        """
+        Gets the object if user may see it.
+
+        :param pk: (string) ID of the object
+        :raises: ApiError
+        :return: The object
+        :rtype: Model
+        """
+        try:
+            return self.resource.get_queryset(self.request.user).get(pk=pk)
+        except self.resource.model.DoesNotExist:
+            raise ApiError('No such object', status=404)
+
+    def get(self, request, pk):
+        """
+        Handles the get request of an object
+
+        :param request: (HttpRequest) The request performed by user
+        :param pk: (string) ID of the object
+        :return: The response containing the object
+
+        :rtype JsonResponse
+
+        """
+        objects = self.resource.read(self.resource.get_queryset(request.user).filter(pk=pk), self.get_fields())
+        if not objects:
+            raise ApiError('No such object', status=404)
+        return self.respond(objects[0])
+
+    def patch(self, request, pk):
+        """
+        Handles the patch request updating an object
+
+        :param request: (HttpRequest) The request performed by user
+        :param pk: (string) ID of the object
+        :return: The response containing the updated object
+
+        :rtype JsonResponse
+
+        """
+        item = _load_body(request)
+        if not isinstance(item, dict):
+            raise ApiError('Expected an object')
+        item.pop('id', None)
+        instance = self.get_object(pk)
+        write(self.resource, request.user, [item], [instance])
+        return self.respond(self.resource.read(self.resource.model._default_manager.filter(pk=instance.pk),
+                                               self.get_fields())[0])
@@ -1 +1,11 @@
-from django.apps import AppConfigclass SiteAppConfig(AppConfig):    name = 'site_app'
\ No newline at end of file
+from django.apps import AppConfig
+from django.core import checks
+
+
+class SiteAppConfig(AppConfig):
+    name = 'site_app'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from . import caching
+        checks.register(caching.check_shared_cache, checks.Tags.caches)
@@ -0,0 +1,240 @@
+"""
+Assignment of reviewers to finished theses that have no review yet. The assignment is computed as a min-cost
+bipartite matching between theses and reviewer slots: every reviewer gets a few slots, and each further slot of a
+reviewer costs more than the previous one, counting the reviews the reviewer has pending already. Minimising the total
+cost therefore balances the load of the reviewers. A reviewer may never review a thesis they supervise or wrote, and
+reviewers from the faculty of the student are preferred.
+
+The cost matrix is built with NumPy and solved by SciPy's linear_sum_assignment, both are listed in the requirements.
+Without them a pure Python implementation of the Hungarian algorithm is used. It takes O(n^2 m) time for n theses and
+m reviewer slots, so it refuses runs of more than FALLBACK_MAX_THESES theses, which it solves within a few seconds.
+"""
+import math
+
+from django.db import transaction
+from django.db.models import Count
+
+from .models import User, Thesis, Review
+from . import caching
+from . import statistics
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+try:
+    from scipy.optimize import linear_sum_assignment
+except ImportError:  # pragma: no cover
+    linear_sum_assignment = None
+
+REVIEWER_GROUP = 'Reviewer'
+# Cost of every review a reviewer has, pending or newly assigned
+LOAD_COST = 10
+# Cost of a reviewer from another faculty than the student
+FACULTY_MISMATCH_COST = 5
+# Cost of forbidden pairs, pairs at this cost are never assigned
+FORBIDDEN_COST = 10 ** 6
+# Largest number of theses assigned in one run without SciPy
+FALLBACK_MAX_THESES = 300
+
+
+class AssignmentError(Exception):
+    """
+    Error preventing the computation of an assignment.
+    """
+
+
+class AssignmentPlan(object):
+    """
+    Computed assignment of reviewers to theses. Attributes:
+    pairs (list of thesis and reviewer ID pairs), unassigned (IDs of theses no reviewer could take), loads (numbers of
+    pending reviews of the reviewers after the assignment), deadlines (deadlines of the reviews of the theses)
+    """
+
+    def __init__(self, pairs, unassigned, loads, deadlines):
+        self.pairs = pairs
+        self.unassigned = unassigned
+        self.loads = loads
+        self.deadlines = deadlines
+
+    def __len__(self):
+        return len(self.pairs)
+
+
+def hungarian(costs):
+    """
+    Solves the rectangular assignment problem with the Hungarian algorithm in O(n^2 m) time.
+
+    :param costs: (list) Rows of the cost matrix, there may be no more rows than columns
+    :return: Column assigned to every row
+    :rtype: list
+    """
+    n, m = len(costs), len(costs[0]) if costs else 0
+    inf = float('inf')
+    u, v = [0] * (n + 1), [0] * (m + 1)
+    # p[j] is the row matched to column j, way[j] the previous column on the augmenting path
+    p, way = [0] * (m + 1), [0] * (m + 1)
+    for i in range(1, n + 1):
+        p[0], j0 = i, 0
+        minv, used = [inf] * (m + 1), [False] * (m + 1)
+        while True:
+            used[j0] = True
+            i0, delta, j1 = p[j0], inf, 0
+            row, ui0 = costs[i0 - 1], u[i0]
+            for j in range(1, m + 1):
+                if not used[j]:
+                    current = row[j - 1] - ui0 - v[j]
+                    if current < minv[j]:
+                        minv[j], way[j] = current, j0
+                    if minv[j] < delta:
+                        delta, j1 = minv[j], j
+            for j in range(m + 1):
+                if used[j]:
+                    u[p[j]] += delta
+                    v[j] -= delta
+                else:
+                    minv[j] -= delta
+            j0 = j1
+            if p[j0] == 0:
+                break
+        while j0:
+            j1 = way[j0]
+            p[j0] = p[j1]
+            j0 = j1
+    result = [None] * n
+    for j in range(1, m + 1):
+        if p[j]:
+            result[p[j] - 1] = j - 1
+    return result
+
+
+def build_costs(theses, reviewers, loads, slots):
+    """
+    Builds the cost matrix of assigning theses to reviewer slots. Column r * slots + k is the k-th new slot of
+    reviewer r.
+
+    :param theses: (list) Tuples of supervisor ID, student ID and student faculty ID of the theses
+    :param reviewers: (list) Pairs of ID and faculty ID of the reviewers
+    :param loads: (list) Numbers of pending reviews of the reviewers
+    :param slots: (int) Number of new slots of every reviewer
+    :return: The cost matrix
+    :rtype: numpy.ndarray or list
+    """
+    if numpy is not None:
+        supervisors, students, faculties = (numpy.array([thesis[i] or -1 for thesis in theses]).reshape(-1, 1)
+                                            for i in range(3))
+        reviewer_ids = numpy.array([reviewer_id for reviewer_id, faculty_id in reviewers])
+        reviewer_faculties = numpy.array([faculty_id or -2 for reviewer_id, faculty_id in reviewers])
+        base = numpy.where(faculties == reviewer_faculties, 0, FACULTY_MISMATCH_COST)
+        base[(supervisors == reviewer_ids) | (students == reviewer_ids)] = FORBIDDEN_COST
+        slot_costs = LOAD_COST * (numpy.repeat(numpy.array(loads), slots) + numpy.tile(numpy.arange(slots),
+                                                                                        len(reviewers)))
+        return numpy.repeat(base, slots, axis=1) + slot_costs
+
+    columns = [(reviewer, LOAD_COST * (load + k)) for reviewer, load in zip(reviewers, loads) for k in range(slots)]
+    costs = []
+    for supervisor_id, student_id, faculty_id in theses:
+        row = []
+        for (reviewer_id, reviewer_faculty_id), slot_cost in columns:
+            if reviewer_id in (supervisor_id, student_id):
+                row.append(FORBIDDEN_COST + slot_cost)
+            elif faculty_id is not None and faculty_id == reviewer_faculty_id:
+                row.append(slot_cost)
+            else:
+                row.append(FACULTY_MISMATCH_COST + slot_cost)
+        costs.append(row)
+    return costs
+
+
+def solve(costs):
+    """
+    Finds the assignment of rows to columns of minimal total cost.
+
+    :param costs: (numpy.ndarray or list) The cost matrix
+    :raises: AssignmentError
+    :return: Pairs of row and column
+    :rtype: list
+    """
+    if linear_sum_assignment is not None:
+        rows, columns = linear_sum_assignment(costs)
+        return list(zip(rows.tolist(), columns.tolist()))
+    if len(costs) > FALLBACK_MAX_THESES:
+        raise AssignmentError('Assigning more than {} theses at once requires SciPy'.format(FALLBACK_MAX_THESES))
+    if numpy is not None:
+        costs = costs.tolist()
+    return list(enumerate(hungarian(costs)))
+
+
+def plan_assignment(theses=None, reviewers=None):
+    """
+    Computes a balanced assignment of one reviewer to every finished thesis without a review.
+
+    :param theses: (QuerySet) Theses to assign, defaults to all finished theses without a review
+    :param reviewers: (QuerySet) Eligible reviewers, defaults to all members of the Reviewer group
+    :return: The assignment
+    :rtype: AssignmentPlan
+    """
+    if theses is None:
+        theses = Thesis.objects.all()
+    if reviewers is None:
+        reviewers = User.objects.filter(groups__name=REVIEWER_GROUP)
+    thesis_rows = list(theses.filter(finished=True, reviewed_thesis__isnull=True).order_by('id').values_list(
+        'id', 'supervisor_id', 'student_id', 'student__faculty_id', 'finished_date'))
+    reviewer_rows = list(reviewers.order_by('id').values_list('id', 'faculty_id').distinct())
+    pending = dict(Review.objects.pending().filter(author__in=[reviewer_id for reviewer_id, _ in reviewer_rows])
+                   .values('author').annotate(count=Count('id')).values_list('author', 'count'))
+    loads = [pending.get(reviewer_id, 0) for reviewer_id, faculty_id in reviewer_rows]
+    deadlines = {row[0]: Review.compute_deadline(row[4]) for row in thesis_rows}
+    if not thesis_rows or not reviewer_rows:
+        return AssignmentPlan([], [row[0] for row in thesis_rows], pending, deadlines)
+
+    # One spare slot per reviewer leaves room for avoiding the forbidden pairs
+    slots = int(math.ceil(len(thesis_rows) / len(reviewer_rows))) + 1
+    costs = build_costs([row[1:4] for row in thesis_rows], reviewer_rows, loads, slots)
+    pairs, unassigned = [], []
+    for row, column in solve(costs):
+        thesis_id, reviewer_index = thesis_rows[row][0], column // slots
+        if costs[row][column] >= FORBIDDEN_COST:
+            unassigned.append(thesis_id)
+            continue
+        pairs.append((thesis_id, reviewer_rows[reviewer_index][0]))
+        loads[reviewer_index] += 1
+    return AssignmentPlan(pairs, unassigned, {reviewer_rows[i][0]: load for i, load in enumerate(loads)}, deadlines)
+
+
+def apply_assignment(plan):
+    """
+    Creates the reviews of an assignment in a single transaction. Theses that received a review since the assignment
+    was computed are skipped.
+
+    :param plan: (AssignmentPlan) The assignment
+    :return: The created reviews
+    :rtype: list
+    """
+    with transaction.atomic():
+        thesis_ids = [thesis_id for thesis_id, reviewer_id in plan.pairs]
+        taken = set(Review.objects.filter(thesis_id__in=thesis_ids).values_list('thesis_id', flat=True))
+        # Reviews are inserted without the pre_save signal, so their deadlines are set here
+        reviews = [Review(thesis_id=thesis_id, author_id=reviewer_id, deadline=plan.deadlines[thesis_id])
+                   for thesis_id, reviewer_id in plan.pairs if thesis_id not in taken]
+        Review.objects.bulk_create(reviews)
+        # Bulk inserts send no signals
+        statistics.add(reviews=Review.objects.filter(thesis_id__in=[review.thesis_id for review in reviews]))
+    caching.bump_versions(caching.REVIEWS)
+    return reviews
+
+
+def describe(plan):
+    """
+    Describes an assignment for a dry-run preview.
+
+    :param plan: (AssignmentPlan) The assignment
+    :return: Lines naming the thesis and reviewer of every pair, followed by the unassigned theses
+    :rtype: list
+    """
+    theses = Thesis.objects.select_related('topic', 'student').in_bulk(
+        [thesis_id for thesis_id, reviewer_id in plan.pairs] + plan.unassigned)
+    reviewers = User.objects.in_bulk([reviewer_id for thesis_id, reviewer_id in plan.pairs])
+    lines = ['{} -> {}'.format(theses[thesis_id], reviewers[reviewer_id]) for thesis_id, reviewer_id in plan.pairs]
+    lines.extend('{} -> no eligible reviewer'.format(theses[thesis_id]) for thesis_id in plan.unassigned)
+    return lines
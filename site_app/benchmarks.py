@@ -0,0 +1,361 @@
+"""
+Benchmarks of the site at realistic volumes. The seed_data management command generates faculties, supervisors,
+students, topics, theses, reviews and defenses with bulk inserts, a batch of students with all their rows at a time,
+so that millions of rows can be generated with flat memory use. The derived tables which are normally maintained by
+signals, i.e. the topic similarity index and the statistics counters, are filled afterwards.
+
+The run_benchmarks management command drives the main views, the login and the admin changelists with the Django test
+client, optionally from several threads, and reports the 50th, 95th and 99th percentile of the latency, the throughput
+and the number of queries of every scenario. Results are saved as JSON and can be compared with an earlier run.
+
+Seeded users have e-mail addresses in the SEED_DOMAIN domain and share the password given to seed_data.
+"""
+import math
+import random
+import time
+from collections import namedtuple, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import Group
+from django.db import connection, transaction
+from django.db.models import Max
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import LEVELS, Faculty, User, Topic, Thesis, Review, Defense
+from . import caching
+from . import roles
+from . import similarity
+from . import statistics
+
+SEED_DOMAIN = 'seed.example.com'
+SEED_PASSWORD = 'benchmark'
+FACULTIES = 12
+STUDENTS_PER_SUPERVISOR = 20
+# Shares of the students writing a thesis, of the theses finished, of the reviews submitted and of the finished theses
+# defended
+THESIS_SHARE = 0.7
+FINISHED_SHARE = 0.6
+SUBMITTED_SHARE = 0.5
+DEFENDED_SHARE = 0.5
+# Available topics offered by the supervisors per student
+OFFERED_TOPICS = 0.5
+# Number of topics added to the similarity index at once, SQLite limits the number of query parameters
+INDEX_BATCH_SIZE = 500
+LEVEL_VALUES = [level for level, label in LEVELS]
+ROOMS = ['C-1/{}'.format(number) for number in range(101, 111)]
+FIRST_NAMES = ['Anna', 'Jan', 'Maria', 'Piotr', 'Katarzyna', 'Tomasz', 'Agnieszka', 'Pawel', 'Ewa', 'Michal']
+LAST_NAMES = ['Nowak', 'Kowalski', 'Wisniewski', 'Wojcik', 'Kowalczyk', 'Kaminski', 'Lewandowski', 'Zielinski']
+SUBJECTS = ['neural networks', 'distributed databases', 'compilers', 'image segmentation', 'cryptographic protocols',
+            'recommender systems', 'mobile applications', 'embedded systems', 'graph algorithms', 'cloud storage',
+            'speech recognition', 'computer games', 'network security', 'machine learning', 'robot navigation']
+APPROACHES = ['Analysis of', 'Design of', 'Evaluation of', 'Optimization of', 'A framework for', 'Applications of',
+              'Scalability of', 'Testing of']
+CONTEXTS = ['in healthcare', 'for small businesses', 'on mobile devices', 'in public transport', 'for education',
+            'in the energy sector', 'for e-commerce', 'in real time']
+
+Scenario = namedtuple('Scenario', ['name', 'user', 'method', 'url', 'data'])
+
+
+def _insert(model, objects):
+    """
+    Inserts objects and gets their primary keys, which bulk inserts do not return on every database. Seeding assumes
+    that nothing else inserts rows at the same time.
+
+    :param model: (Model) Model of the objects
+    :param objects: (list) The objects
+    :return: Primary keys of the objects, in their order
+    :rtype: list
+    """
+    if not objects:
+        return []
+    last = model.objects.aggregate(last=Max('pk'))['last'] or 0
+    # The number of rows inserted by one query is limited by the database backend
+    model.objects.bulk_create(objects)
+    return list(model.objects.filter(pk__gt=last).order_by('pk').values_list('pk', flat=True)[:len(objects)])
+
+
+def _add_to_group(name, user_ids):
+    group, created = Group.objects.get_or_create(name=name)
+    through = User.groups.through
+    through.objects.bulk_create([through(user_id=user_id, group_id=group.id) for user_id in user_ids])
+
+
+def _topic_name(rng):
+    return '{} {} {}'.format(rng.choice(APPROACHES), rng.choice(SUBJECTS), rng.choice(CONTEXTS))
+
+
+def seed(students=1000, batch_size=5000, password=SEED_PASSWORD, index=True, random_seed=0, log=None):
+    """
+    Generates users, topics, theses, reviews and defenses. Every call adds a new set of students, so the volume can be
+    grown by repeated calls.
+
+    :param students: (int) Number of generated students, the other numbers are derived from it
+    :param batch_size: (int) Number of students whose rows are inserted in one transaction
+    :param password: (string) Password of the generated users
+    :param index: (bool) Whether the topics are added to the similarity index, which takes most of the time
+    :param random_seed: (int) Seed of the generated values
+    :param log: (callable) Function called with progress messages
+    :return: Numbers of the generated rows by model name
+    :rtype: dict
+    """
+    rng = random.Random(random_seed)
+    log = log or (lambda message: None)
+    encoded = make_password(password)
+    now = timezone.now()
+    created = OrderedDict((str(model._meta.verbose_name_plural), 0) for model in (Faculty, User, Topic, Thesis, Review,
+                                                                               Defense))
+    start = User.objects.filter(email__endswith='@' + SEED_DOMAIN, email__startswith='student').count()
+
+    with transaction.atomic():
+        faculty_ids = list(Faculty.objects.order_by('pk').values_list('pk', flat=True))
+        if not faculty_ids:
+            faculty_ids = _insert(Faculty, [Faculty(code='W{}'.format(number), name='Faculty {}'.format(number))
+                                            for number in range(1, FACULTIES + 1)])
+            created['faculties'] = len(faculty_ids)
+        if not User.objects.filter(email='admin@' + SEED_DOMAIN).exists():
+            User.objects.create_superuser(email='admin@' + SEED_DOMAIN, password=password)
+            created['users'] += 1
+        supervisor_start = User.objects.filter(email__endswith='@' + SEED_DOMAIN,
+                                               email__startswith='supervisor').count()
+        supervisors = [User(email='supervisor{}@{}'.format(supervisor_start + i, SEED_DOMAIN), password=encoded,
+                            first_name=rng.choice(FIRST_NAMES), last_name=rng.choice(LAST_NAMES),
+                            index_number='S{:07d}'.format(supervisor_start + i), degree=LEVELS.Doctor,
+                            faculty_id=rng.choice(faculty_ids))
+                       for i in range(max(1, students // STUDENTS_PER_SUPERVISOR))]
+        supervisor_ids = _insert(User, supervisors)
+        _add_to_group(roles.SUPERVISOR_GROUP, supervisor_ids)
+        _add_to_group('Reviewer', supervisor_ids)
+        created['users'] += len(supervisor_ids)
+    supervisor_ids = list(User.objects.filter(groups__name=roles.SUPERVISOR_GROUP).values_list('pk', flat=True))
+
+    for offset in range(0, students, batch_size):
+        count = min(batch_size, students - offset)
+        with transaction.atomic():
+            numbers = range(start + offset, start + offset + count)
+            users = [User(email='student{}@{}'.format(number, SEED_DOMAIN), password=encoded,
+                          first_name=rng.choice(FIRST_NAMES), last_name=rng.choice(LAST_NAMES),
+                          index_number='{:06d}'.format(number), degree=rng.choice(LEVEL_VALUES),
+                          faculty_id=rng.choice(faculty_ids)) for number in numbers]
+            student_ids = _insert(User, users)
+            _add_to_group('Student', student_ids)
+
+            topics = [Topic(name=_topic_name(rng), student_id=student_id, supervisor_id=rng.choice(supervisor_ids),
+                            level=user.degree, checked=rng.random() < 0.7, short_description=_topic_name(rng))
+                      for student_id, user in zip(student_ids, users)]
+            topics += [Topic(name=_topic_name(rng), supervisor_id=rng.choice(supervisor_ids), available=True,
+                             checked=True, level=rng.choice(LEVEL_VALUES), short_description=_topic_name(rng))
+                       for i in range(int(count * OFFERED_TOPICS))]
+            topic_ids = _insert(Topic, topics)
+
+            theses = []
+            for topic_id, topic in zip(topic_ids, topics[:len(student_ids)]):
+                if rng.random() < THESIS_SHARE:
+                    theses.append(Thesis(topic_id=topic_id, student_id=topic.student_id,
+                                         supervisor_id=topic.supervisor_id, finished=rng.random() < FINISHED_SHARE,
+                                         finished_date=now - timedelta(days=rng.randrange(365))))
+            thesis_ids = _insert(Thesis, theses)
+
+            reviews, defenses = [], []
+            for thesis_id, thesis in zip(thesis_ids, theses):
+                if not thesis.finished:
+                    continue
+                author_id = rng.choice(supervisor_ids)
+                submitted = rng.random() < SUBMITTED_SHARE
+                reviews.append(Review(thesis_id=thesis_id, author_id=author_id,
+                                      deadline=Review.compute_deadline(thesis.finished_date),
+                                      file='theses/thesis_{}/review.pdf'.format(thesis_id) if submitted else '',
+                                      finished_date=thesis.finished_date + timedelta(days=7) if submitted else None))
+                if submitted and rng.random() < DEFENDED_SHARE:
+                    successful = rng.random() < 0.9
+                    defenses.append(Defense(thesis_id=thesis_id, date=thesis.finished_date + timedelta(days=30),
+                                            room=rng.choice(ROOMS), successful=successful,
+                                            second_defense=not successful))
+            Review.objects.bulk_create(reviews)
+            Defense.objects.bulk_create(defenses)
+            if index:
+                topics = Topic.objects.filter(pk__gte=topic_ids[0], pk__lte=topic_ids[-1]).order_by('pk')
+                for i in range(0, len(topic_ids), INDEX_BATCH_SIZE):
+                    similarity.index_topics(topics[i:i + INDEX_BATCH_SIZE].only('id', 'name', 'short_description'))
+        for name, number in (('users', len(student_ids)), ('topics', len(topic_ids)), ('theses', len(thesis_ids)),
+                             ('reviews', len(reviews)), ('defenses', len(defenses))):
+            created[name] += number
+        log('Seeded {} of {} students'.format(offset + count, students))
+
+    # Bulk inserts send no signals
+    statistics.rebuild()
+    caching.bump_versions(caching.TOPICS, caching.THESES, caching.REVIEWS, caching.USERS)
+    roles.invalidate_supervisor_directory()
+    return created
+
+
+def percentile(values, share):
+    """
+    Gets a percentile of values by the nearest-rank method.
+
+    :param values: (list) Sorted values
+    :param share: (float) Share of the values at or below the percentile, between 0 and 1
+    :return: The percentile, None for no values
+    :rtype: float
+    """
+    if not values:
+        return None
+    return values[max(0, int(math.ceil(share * len(values))) - 1)]
+
+
+def scenarios(password=SEED_PASSWORD):
+    """
+    Builds the benchmarked requests from the data in the database. Scenarios whose user does not exist are left out.
+
+    :param password: (string) Password of the seeded users, used by the login scenario
+    :return: The scenarios
+    :rtype: list
+    """
+    student = User.objects.filter(groups__name='Student', topic_owner__isnull=False).order_by('pk').first()
+    reviewer = User.objects.filter(pk__in=Review.objects.values('author_id')[:1]).first()
+    admin = User.objects.filter(is_admin=True).order_by('pk').first()
+    result = []
+    if student is not None:
+        result += [
+            Scenario('login', None, 'post', reverse('login'), {'username': student.email, 'password': password}),
+            Scenario('profile', student, 'get', reverse('profile'), {}),
+            Scenario('topic_list', student, 'get', reverse('topic_list'), {}),
+            Scenario('topic_list_filtered', student, 'get', reverse('topic_list'), {'level': LEVELS.Master}),
+            Scenario('topic_list_search', student, 'get', reverse('topic_list'), {'q': SUBJECTS[0]}),
+            Scenario('api_topics', student, 'get', reverse('api_list', args=['topics']), {}),
+        ]
+    if reviewer is not None:
+        result += [
+            Scenario('reviews', reviewer, 'get', reverse('reviews'), {}),
+            Scenario('deadlines', reviewer, 'get', reverse('deadlines'), {}),
+        ]
+    if admin is not None:
+        result += [Scenario('admin_{}'.format(name), admin, 'get', reverse('admin:site_app_{}_changelist'.format(name)),
+                            {}) for name in ('user', 'topic', 'thesis', 'review', 'defense', 'statistic')]
+    return result
+
+
+def _client(scenario):
+    # Requests have to name a host accepted by ALLOWED_HOSTS, which only holds local addresses in development
+    hosts = [host.lstrip('.') for host in settings.ALLOWED_HOSTS if '*' not in host]
+    client = Client(HTTP_HOST=hosts[0] if hosts else 'localhost')
+    if scenario.user is not None:
+        client.force_login(scenario.user)
+    return client
+
+
+def _send(client, scenario):
+    with CaptureQueriesContext(connection) as queries:
+        started = time.perf_counter()
+        response = getattr(client, scenario.method)(scenario.url, scenario.data)
+        elapsed = time.perf_counter() - started
+    if scenario.name == 'login':
+        client.logout()
+    return elapsed, len(queries), response.status_code
+
+
+def run_scenario(scenario, requests=50, concurrency=1, warmup=5):
+    """
+    Sends the requests of a scenario and measures them.
+
+    :param scenario: (Scenario) The scenario
+    :param requests: (int) Number of measured requests
+    :param concurrency: (int) Number of threads sending the requests
+    :param warmup: (int) Number of requests sent before the measurement, e.g. to fill the caches
+    :return: Latency percentiles and mean in milliseconds, throughput in requests per second, query counts and the
+        number of responses with an unexpected status
+    :rtype: dict
+    """
+    client = _client(scenario)
+    for i in range(warmup):
+        _send(client, scenario)
+
+    def work(count):
+        worker_client = _client(scenario)
+        try:
+            return [_send(worker_client, scenario) for i in range(count)]
+        finally:
+            # Threads have connections of their own
+            if concurrency > 1:
+                connection.close()
+
+    shares = [requests // concurrency + (1 if i < requests % concurrency else 0) for i in range(concurrency)]
+    started = time.perf_counter()
+    if concurrency > 1:
+        with ThreadPoolExecutor(concurrency) as pool:
+            samples = [sample for samples in pool.map(work, shares) for sample in samples]
+    else:
+        samples = work(requests)
+    wall = time.perf_counter() - started
+
+    latencies = sorted(elapsed * 1000 for elapsed, queries, status in samples)
+    queries = [count for elapsed, count, status in samples]
+    return OrderedDict([
+        ('name', scenario.name),
+        ('url', scenario.url),
+        ('requests', len(samples)),
+        ('concurrency', concurrency),
+        ('p50_ms', percentile(latencies, 0.5)),
+        ('p95_ms', percentile(latencies, 0.95)),
+        ('p99_ms', percentile(latencies, 0.99)),
+        ('mean_ms', sum(latencies) / len(latencies) if latencies else None),
+        ('throughput_rps', len(samples) / wall if wall else None),
+        ('queries_min', min(queries) if queries else None),
+        ('queries_max', max(queries) if queries else None),
+        ('errors', sum(1 for elapsed, count, status in samples if status >= 400)),
+    ])
+
+
+def run(requests=50, concurrency=1, warmup=5, names=None, password=SEED_PASSWORD, log=None):
+    """
+    Runs the benchmark scenarios.
+
+    :param requests: (int) Number of measured requests of every scenario
+    :param concurrency: (int) Number of threads sending the requests
+    :param warmup: (int) Number of requests sent before the measurement of every scenario
+    :param names: (iterable) Names of the scenarios to run, None for all
+    :param password: (string) Password of the seeded users
+    :param log: (callable) Function called with the result of every scenario
+    :return: Description of the run and the results of the scenarios, serializable as JSON
+    :rtype: dict
+    """
+    log = log or (lambda result: None)
+    results = []
+    for scenario in scenarios(password):
+        if names and scenario.name not in names:
+            continue
+        result = run_scenario(scenario, requests, concurrency, warmup)
+        log(result)
+        results.append(result)
+    return OrderedDict([
+        ('started', timezone.now().isoformat()),
+        ('database', connection.vendor),
+        ('rows', OrderedDict((str(model._meta.verbose_name_plural), model.objects.count())
+                             for model in (User, Topic, Thesis, Review, Defense))),
+        ('scenarios', results),
+    ])
+
+
+def compare(previous, current, key='p95_ms'):
+    """
+    Compares the results of two runs.
+
+    :param previous: (dict) Results of the earlier run
+    :param current: (dict) Results of the later run
+    :param key: (string) Compared value of the scenarios
+    :return: Lines describing the change of the value of every scenario present in both runs
+    :rtype: list
+    """
+    earlier = {result['name']: result for result in previous['scenarios']}
+    lines = []
+    for result in current['scenarios']:
+        before = earlier.get(result['name'], {}).get(key)
+        if before and result[key] is not None:
+            lines.append('{}: {} {:.1f} -> {:.1f} ({:+.0%})'.format(result['name'], key, before, result[key],
+                                                                  result[key] / before - 1))
+    return lines
@@ -0,0 +1,147 @@
+"""
+Caching of the rendered parts of the list pages. The data shown by the pages is divided into sections (topics, theses,
+reviews and users), each with a version counter kept in the shared cache. Signal receivers bump the counter of a
+section whenever one of its rows is saved or deleted, and the code changing rows in bulk bumps it explicitly.
+
+Rendered fragments, i.e. the tables of rows and the crispy forms, are cached under keys containing the versions of
+the sections they show, so a change makes them unreachable instead of deleting them, and they expire after
+FRAGMENT_CACHE_TIMEOUT seconds. The versions are the times of the last changes in microseconds, which also gives the
+Last-Modified date of the pages answering conditional GET requests.
+
+The versions only reach the other worker processes through a cache backend shared by them, a cache kept in the memory
+of every process (LocMemCache) serves stale pages and ETags. The check_shared_cache system check warns about it.
+"""
+import hashlib
+import time
+
+from crispy_forms.utils import render_crispy_form
+from django.conf import settings
+from django.core import checks
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.utils.safestring import mark_safe
+
+TOPICS = 'topic'
+THESES = 'thesis'
+REVIEWS = 'review'
+USERS = 'user'
+VERSION_KEY = 'site_app:version:{}'
+FRAGMENT_KEY = 'site_app:fragment:{}:{}'
+
+
+def fragment_timeout():
+    """
+    Gets the time rendered fragments are kept for, configured by the FRAGMENT_CACHE_TIMEOUT setting.
+
+    :return: Number of seconds
+    :rtype: int
+    """
+    return getattr(settings, 'FRAGMENT_CACHE_TIMEOUT', 600)
+
+
+def get_versions(sections):
+    """
+    Gets the current versions of sections. Sections without a stored version, e.g. after the cache was cleared, get
+    a new one.
+
+    :param sections: (iterable) Names of the sections
+    :return: Dictionary of section name to version
+    :rtype: dict
+    """
+    keys = {section: VERSION_KEY.format(section) for section in sections}
+    stored = cache.get_many(keys.values())
+    versions = {}
+    for section, key in keys.items():
+        if key not in stored:
+            stored[key] = cache.get_or_set(key, int(time.time() * 1000000), None)
+        versions[section] = stored[key]
+    return versions
+
+
+def bump_versions(*sections):
+    """
+    Marks sections as changed, making the fragments rendered from them stale.
+
+    :param sections: (string) Names of the sections
+    """
+    now = int(time.time() * 1000000)
+    previous = cache.get_many([VERSION_KEY.format(section) for section in sections])
+    # The new version has to differ from the previous one even if the clock did not move
+    cache.set_many({key: max(now, previous.get(key, 0) + 1) for key in
+                    (VERSION_KEY.format(section) for section in sections)}, None)
+
+
+def last_modified(versions):
+    """
+    Gets the time of the last change of sections.
+
+    :param versions: (dict) Versions of the sections
+    :return: Seconds since the epoch
+    :rtype: float
+    """
+    return max(versions.values()) / 1000000 if versions else None
+
+
+def digest(*parts):
+    """
+    Hashes the values identifying a fragment or a page into a short key, also used as the entity tag of pages.
+
+    :param parts: Values, converted to strings
+    :return: Hexadecimal digest
+    :rtype: string
+    """
+    return hashlib.md5(repr(parts).encode('utf-8')).hexdigest()
+
+
+def get_or_render(name, parts, render):
+    """
+    Gets a cached fragment or renders and caches it.
+
+    :param name: (string) Name of the fragment
+    :param parts: (iterable) Values the fragment is rendered from, including the versions of its sections
+    :param render: (callable) Function rendering the fragment
+    :return: HTML of the fragment
+    :rtype: SafeText
+    """
+    key = FRAGMENT_KEY.format(name, digest(*parts))
+    html = cache.get(key)
+    if html is None:
+        html = render()
+        cache.set(key, html, fragment_timeout())
+    return mark_safe(html)
+
+
+def render_form(name, form, parts):
+    """
+    Renders a crispy form without the form tag and CSRF token, which the template adds, so that the HTML is the same
+    for all users and can be cached.
+
+    :param name: (string) Name of the fragment
+    :param form: (Form) The form with a crispy helper
+    :param parts: (iterable) Values the form is rendered from, e.g. its data and the versions of its choices
+    :return: HTML of the form fields and buttons
+    :rtype: SafeText
+    """
+    def render():
+        form.helper.form_tag = False
+        form.helper.disable_csrf = True
+        return render_crispy_form(form, form.helper)
+
+    return get_or_render(name, parts, render)
+
+
+def check_shared_cache(app_configs, **kwargs):
+    """
+    System check warning when the default cache is kept in the memory of every process. Besides the cached pages, the
+    supervisor directory and the profiling rules rely on a cache shared by the workers.
+
+    :param app_configs: (list) Configurations of the checked applications, None for all
+    :return: The warnings
+    :rtype: list
+    """
+    if not isinstance(caches['default'], LocMemCache):
+        return []
+    return [checks.Warning('The default cache is not shared by the worker processes',
+                           hint='Configure a file based or memcached backend in the CACHES setting, otherwise the '
+                                'workers serve stale pages and profile with stale rules.',
+                           id='site_app.W001')]
@@ -0,0 +1,155 @@
+"""
+Serving of the files uploaded to the site. Files are streamed in chunks with support for single HTTP ranges and
+conditional requests (ETag, If-None-Match, If-Range). When SENDFILE_BACKEND is set, the transfer is handed off to the
+front-end server through the X-Accel-Redirect (nginx) or X-Sendfile (Apache, lighttpd) header instead.
+"""
+import mimetypes
+import os
+import re
+import zlib
+
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_etags, quote_etag
+
+CHUNK_SIZE = 64 * 1024
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def file_etag(fieldfile):
+    """
+    Computes the entity tag of a stored file from its name, size and modification time.
+
+    :param fieldfile: (FieldFile) The file
+    :return: Quoted entity tag
+    :rtype: string
+    """
+    storage, name = fieldfile.storage, fieldfile.name
+    try:
+        modified = int(storage.get_modified_time(name).timestamp())
+    except NotImplementedError:
+        modified = 0
+    return quote_etag('{:x}-{:x}-{:x}'.format(zlib.crc32(name.encode('utf-8')), storage.size(name), modified))
+
+
+def parse_range(header, size):
+    """
+    Parses the Range header of a request. Only single byte ranges are supported, other ranges are ignored.
+
+    :param header: (string) Value of the Range header
+    :param size: (int) Size of the file
+    :raises: ValueError if the range can not be satisfied
+    :return: First and last byte of the range or None if the whole file should be sent
+    :rtype: tuple
+    """
+    match = RANGE_RE.match(header.replace(' ', ''))
+    if not match or match.group(1) == match.group(2) == '':
+        return None
+    first, last = match.groups()
+    if first == '':
+        # Suffix range, i.e. the last N bytes
+        length = int(last)
+        if length == 0 or size == 0:
+            raise ValueError('Unsatisfiable range')
+        return max(size - length, 0), size - 1
+    first = int(first)
+    last = min(int(last), size - 1) if last else size - 1
+    if first >= size or first > last:
+        raise ValueError('Unsatisfiable range')
+    return first, last
+
+
+def iter_file(fieldfile, first, last, chunk_size=CHUNK_SIZE):
+    """
+    Reads given byte range of a stored file in chunks.
+
+    :param fieldfile: (FieldFile) The file
+    :param first: (int) First byte to read
+    :param last: (int) Last byte to read
+    :param chunk_size: (int) Maximal size of a chunk
+    :return: Generator of the chunks
+    :rtype: generator
+    """
+    with fieldfile.storage.open(fieldfile.name, 'rb') as f:
+        f.seek(first)
+        remaining = last - first + 1
+        while remaining > 0:
+            chunk = f.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def sendfile_response(fieldfile):
+    """
+    Creates a response handing the transfer of a file off to the front-end server.
+
+    :param fieldfile: (FieldFile) The file
+    :return: Response without a body or None if no backend is configured
+    :rtype: HttpResponse
+    """
+    backend = getattr(settings, 'SENDFILE_BACKEND', None)
+    if not backend:
+        return None
+    path = fieldfile.storage.path(fieldfile.name)
+    response = HttpResponse()
+    if backend == 'nginx':
+        relative = os.path.relpath(path, fieldfile.storage.location).replace(os.sep, '/')
+        response['X-Accel-Redirect'] = settings.SENDFILE_URL_PREFIX + relative
+    else:
+        response['X-Sendfile'] = path
+    return response
+
+
+def serve_file(request, fieldfile, filename=None):
+    """
+    Creates a response sending the stored file to the user.
+
+    :param request: (HttpRequest) The request performed by user
+    :param fieldfile: (FieldFile) The file to send
+    :param filename: (string) Name of the file offered to the user, defaults to the stored name
+    :return: Response streaming the file or its requested range
+    :rtype: HttpResponse
+    """
+    filename = filename or os.path.basename(fieldfile.name)
+    content_type = mimetypes.guess_type(filename)[0]
+    etag = file_etag(fieldfile)
+
+    try:
+        modified = fieldfile.storage.get_modified_time(fieldfile.name).timestamp()
+    except NotImplementedError:
+        modified = None
+    # Handles If-None-Match with weak and * validators, If-Match and the modification dates
+    response = get_conditional_response(request, etag=parse_etags(etag)[0], last_modified=modified)
+    if response is not None:
+        response['ETag'] = etag
+        return response
+
+    response = sendfile_response(fieldfile)
+    if response is None:
+        size = fieldfile.storage.size(fieldfile.name)
+        byte_range = None
+        range_header = request.META.get('HTTP_RANGE')
+        if range_header and request.META.get('HTTP_IF_RANGE', etag) == etag:
+            try:
+                byte_range = parse_range(range_header, size)
+            except ValueError:
+                response = HttpResponse(status=416)
+                response['Content-Range'] = 'bytes */{}'.format(size)
+                return response
+        first, last = byte_range or (0, size - 1)
+        response = StreamingHttpResponse(iter_file(fieldfile, first, last),
+                                         status=206 if byte_range else 200)
+        response['Content-Length'] = str(last - first + 1)
+        if byte_range:
+            response['Content-Range'] = 'bytes {}-{}/{}'.format(first, last, size)
+        response['Accept-Ranges'] = 'bytes'
+
+    response['Content-Type'] = content_type or 'application/octet-stream'
+    response['Content-Disposition'] = 'attachment; filename="{}"'.format(filename.replace('"', ''))
+    response['ETag'] = etag
+    if modified is not None:
+        response['Last-Modified'] = http_date(modified)
+    return response
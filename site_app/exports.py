@@ -0,0 +1,309 @@
+"""
+Exports of theses, reviews and defenses for the deans' offices. Rows are read in batches of EXPORT_BATCH_SIZE by
+keyset queries joined to the topic, student and supervisor, fetched as tuples instead of model instances, and written
+to the response as they are read, so the memory used does not grow with the number of exported rows.
+
+Both CSV and XLSX exports are streamed to the client. An XLSX workbook is a ZIP archive of XML files; its worksheet is
+written row by row with inline strings into a deflated archive entry, and the compressed data is sent after every
+batch of rows.
+
+Text starting with a character that spreadsheets read as the start of a formula (=, +, -, @, a tab or a carriage
+return) is prefixed with an apostrophe, so that exported values can not run formulas in the spreadsheet of the office.
+
+Rows can be limited to the students of a faculty, the topics of a level and a range of dates, which are the finished
+dates of theses, the deadlines of reviews and the dates of defenses.
+"""
+import csv
+import re
+import zipfile
+from collections import namedtuple, OrderedDict
+from datetime import date, datetime, time, timedelta
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+from django.db.models import DateTimeField
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+from .models import Thesis, Review, Defense
+
+XLSX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+# Characters not allowed in XML documents
+INVALID_XML = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]')
+
+# Parts of the XLSX workbook besides its only worksheet
+XLSX_PARTS = [
+    ('[Content_Types].xml',
+     '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+     '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+     '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+     '<Default Extension="xml" ContentType="application/xml"/>'
+     '<Override PartName="/xl/workbook.xml" '
+     'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+     '<Override PartName="/xl/worksheets/sheet1.xml" '
+     'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+     '</Types>'),
+    ('_rels/.rels',
+     '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+     '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+     '<Relationship Id="rId1" Target="xl/workbook.xml" '
+     'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"/>'
+     '</Relationships>'),
+    ('xl/workbook.xml',
+     '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+     '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+     'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+     '<sheets><sheet name="Export" sheetId="1" r:id="rId1"/></sheets></workbook>'),
+    ('xl/_rels/workbook.xml.rels',
+     '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+     '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+     '<Relationship Id="rId1" Target="worksheets/sheet1.xml" '
+     'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet"/>'
+     '</Relationships>'),
+]
+XLSX_SHEET_START = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>')
+XLSX_SHEET_END = '</sheetData></worksheet>'
+
+Export = namedtuple('Export', ['model', 'thesis', 'date_field', 'columns'])
+
+
+def _thesis_columns(thesis):
+    return [
+        ('topic', (thesis + 'topic__name',)),
+        ('level', (thesis + 'topic__level',)),
+        ('student', (thesis + 'student__first_name', thesis + 'student__last_name')),
+        ('index number', (thesis + 'student__index_number',)),
+        ('faculty', (thesis + 'student__faculty__code',)),
+        ('supervisor', (thesis + 'supervisor__first_name', thesis + 'supervisor__last_name')),
+    ]
+
+
+EXPORTS = OrderedDict([
+    ('theses', Export(Thesis, '', 'finished_date', [('id', ('id',))] + _thesis_columns('') + [
+        ('finished', ('finished',)), ('finished date', ('finished_date',))])),
+    ('reviews', Export(Review, 'thesis__', 'deadline', [('id', ('id',))] + _thesis_columns('thesis__') + [
+        ('reviewer', ('author__first_name', 'author__last_name')), ('deadline', ('deadline',)),
+        ('finished date', ('finished_date',)), ('file', ('file',))])),
+    ('defenses', Export(Defense, 'thesis__', 'date', [('id', ('id',))] + _thesis_columns('thesis__') + [
+        ('date', ('date',)), ('room', ('room',)), ('successful', ('successful',)),
+        ('second defense', ('second_defense',))])),
+])
+
+
+class ExportError(Exception):
+    """
+    Error raised when an export cannot be produced.
+    """
+
+
+class Echo(object):
+    """
+    File-like object returning what is written to it, used to make csv.writer produce lines for a streaming response.
+    """
+
+    def write(self, value):
+        return value
+
+
+class Spool(object):
+    """
+    Unseekable file-like object collecting what is written to it until it is taken, used to stream a ZIP archive.
+    """
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        """
+        Takes the data written since the last call.
+
+        :return: The data
+        :rtype: bytes
+        """
+        data, self.chunks = b''.join(self.chunks), []
+        return data
+
+
+def batch_size():
+    """
+    Gets the number of rows read by one query, configured by the EXPORT_BATCH_SIZE setting.
+
+    :return: Number of rows
+    :rtype: int
+    """
+    return getattr(settings, 'EXPORT_BATCH_SIZE', 2000)
+
+
+def filter_rows(name, queryset=None, faculty=None, level=None, date_from=None, date_to=None):
+    """
+    Selects the exported rows.
+
+    :param name: (string) Name of the export, a key of EXPORTS
+    :param queryset: (QuerySet) Rows to start from, e.g. the selection of an admin action, defaults to all
+    :param faculty: (int) ID of the faculty of the students
+    :param level: (string) Level of the topics
+    :param date_from: (date) First day of the range
+    :param date_to: (date) Last day of the range
+    :return: The rows
+    :rtype: QuerySet
+    """
+    export = EXPORTS[name]
+    rows = export.model.objects.all() if queryset is None else queryset
+    if faculty:
+        rows = rows.filter(**{export.thesis + 'student__faculty_id': faculty})
+    if level:
+        rows = rows.filter(**{export.thesis + 'topic__level': level})
+    bounds = {'gte': date_from, 'lt': date_to + timedelta(days=1) if date_to else None}
+    for lookup, day in bounds.items():
+        if day is not None:
+            if isinstance(export.model._meta.get_field(export.date_field), DateTimeField):
+                day = timezone.make_aware(datetime.combine(day, time()))
+            rows = rows.filter(**{'{}__{}'.format(export.date_field, lookup): day})
+    return rows
+
+
+def _format(value):
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return 'yes' if value else 'no'
+    if isinstance(value, datetime):
+        return timezone.localtime(value).strftime('%Y-%m-%d %H:%M')
+    if isinstance(value, date):
+        return value.isoformat()
+    return value
+
+
+def neutralize(value):
+    """
+    Prefixes text that a spreadsheet would read as a formula with an apostrophe.
+
+    :param value: The exported value
+    :return: The value safe to open in a spreadsheet
+    """
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def export_rows(name, rows, size=None):
+    """
+    Reads the exported rows in batches.
+
+    :param name: (string) Name of the export, a key of EXPORTS
+    :param rows: (QuerySet) The rows, see filter_rows
+    :param size: (int) Number of rows read by one query, defaults to EXPORT_BATCH_SIZE
+    :return: Generator of the header and the values of every row
+    :rtype: generator
+    """
+    columns = EXPORTS[name].columns
+    yield [header for header, fields in columns]
+    size = size or batch_size()
+    # Rows are read in the order of their IDs, the first column, so a batch starts where the previous one ended
+    # instead of at an offset
+    rows = rows.order_by('pk').values_list(*[field for header, fields in columns for field in fields])
+    last = None
+    while True:
+        batch = list((rows if last is None else rows.filter(pk__gt=last))[:size])
+        for row in batch:
+            values, line = iter(row), []
+            for header, fields in columns:
+                parts = [next(values) for field in fields]
+                value = _format(parts[0]) if len(parts) == 1 else ' '.join(str(part) for part in parts if part)
+                line.append(neutralize(value))
+            yield line
+        if len(batch) < size:
+            return
+        last = batch[-1][0]
+
+
+def stream_csv(rows):
+    """
+    Encodes rows as lines of CSV.
+
+    :param rows: (iterable) Lists of values
+    :return: Generator of the lines
+    :rtype: generator
+    """
+    writer = csv.writer(Echo())
+    return (writer.writerow(row) for row in rows)
+
+
+def _column_name(index):
+    name = ''
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        name = chr(ord('A') + remainder) + name
+    return name
+
+
+def _xlsx_row(number, values):
+    cells = []
+    for i, value in enumerate(values):
+        reference = '{}{}'.format(_column_name(i), number)
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            cells.append('<c r="{}"><v>{}</v></c>'.format(reference, value))
+        elif value != '':
+            text = escape(INVALID_XML.sub('', str(value)))
+            cells.append('<c r="{}" t="inlineStr"><is><t xml:space="preserve">{}</t></is></c>'.format(reference, text))
+    return '<row r="{}">{}</row>'.format(number, ''.join(cells))
+
+
+def stream_xlsx(rows, flush_rows=None):
+    """
+    Encodes rows as an XLSX workbook with a single worksheet, produced while the rows are read.
+
+    :param rows: (iterable) Lists of values
+    :param flush_rows: (int) Number of rows after which the compressed data is sent, defaults to EXPORT_BATCH_SIZE
+    :return: Generator of the parts of the file
+    :rtype: generator
+    """
+    flush_rows = flush_rows or batch_size()
+    spool = Spool()
+    with zipfile.ZipFile(spool, 'w', zipfile.ZIP_DEFLATED) as workbook:
+        for name, content in XLSX_PARTS:
+            workbook.writestr(name, content)
+        with workbook.open('xl/worksheets/sheet1.xml', 'w') as sheet:
+            sheet.write(XLSX_SHEET_START.encode('utf-8'))
+            for number, row in enumerate(rows, start=1):
+                sheet.write(_xlsx_row(number, row).encode('utf-8'))
+                if number % flush_rows == 0:
+                    data = spool.take()
+                    if data:
+                        yield data
+            sheet.write(XLSX_SHEET_END.encode('utf-8'))
+    yield spool.take()
+
+
+def export_response(name, file_format='csv', queryset=None, **filters):
+    """
+    Builds the response sending an export as an attachment.
+
+    :param name: (string) Name of the export, a key of EXPORTS
+    :param file_format: (string) Either 'csv' or 'xlsx'
+    :param queryset: (QuerySet) Rows to start from, defaults to all
+    :param filters: Optional faculty, level, date_from and date_to, see filter_rows
+    :raises: ExportError
+    :return: The response
+    :rtype: StreamingHttpResponse
+    """
+    if name not in EXPORTS or file_format not in ('csv', 'xlsx'):
+        raise ExportError('Unknown export {}.{}'.format(name, file_format))
+    rows = export_rows(name, filter_rows(name, queryset, **filters))
+    if file_format == 'xlsx':
+        response = StreamingHttpResponse(stream_xlsx(rows), content_type=XLSX_CONTENT_TYPE)
+    else:
+        response = StreamingHttpResponse(stream_csv(rows), content_type='text/csv')
+    response['Content-Disposition'] = 'attachment; filename="{}-{}.{}"'.format(
+        name, timezone.localtime(timezone.now()).strftime('%Y%m%d'), file_format)
+    return response
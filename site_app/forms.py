@@ -3,7 +3,10 @@ from django import forms
 from django.contrib.auth.forms import ReadOnlyPasswordHashField, AuthenticationForm
 from site_app.models import User, Faculty, Topic, Thesis, Review, Defense
 from crispy_forms.helper import FormHelper
+from django.urls import reverse
+from django.utils.html import conditional_escape
 from . import models
+from . import roles
 
 
 class FacultyCreationForm(forms.ModelForm):
@@ -27,7 +30,8 @@ class TopicCreationForm(forms.ModelForm):
 class TopicChangeForm(forms.ModelForm):
     class Meta:
         model = Topic
-        fields = ('name', 'student', 'supervisor', 'short_description', 'level', 'voted_for', 'available', 'checked')
+        fields = ('name', 'student', 'supervisor', 'short_description', 'level', 'voted_for', 'available', 'checked',
+                  'similar_to')
 
 
 class UserCreationForm(forms.ModelForm):
@@ -112,44 +116,138 @@ class ThesisChangeForm(forms.ModelForm):
         fields = ('supervisor', 'student', 'topic', 'finished')
 
 
+class ProtectedFileInput(forms.ClearableFileInput):
+    """
+    File input linking the current file to the protected download view of its object, since uploaded files are not
+    served from MEDIA_URL.
+    """
+
+    def __init__(self, url_name, attrs=None):
+        """
+        :param url_name: (string) Name of the download view, taking the ID of the object
+        :param attrs: (dict) HTML attributes of the input
+        """
+        super(ProtectedFileInput, self).__init__(attrs)
+        self.url_name = url_name
+
+    def get_template_substitution_values(self, value):
+        return {
+            'initial': conditional_escape(value),
+            'initial_url': conditional_escape(reverse(self.url_name, args=[value.instance.pk])),
+        }
+
+
 class ReviewCreationForm(forms.ModelForm):
     class Meta:
         model = Review
         fields = ('author', 'thesis', 'file', 'finished_date')
+        widgets = {'file': ProtectedFileInput('review_file')}
 
 
 class ReviewChangeForm(forms.ModelForm):
     class Meta:
         model = Review
         fields = ('author', 'thesis', 'file', 'finished_date')
+        widgets = {'file': ProtectedFileInput('review_file')}
 
 
 class DefenseCreationForm(forms.ModelForm):
     class Meta:
         model = Defense
-        fields = ('thesis', 'date', 'successful', 'second_defense')
+        fields = ('thesis', 'date', 'room', 'scheduled', 'successful', 'second_defense')
 
 
 class DefenseChangeForm(forms.ModelForm):
     class Meta:
         model = Defense
-        fields = ('thesis', 'date', 'successful', 'second_defense')
+        fields = ('thesis', 'date', 'room', 'scheduled', 'successful', 'second_defense')
 
 
 class StudentTopicProposalForm(forms.Form):
     name = forms.CharField(max_length=100)
-    supervisor = forms.ChoiceField(choices=[(supervisor.id, supervisor.__str__()) for supervisor in
-                                            models.User.objects.filter(groups__name='Supervisor')])
+    supervisor = forms.ChoiceField()
     description = forms.CharField(widget=forms.Textarea)
 
     def __init__(self, *args, **kwargs):
         super(StudentTopicProposalForm, self).__init__(*args, **kwargs)
+        self.fields['supervisor'].choices = roles.get_supervisor_choices()
         self.helper = FormHelper(self)
         self.helper.form_method = 'post'
         self.helper.add_input(Submit('submit', 'Submit', css_class='btn btn-primary btn-lg btn-block'))
         self.helper.add_input(Button('cancel', 'Cancel', css_class='btn btn-default btn-lg btn-block'))
 
 
+class TopicFilterForm(forms.Form):
+    """
+    Form filtering the list of available topics. Consists of attributes:
+        q, level, supervisor
+    """
+    q = forms.CharField(required=False, max_length=200, label='Search',
+                        widget=forms.TextInput(attrs={'placeholder': 'Search topics'}))
+    level = forms.ChoiceField(choices=[('', 'Any level')] + list(models.LEVELS), required=False)
+    supervisor = forms.TypedChoiceField(coerce=int, empty_value=None, required=False)
+
+    def __init__(self, *args, **kwargs):
+        super(TopicFilterForm, self).__init__(*args, **kwargs)
+        self.fields['supervisor'].choices = [('', 'Any supervisor')] + roles.get_supervisor_choices()
+        self.helper = FormHelper(self)
+        self.helper.form_method = 'get'
+        self.helper.form_class = 'form-inline'
+        self.helper.field_template = 'bootstrap3/layout/inline_field.html'
+        self.helper.add_input(Submit('filter', 'Filter', css_class='btn btn-default'))
+
+
+class ChunkedUploadStartForm(forms.Form):
+    """
+    Form starting a chunked upload of a thesis or review file. Consists of attributes:
+        kind, object_id, filename, size, sha256
+    """
+    kind = forms.ChoiceField(choices=models.ChunkedUpload.KINDS)
+    object_id = forms.IntegerField(min_value=1)
+    filename = forms.CharField(max_length=255)
+    size = forms.IntegerField(min_value=1)
+    sha256 = forms.RegexField(regex=r'^[0-9a-fA-F]{64}$', required=False)
+
+
+class RosterImportForm(forms.Form):
+    """
+    Form of the administration site for importing a roster of users. Consists of attributes:
+        roster, groups
+    """
+    roster = forms.FileField(help_text='CSV or XLSX file with columns email, index_number, first_name, last_name, '
+                                       'degree, faculty, department, password and groups')
+    groups = forms.ModelMultipleChoiceField(queryset=models.Group.objects.all(), required=False,
+                                            help_text='Groups every imported user is added to')
+
+
+class StatisticsFilterForm(forms.Form):
+    """
+    Form of the administration site limiting the statistics dashboard to a level or faculty. Consists of attributes:
+        level, faculty
+    """
+    level = forms.ChoiceField(choices=[('', 'Any level')] + list(models.LEVELS), required=False)
+    faculty = forms.ModelChoiceField(queryset=models.Faculty.objects.all(), required=False, empty_label='Any faculty')
+
+
+class ExportFilterForm(forms.Form):
+    """
+    Form selecting the rows and the format of an export of theses, reviews or defenses. Consists of attributes:
+        format, faculty, level, date_from, date_to
+    """
+    format = forms.ChoiceField(choices=[('csv', 'CSV'), ('xlsx', 'XLSX')], required=False)
+    faculty = forms.ModelChoiceField(queryset=models.Faculty.objects.all(), required=False)
+    level = forms.ChoiceField(choices=[('', 'Any level')] + list(models.LEVELS), required=False)
+    date_from = forms.DateField(required=False)
+    date_to = forms.DateField(required=False)
+
+    def clean(self):
+        cleaned_data = super(ExportFilterForm, self).clean()
+        if cleaned_data.get('date_from') and cleaned_data.get('date_to') and \
+                cleaned_data['date_from'] > cleaned_data['date_to']:
+            raise forms.ValidationError('The range of dates ends before it starts')
+        return cleaned_data
+
+
 class LoginForm(AuthenticationForm):
     def __init__(self, *args, **kwargs):
         super(LoginForm, self).__init__(*args, **kwargs)
@@ -0,0 +1,231 @@
+"""
+Background job queue. Work that does not have to finish within a request, e.g. post-processing of uploaded files, is
+stored as Job rows and run by the run_jobs management command, which claims the due jobs in batches and runs them in
+a pool of worker processes. Jobs of higher priority are claimed first. A failed job is retried with exponential
+backoff until JOB_QUEUE_MAX_ATTEMPTS is reached, unless its handler raises JobError, which fails it at once.
+
+Handlers are functions registered under the kind of their jobs with the handler decorator and called with the
+arguments of the job. The jobs of the uploaded files are:
+
+* verify_file checks that the stored content of a thesis or review file still matches its SHA-256 digest,
+* screen_thesis extracts the text of a thesis file and screens it for plagiarism.
+"""
+import hashlib
+import json
+import uuid
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from .models import Job, Thesis, Review, StoredFile
+from . import plagiarism
+
+# Time a worker may spend on a claimed batch before other workers may claim its jobs again
+CLAIM_LEASE = timedelta(minutes=30)
+READ_SIZE = 64 * 1024
+# Priorities of the file jobs, screening results are awaited by the reviewers
+SCREEN_PRIORITY = 10
+VERIFY_PRIORITY = 0
+
+HANDLERS = {}
+
+
+class JobError(Exception):
+    """
+    Error of a job that would fail again if retried.
+    """
+
+
+def handler(kind):
+    """
+    Registers the decorated function as the handler of jobs of given kind.
+
+    :param kind: (string) Kind of the jobs
+    :return: The decorator
+    :rtype: callable
+    """
+    def register(function):
+        HANDLERS[kind] = function
+        return function
+
+    return register
+
+
+def enqueue(kind, priority=0, delay=None, **arguments):
+    """
+    Adds a job to the queue, unless the same job is already waiting.
+
+    :param kind: (string) Kind of the job, the name of its handler
+    :param priority: (int) Priority of the job, higher runs first
+    :param delay: (timedelta) Time to wait before the job may run
+    :param arguments: Arguments passed to the handler, they have to be JSON serializable
+    :return: The queued job
+    :rtype: Job
+    """
+    if kind not in HANDLERS:
+        raise ValueError('Unknown job kind {}'.format(kind))
+    encoded = json.dumps(arguments, sort_keys=True)
+    waiting = Job.objects.filter(kind=kind, arguments=encoded, status=Job.STATUSES.queued).first()
+    if waiting is not None:
+        return waiting
+    return Job.objects.create(kind=kind, arguments=encoded, priority=priority,
+                              next_attempt=timezone.now() + (delay or timedelta()))
+
+
+def enqueue_file_jobs(obj):
+    """
+    Queues the post-processing of the file of a thesis or review.
+
+    :param obj: (Thesis or Review) The object whose file was uploaded
+    """
+    if isinstance(obj, Thesis):
+        enqueue('screen_thesis', priority=SCREEN_PRIORITY, thesis_id=obj.pk)
+    enqueue('verify_file', priority=VERIFY_PRIORITY, model=obj._meta.model_name, object_id=obj.pk)
+
+
+def claim_batch(batch_size, now=None):
+    """
+    Claims the jobs due to run, so that no other worker runs them at the same time. Jobs claimed by a worker which did
+    not finish within CLAIM_LEASE are claimed again.
+
+    :param batch_size: (int) Maximal number of claimed jobs
+    :param now: (datetime) The current moment, defaults to now
+    :return: IDs of the claimed jobs, the highest priority first
+    :rtype: list
+    """
+    now = now or timezone.now()
+    due = Job.objects.filter(Q(status=Job.STATUSES.queued) | Q(status=Job.STATUSES.running), next_attempt__lte=now)
+    ids = list(due.order_by('-priority', 'next_attempt', 'id').values_list('id', flat=True)[:batch_size])
+    claim = uuid.uuid4().hex
+    due.filter(id__in=ids).update(status=Job.STATUSES.running, claim=claim, next_attempt=now + CLAIM_LEASE)
+    return list(Job.objects.filter(claim=claim, status=Job.STATUSES.running).order_by('-priority', 'id')
+                .values_list('id', flat=True))
+
+
+def run_job(job_id):
+    """
+    Runs a claimed job and records its outcome. Called in the worker processes.
+
+    :param job_id: (int) ID of the job
+    :return: Indicator whether the job succeeded
+    :rtype: bool
+    """
+    job = Job.objects.get(pk=job_id)
+    try:
+        function = HANDLERS.get(job.kind)
+        if function is None:
+            raise JobError('Unknown job kind {}'.format(job.kind))
+        function(**json.loads(job.arguments))
+    except Exception as e:
+        schedule_retry(job, e)
+        return False
+    Job.objects.filter(pk=job.pk).update(status=Job.STATUSES.done, finished=timezone.now(), attempts=job.attempts + 1,
+                                         claim='')
+    return True
+
+
+def run_batch(batch_size=None, executor=None):
+    """
+    Runs a batch of due jobs.
+
+    :param batch_size: (int) Maximal number of jobs, defaults to JOB_QUEUE_BATCH_SIZE
+    :param executor: (Executor) Pool of worker processes running the jobs, None runs them in this process
+    :return: Numbers of succeeded and failed jobs
+    :rtype: tuple
+    """
+    ids = claim_batch(batch_size or settings.JOB_QUEUE_BATCH_SIZE)
+    if not ids:
+        return 0, 0
+    if executor is None:
+        results = [run_job(job_id) for job_id in ids]
+    else:
+        # Worker processes forked by the pool must not share the database connections of this process
+        connections.close_all()
+        results = list(executor.map(run_job, ids))
+    succeeded = sum(results)
+    return succeeded, len(results) - succeeded
+
+
+def schedule_retry(job, error):
+    """
+    Returns a failed job to the queue, delaying the next attempt exponentially, or marks it as failed after
+    JOB_QUEUE_MAX_ATTEMPTS attempts or a JobError.
+
+    :param job: (Job) The job
+    :param error: (Exception) The error raised by the job
+    """
+    attempts = job.attempts + 1
+    if attempts >= settings.JOB_QUEUE_MAX_ATTEMPTS or isinstance(error, JobError):
+        status, next_attempt, finished = Job.STATUSES.failed, job.next_attempt, timezone.now()
+    else:
+        delay = timedelta(seconds=settings.JOB_QUEUE_RETRY_DELAY * 2 ** (attempts - 1))
+        status, next_attempt, finished = Job.STATUSES.queued, timezone.now() + delay, None
+    Job.objects.filter(pk=job.pk).update(status=status, attempts=attempts, next_attempt=next_attempt,
+                                         finished=finished, last_error=repr(error), claim='')
+
+
+def queue_depth():
+    """
+    Counts the jobs waiting, running and failed, by kind.
+
+    :return: Dictionary of kind to a dictionary of status to the number of jobs
+    :rtype: dict
+    """
+    depth = defaultdict(dict)
+    counts = Job.objects.exclude(status=Job.STATUSES.done).values('kind', 'status').annotate(count=Count('id'))
+    for row in counts.order_by('kind', 'status'):
+        depth[row['kind']][row['status']] = row['count']
+    return dict(depth)
+
+
+def clear_finished(older_than):
+    """
+    Deletes the jobs that succeeded before given moment.
+
+    :param older_than: (datetime) The moment
+    :return: Number of deleted jobs
+    :rtype: int
+    """
+    return Job.objects.filter(status=Job.STATUSES.done, finished__lt=older_than).delete()[0]
+
+
+@handler('verify_file')
+def verify_file(model, object_id):
+    """
+    Checks that the stored content of a file matches the digest it was stored under.
+
+    :param model: (string) Either 'thesis' or 'review'
+    :param object_id: (int) ID of the thesis or review
+    :raises: JobError
+    """
+    model = Thesis if model == 'thesis' else Review
+    obj = model.objects.filter(pk=object_id).only('id', 'file').first()
+    if obj is None or not obj.file:
+        return
+    stored = StoredFile.objects.filter(name=obj.file.name).first()
+    if stored is None:
+        # Files saved before the content-addressed storage have no digest
+        return
+    hasher = hashlib.sha256()
+    with obj.file.storage.open(obj.file.name, 'rb') as f:
+        for data in iter(lambda: f.read(READ_SIZE), b''):
+            hasher.update(data)
+    if hasher.hexdigest() != stored.blob_id:
+        raise JobError('Stored content of {} does not match its digest'.format(obj.file.name))
+
+
+@handler('screen_thesis')
+def screen_thesis(thesis_id):
+    """
+    Screens the current file of a thesis for plagiarism. The job is queued for every upload, also of a file with the
+    name of the screened one, so the file is screened whether it looks pending or not.
+
+    :param thesis_id: (int) ID of the thesis
+    """
+    thesis = Thesis.objects.filter(pk=thesis_id).exclude(file='').only('id', 'file').first()
+    if thesis is not None and thesis.file:
+        plagiarism.screen_thesis(thesis)
@@ -0,0 +1,165 @@
+"""
+Outbound e-mail queue. Messages are stored as QueuedMail rows instead of being sent inside requests, either through
+User.email_user or through QueuedEmailBackend, which queues everything sent with Django's mail functions when it is
+configured as EMAIL_BACKEND. The send_queued_mail management command drains the queue in batches, delivering every
+batch over a single connection of MAIL_QUEUE_BACKEND. Failed messages, including those the backend did not accept,
+are retried with exponential backoff until MAIL_QUEUE_MAX_ATTEMPTS is reached.
+
+QueuedEmailBackend stores the serialized MIME message next to its subject, body and recipients, so that attachments,
+Reply-To and other headers and every alternative body are sent exactly as they were composed.
+"""
+import email
+import email.message
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, EmailMultiAlternatives, get_connection
+from django.core.mail.backends.base import BaseEmailBackend
+from django.core.mail.message import MIMEMixin
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import QueuedMail
+
+# Time a worker may spend on a claimed batch before other workers may claim its messages again
+CLAIM_LEASE = timedelta(minutes=10)
+
+
+class QueuedEmailBackend(BaseEmailBackend):
+    """
+    E-mail backend adding the messages to the outbound queue instead of sending them.
+    """
+
+    def send_messages(self, email_messages):
+        queued = []
+        for message in email_messages:
+            html = [content for content, mimetype in getattr(message, 'alternatives', []) if mimetype == 'text/html']
+            queued.append(QueuedMail(subject=message.subject, body=message.body, html_body=html[0] if html else '',
+                                     from_email=message.from_email, to='\n'.join(message.to),
+                                     cc='\n'.join(message.cc), bcc='\n'.join(message.bcc),
+                                     mime=message.message().as_bytes()))
+        QueuedMail.objects.bulk_create(queued)
+        return len(queued)
+
+
+class MIMEMessage(MIMEMixin, email.message.Message):
+    """
+    Parsed MIME message, which can be flattened with the line separators required by the SMTP backend.
+    """
+
+
+class StoredMessage(EmailMessage):
+    """
+    E-mail message sent as it was serialized when it was queued.
+    """
+
+    def __init__(self, mime, **kwargs):
+        super(StoredMessage, self).__init__(**kwargs)
+        self.mime = mime
+
+    def message(self):
+        return email.message_from_bytes(self.mime, _class=MIMEMessage)
+
+
+def _split(addresses):
+    return [address for address in addresses.split('\n') if address]
+
+
+def to_message(mail, connection):
+    """
+    Creates the e-mail message of a queued mail.
+
+    :param mail: (QueuedMail) The queued mail
+    :param connection: Connection of the e-mail backend used to send the message
+    :return: The message
+    :rtype: EmailMessage
+    """
+    if mail.mime:
+        return StoredMessage(bytes(mail.mime), subject=mail.subject, body=mail.body, from_email=mail.from_email,
+                             to=_split(mail.to), cc=_split(mail.cc), bcc=_split(mail.bcc), connection=connection)
+    message = EmailMultiAlternatives(mail.subject, mail.body, mail.from_email, _split(mail.to), _split(mail.bcc),
+                                     connection=connection, cc=_split(mail.cc))
+    if mail.html_body:
+        message.attach_alternative(mail.html_body, 'text/html')
+    return message
+
+
+def claim_batch(batch_size, now=None):
+    """
+    Claims the messages due for delivery, so that no other worker sends them at the same time. Messages claimed by a
+    worker which did not finish within CLAIM_LEASE are claimed again.
+
+    :param batch_size: (int) Maximal number of claimed messages
+    :param now: (datetime) The current moment, defaults to now
+    :return: The claimed messages
+    :rtype: list
+    """
+    now = now or timezone.now()
+    due = QueuedMail.objects.filter(Q(status=QueuedMail.STATUSES.queued) | Q(status=QueuedMail.STATUSES.sending),
+                                    next_attempt__lte=now)
+    ids = list(due.order_by('next_attempt').values_list('id', flat=True)[:batch_size])
+    claim = uuid.uuid4().hex
+    due.filter(id__in=ids).update(status=QueuedMail.STATUSES.sending, claim=claim, next_attempt=now + CLAIM_LEASE)
+    return list(QueuedMail.objects.filter(claim=claim, status=QueuedMail.STATUSES.sending))
+
+
+def send_batch(batch_size=None, connection=None):
+    """
+    Sends a batch of queued messages over a single connection.
+
+    :param batch_size: (int) Maximal number of sent messages, defaults to MAIL_QUEUE_BATCH_SIZE
+    :param connection: Connection of the e-mail backend, defaults to a connection of MAIL_QUEUE_BACKEND
+    :return: Numbers of sent and failed messages
+    :rtype: tuple
+    """
+    batch = claim_batch(batch_size or settings.MAIL_QUEUE_BATCH_SIZE)
+    if not batch:
+        return 0, 0
+    connection = connection or get_connection(settings.MAIL_QUEUE_BACKEND)
+    try:
+        connection.open()
+    except Exception as e:
+        for mail in batch:
+            schedule_retry(mail, e)
+        return 0, len(batch)
+    sent = failed = 0
+    try:
+        for mail in batch:
+            try:
+                if not to_message(mail, connection).send():
+                    raise IOError('The message was not accepted by the e-mail backend')
+            except Exception as e:
+                failed += 1
+                schedule_retry(mail, e)
+                # The connection may be broken, it is opened again for the remaining messages
+                connection.close()
+                try:
+                    connection.open()
+                except Exception:
+                    pass
+            else:
+                sent += 1
+                QueuedMail.objects.filter(pk=mail.pk).update(status=QueuedMail.STATUSES.sent, sent=timezone.now(),
+                                                             attempts=mail.attempts + 1, claim='')
+    finally:
+        connection.close()
+    return sent, failed
+
+
+def schedule_retry(mail, error):
+    """
+    Returns a message that could not be sent to the queue, delaying the next attempt exponentially, or marks it as
+    failed after MAIL_QUEUE_MAX_ATTEMPTS attempts.
+
+    :param mail: (QueuedMail) The message
+    :param error: (Exception) The error raised while sending the message
+    """
+    attempts = mail.attempts + 1
+    if attempts >= settings.MAIL_QUEUE_MAX_ATTEMPTS:
+        status, next_attempt = QueuedMail.STATUSES.failed, mail.next_attempt
+    else:
+        delay = timedelta(seconds=settings.MAIL_QUEUE_RETRY_DELAY * 2 ** (attempts - 1))
+        status, next_attempt = QueuedMail.STATUSES.queued, timezone.now() + delay
+    QueuedMail.objects.filter(pk=mail.pk).update(status=status, attempts=attempts, next_attempt=next_attempt,
+                                                 last_error=repr(error), claim='')
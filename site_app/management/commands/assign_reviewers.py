@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from site_app import assignment
+
+
+class Command(BaseCommand):
+    help = 'Assigns reviewers to finished theses without a review, balancing the load of the reviewers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only show the assignment')
+
+    def handle(self, *args, **options):
+        try:
+            plan = assignment.plan_assignment()
+        except assignment.AssignmentError as e:
+            raise CommandError(e)
+        for line in assignment.describe(plan):
+            self.stdout.write(line)
+        if options['dry_run']:
+            self.stdout.write('Would create {} reviews'.format(len(plan)))
+            return
+        reviews = assignment.apply_assignment(plan)
+        self.stdout.write('Created {} reviews'.format(len(reviews)))
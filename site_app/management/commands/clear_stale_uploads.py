@@ -0,0 +1,19 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from site_app import uploads
+
+
+class Command(BaseCommand):
+    help = 'Deletes unfinished chunked uploads and their partial files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int, default=settings.CHUNKED_UPLOAD_EXPIRY_HOURS,
+                            help='Delete uploads started more than this many hours ago')
+
+    def handle(self, *args, **options):
+        count = uploads.clear_stale_uploads(timezone.now() - timedelta(hours=options['hours']))
+        self.stdout.write('Deleted {} stale uploads'.format(count))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from site_app import similarity
+from site_app.models import Topic
+
+
+class Command(BaseCommand):
+    help = 'Groups existing topics into clusters of likely duplicates'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threshold', type=float, default=None,
+                            help='Minimal estimated similarity, defaults to TOPIC_DUPLICATE_THRESHOLD')
+        parser.add_argument('--reindex', action='store_true', help='Recompute the signatures of all topics first')
+        parser.add_argument('--batch-size', type=int, default=500, help='Number of topics indexed at once')
+
+    def handle(self, *args, **options):
+        if options['reindex']:
+            topics = Topic.objects.only('id', 'name', 'short_description').order_by('id')
+            batch = []
+            for topic in topics.iterator():
+                batch.append(topic)
+                if len(batch) == options['batch_size']:
+                    similarity.index_topics(batch)
+                    batch = []
+            similarity.index_topics(batch)
+        clusters = similarity.cluster_topics(options['threshold'])
+        names = Topic.objects.in_bulk([topic_id for cluster in clusters for topic_id in cluster])
+        for cluster in clusters:
+            self.stdout.write(' | '.join('#{} {}'.format(topic_id, names[topic_id].name) for topic_id in cluster))
+        self.stdout.write('Found {} clusters of likely duplicates'.format(len(clusters)))
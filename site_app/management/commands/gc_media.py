@@ -0,0 +1,21 @@
+from datetime import timedelta
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from site_app import storage
+
+
+class Command(BaseCommand):
+    help = 'Removes stored files and blobs no longer referenced by any thesis or review'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace-hours', type=int, default=1,
+                            help='Keep files and blobs stored less than this many hours ago')
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would be removed')
+
+    def handle(self, *args, **options):
+        files, blobs, freed = storage.collect_garbage(default_storage, timedelta(hours=options['grace_hours']),
+                                                      dry_run=options['dry_run'])
+        verb = 'Would remove' if options['dry_run'] else 'Removed'
+        self.stdout.write('{} {} files and {} blobs, {} bytes'.format(verb, files, blobs, freed))
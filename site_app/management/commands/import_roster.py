@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from site_app import roster
+
+
+class Command(BaseCommand):
+    help = 'Creates or updates users listed in a CSV or XLSX roster'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Path of the roster file')
+        parser.add_argument('--group', action='append', default=[], dest='groups',
+                            help='Name of a group every imported user is added to, may be repeated')
+        parser.add_argument('--batch-size', type=int, default=500, help='Number of rows written in one transaction')
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Number of processes hashing passwords, defaults to the number of CPUs')
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['path'], 'rb') as f:
+                result = roster.import_roster(f, options['path'], options['batch_size'], options['workers'],
+                                              options['groups'])
+        except (OSError, roster.RosterError) as e:
+            raise CommandError(e)
+        for line, message in result.errors:
+            self.stderr.write('Line {}: {}'.format(line, message))
+        self.stdout.write(str(result))
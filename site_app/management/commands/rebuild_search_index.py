@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from site_app import search
+
+
+class Command(BaseCommand):
+    help = 'Recreates the full-text index of topics and its triggers and reindexes all topics'
+
+    def handle(self, *args, **options):
+        if search.create_index():
+            self.stdout.write('Search index rebuilt')
+        else:
+            self.stdout.write('The database does not support the search index, topics are searched without it')
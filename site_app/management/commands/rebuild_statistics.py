@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+
+from site_app import statistics
+
+
+class Command(BaseCommand):
+    help = 'Recounts all topics, theses, reviews and defenses and replaces the counters of the statistics dashboard'
+
+    def handle(self, *args, **options):
+        self.stdout.write('Stored {} counters'.format(statistics.rebuild()))
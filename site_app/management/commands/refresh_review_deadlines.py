@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+
+from site_app.models import Review
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the stored review deadlines, e.g. after REVIEW_PERIOD_DAYS was changed'
+
+    def handle(self, *args, **options):
+        self.stdout.write('Updated {} reviews'.format(Review.objects.all().refresh_deadlines()))
@@ -0,0 +1,36 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from site_app import benchmarks
+
+
+class Command(BaseCommand):
+    help = 'Measures the latency, throughput and query counts of the main views and saves the results as JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=50, help='Number of measured requests of every scenario')
+        parser.add_argument('--concurrency', type=int, default=1, help='Number of threads sending the requests')
+        parser.add_argument('--warmup', type=int, default=5,
+                            help='Number of requests sent before the measurement of every scenario')
+        parser.add_argument('--scenario', action='append', dest='names', metavar='NAME',
+                            help='Run only the named scenario, can be repeated')
+        parser.add_argument('--password', default=benchmarks.SEED_PASSWORD, help='Password of the seeded users')
+        parser.add_argument('--output', help='File the results are saved to')
+        parser.add_argument('--compare', metavar='FILE', help='Results of an earlier run to compare with')
+
+    def handle(self, *args, **options):
+        def log(result):
+            self.stdout.write('{name}: p50 {p50_ms:.1f} ms, p95 {p95_ms:.1f} ms, p99 {p99_ms:.1f} ms, '
+                              '{throughput_rps:.1f} requests/s, {queries_min}-{queries_max} queries, '
+                              '{errors} errors'.format(**result))
+
+        results = benchmarks.run(options['requests'], options['concurrency'], options['warmup'], options['names'],
+                                 options['password'], log=log)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2)
+        if options['compare']:
+            with open(options['compare']) as f:
+                for line in benchmarks.compare(json.load(f), results):
+                    self.stdout.write(line)
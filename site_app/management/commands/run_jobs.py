@@ -0,0 +1,53 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from site_app import jobs
+
+
+class Command(BaseCommand):
+    help = 'Runs the queued background jobs in a pool of worker processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=getattr(settings, 'JOB_QUEUE_WORKERS', None) or
+                            os.cpu_count() or 1, help='Number of worker processes, 0 runs the jobs in this process')
+        parser.add_argument('--batch-size', type=int, default=settings.JOB_QUEUE_BATCH_SIZE,
+                            help='Number of jobs claimed at once')
+        parser.add_argument('--loop', action='store_true', help='Keep running new jobs until interrupted')
+        parser.add_argument('--interval', type=float, default=2.0,
+                            help='Seconds to wait when the queue is empty, used with --loop')
+        parser.add_argument('--status', action='store_true', help='Only print the number of jobs by kind and status')
+        parser.add_argument('--clear-done', type=int, default=None, metavar='DAYS',
+                            help='Delete the jobs that succeeded more than DAYS days ago before running')
+
+    def handle(self, *args, **options):
+        if options['status']:
+            for kind, statuses in sorted(jobs.queue_depth().items()):
+                self.stdout.write('{}: {}'.format(kind, ', '.join('{} {}'.format(count, status)
+                                                                   for status, count in sorted(statuses.items()))))
+            return
+        if options['clear_done'] is not None:
+            cleared = jobs.clear_finished(timezone.now() - timedelta(days=options['clear_done']))
+            self.stdout.write('Deleted {} finished jobs'.format(cleared))
+
+        executor = ProcessPoolExecutor(options['workers']) if options['workers'] > 0 else None
+        total_done = total_failed = 0
+        try:
+            while True:
+                done, failed = jobs.run_batch(options['batch_size'], executor)
+                total_done, total_failed = total_done + done, total_failed + failed
+                if done or failed:
+                    self.stdout.write('Done {}, failed {}'.format(done, failed))
+                    continue
+                if not options['loop']:
+                    break
+                time.sleep(options['interval'])
+        finally:
+            if executor is not None:
+                executor.shutdown()
+        self.stdout.write('Done {} jobs, {} failed attempts'.format(total_done, total_failed))
@@ -0,0 +1,51 @@
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from site_app import scheduling
+from site_app.models import Defense
+
+
+def parse_date(value):
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+
+def parse_time(value):
+    return datetime.strptime(value, '%H:%M').time()
+
+
+class Command(BaseCommand):
+    help = ('Schedules the unsuccessful defenses that are not scheduled yet without conflicts of their students, '
+            'supervisors and reviewers')
+
+    def add_arguments(self, parser):
+        parser.add_argument('first_day', type=parse_date, help='First day of the defenses, YYYY-MM-DD')
+        parser.add_argument('--days', type=int, default=5, help='Number of working days')
+        parser.add_argument('--day-start', type=parse_time, default=parse_time('09:00'), help='HH:MM')
+        parser.add_argument('--day-end', type=parse_time, default=parse_time('17:00'), help='HH:MM')
+        parser.add_argument('--duration', type=int, default=30, help='Length of a defense in minutes')
+        parser.add_argument('--rooms', required=True, help='Comma separated names of the rooms')
+        parser.add_argument('--dry-run', action='store_true', help='Only show the schedule')
+        parser.add_argument('--export', help='Path of a CSV file the schedule is written to')
+
+    def handle(self, *args, **options):
+        rooms = [room.strip() for room in options['rooms'].split(',') if room.strip()]
+        periods = scheduling.generate_periods(options['first_day'], options['days'], options['day_start'],
+                                              options['day_end'], timedelta(minutes=options['duration']))
+        if not rooms or not periods:
+            raise CommandError('There are no slots to schedule the defenses in')
+        defenses = Defense.objects.filter(successful=False, scheduled=False)
+        schedule = scheduling.plan_schedule(defenses, periods, rooms, timedelta(minutes=options['duration']))
+        for defense_id, (date, room) in sorted(schedule.slots.items(), key=lambda item: item[1]):
+            self.stdout.write('{} {}: defense #{}'.format(timezone.localtime(date).strftime('%Y-%m-%d %H:%M'), room,
+                                                          defense_id))
+        for defense_id in schedule.unscheduled:
+            self.stderr.write('No slot for defense #{}'.format(defense_id))
+        if options['dry_run']:
+            self.stdout.write('Would schedule {} defenses'.format(len(schedule)))
+            return
+        self.stdout.write('Scheduled {} defenses'.format(scheduling.apply_schedule(schedule)))
+        if options['export']:
+            with open(options['export'], 'w', newline='') as f:
+                scheduling.export_csv(Defense.objects.filter(pk__in=list(schedule.slots)), f)
@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from site_app import plagiarism
+
+
+class Command(BaseCommand):
+    help = 'Screens the newly uploaded thesis files for plagiarism against the archive'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=None, help='Maximal number of theses screened in one run')
+        parser.add_argument('--loop', action='store_true', help='Keep screening new uploads until interrupted')
+        parser.add_argument('--interval', type=float, default=60.0,
+                            help='Seconds to wait when no thesis is waiting, used with --loop')
+
+    def handle(self, *args, **options):
+        total = 0
+        while True:
+            screened = plagiarism.screen_pending(options['limit'])
+            total += screened
+            if screened and options['loop']:
+                self.stdout.write('Screened {} theses'.format(screened))
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+        self.stdout.write('Screened {} theses'.format(total))
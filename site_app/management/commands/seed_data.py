@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from site_app import benchmarks
+
+
+class Command(BaseCommand):
+    help = 'Generates synthetic users, topics, theses, reviews and defenses for benchmarks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, default=1000,
+                            help='Number of generated students, the numbers of the other rows are derived from it')
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='Number of students whose rows are inserted in one transaction')
+        parser.add_argument('--password', default=benchmarks.SEED_PASSWORD, help='Password of the generated users')
+        parser.add_argument('--seed', type=int, default=0, help='Seed of the generated values')
+        parser.add_argument('--no-index', action='store_false', dest='index',
+                            help='Leave the generated topics out of the similarity index, which is much faster')
+
+    def handle(self, *args, **options):
+        created = benchmarks.seed(options['students'], options['batch_size'], options['password'], options['index'],
+                                  options['seed'], log=self.stdout.write)
+        self.stdout.write('Created {}'.format(', '.join('{} {}'.format(number, name)
+                                                        for name, number in created.items())))
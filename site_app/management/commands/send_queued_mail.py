@@ -0,0 +1,30 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from site_app import mail
+
+
+class Command(BaseCommand):
+    help = 'Sends the queued e-mail in batches, reusing one connection per batch'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=settings.MAIL_QUEUE_BATCH_SIZE,
+                            help='Number of messages sent over one connection')
+        parser.add_argument('--loop', action='store_true', help='Keep draining the queue until interrupted')
+        parser.add_argument('--interval', type=float, default=5.0,
+                            help='Seconds to wait when the queue is empty, used with --loop')
+
+    def handle(self, *args, **options):
+        total_sent = total_failed = 0
+        while True:
+            sent, failed = mail.send_batch(options['batch_size'])
+            total_sent, total_failed = total_sent + sent, total_failed + failed
+            if sent or failed:
+                self.stdout.write('Sent {}, failed {}'.format(sent, failed))
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+        self.stdout.write('Sent {} messages, {} failed attempts'.format(total_sent, total_failed))
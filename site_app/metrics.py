@@ -0,0 +1,333 @@
+"""
+Performance metrics of the requests. The MetricsMiddleware measures for every request its total time, the number and
+time of its SQL queries and the time spent rendering templates, and adds them to the response as a Server-Timing
+header, which browsers show in their developer tools. Every request is also logged to the site_app.metrics logger as
+a line of JSON with the name of its view.
+
+Queries are timed by a cursor wrapper installed on the database connections, and templates by the TimedDjangoTemplates
+backend, which has to be the backend of the TEMPLATES setting. Templates rendered while another one is rendered, e.g.
+forms in a page, are counted once as part of the outer one, and queries run by a template count in both times.
+
+The measurements are aggregated into histograms by view, served to administrators at /metrics in the Prometheus text
+format. Every worker process collects its measurements in memory and adds them to MetricCounter rows every
+METRICS_FLUSH_INTERVAL seconds. The rows are increased by the database, which keeps concurrent additions of several
+workers, so the endpoint reports all of them. Times of streaming responses do not include sending their content.
+"""
+import json
+import logging
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from django.conf import settings
+from django.db import IntegrityError, connections, transaction
+from django.db.models import F
+from django.template import TemplateDoesNotExist
+from django.template.backends.django import DjangoTemplates, Template, reraise
+
+from .models import MetricCounter
+
+logger = logging.getLogger(__name__)
+
+UNRESOLVED = 'unresolved'
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+# Name, help and whether the observed values are durations, stored in microseconds
+HISTOGRAMS = OrderedDict([
+    ('duration', ('diplomatool_request_duration_seconds', 'Time spent handling requests', True)),
+    ('sql', ('diplomatool_request_sql_seconds', 'Time spent running SQL queries per request', True)),
+    ('template', ('diplomatool_request_template_seconds', 'Time spent rendering templates per request', True)),
+    ('queries', ('diplomatool_request_sql_queries', 'Number of SQL queries per request', False)),
+])
+
+_local = threading.local()
+_lock = threading.Lock()
+_pending = Counter()
+_last_flush = [time.time()]
+
+
+def flush_interval():
+    """
+    Gets the time measurements are collected for before they are added to the shared counters, configured by the
+    METRICS_FLUSH_INTERVAL setting.
+
+    :return: Number of seconds
+    :rtype: float
+    """
+    return getattr(settings, 'METRICS_FLUSH_INTERVAL', 10)
+
+
+def duration_buckets():
+    """
+    Gets the upper bounds of the buckets of the time histograms, configured by the METRICS_BUCKETS setting.
+
+    :return: Bounds in seconds, ascending
+    :rtype: tuple
+    """
+    return tuple(getattr(settings, 'METRICS_BUCKETS', (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)))
+
+
+def buckets(metric):
+    """
+    Gets the upper bounds of the buckets of a histogram.
+
+    :param metric: (string) Key of the histogram in HISTOGRAMS
+    :return: Bounds, ascending
+    :rtype: tuple
+    """
+    return duration_buckets() if HISTOGRAMS[metric][2] else QUERY_BUCKETS
+
+
+class RequestMetrics(object):
+    """
+    Measurements of a single request. Attributes:
+    started, sql_count, sql_time, template_time, template_depth
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.template_time = 0.0
+        self.template_depth = 0
+
+    def values(self, total):
+        """
+        Gets the measured values.
+
+        :param total: (float) Total time of the request in seconds
+        :return: Dictionary of the keys of HISTOGRAMS to the values
+        :rtype: dict
+        """
+        return {'duration': total, 'sql': self.sql_time, 'template': self.template_time, 'queries': self.sql_count}
+
+    def server_timing(self, total):
+        """
+        Formats the measurements as the value of a Server-Timing header.
+
+        :param total: (float) Total time of the request in seconds
+        :return: The header value
+        :rtype: string
+        """
+        return 'total;dur={:.1f}, sql;desc="{} queries";dur={:.1f}, template;dur={:.1f}'.format(
+            total * 1000, self.sql_count, self.sql_time * 1000, self.template_time * 1000)
+
+
+def current():
+    """
+    Gets the measurements of the request handled by this thread.
+
+    :return: The measurements, None outside of requests
+    :rtype: RequestMetrics
+    """
+    return getattr(_local, 'metrics', None)
+
+
+class TimedCursor(object):
+    """
+    Cursor wrapper adding the time of the executed queries to the measurements of the current request.
+    """
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+    def __getattr__(self, attr):
+        return getattr(self.cursor, attr)
+
+    def __iter__(self):
+        return iter(self.cursor)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        return self.cursor.__exit__(type, value, traceback)
+
+    def _timed(self, method, *args):
+        metrics = current()
+        if metrics is None:
+            return method(*args)
+        started = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            metrics.sql_time += time.perf_counter() - started
+            metrics.sql_count += 1
+
+    def execute(self, sql, params=None):
+        return self._timed(self.cursor.execute, sql, params)
+
+    def executemany(self, sql, param_list):
+        return self._timed(self.cursor.executemany, sql, param_list)
+
+
+def install_cursor_wrapper(connection):
+    """
+    Makes a database connection time its queries, unless it does already.
+
+    :param connection: (DatabaseWrapper) The connection
+    """
+    if getattr(connection, '_timed_cursors', False):
+        return
+    make_cursor, make_debug_cursor = connection.make_cursor, connection.make_debug_cursor
+    connection.make_cursor = lambda cursor: TimedCursor(make_cursor(cursor))
+    connection.make_debug_cursor = lambda cursor: TimedCursor(make_debug_cursor(cursor))
+    connection._timed_cursors = True
+
+
+class TimedTemplate(Template):
+    """
+    Template adding its rendering time to the measurements of the current request.
+    """
+
+    def render(self, context=None, request=None):
+        metrics = current()
+        if metrics is None:
+            return super(TimedTemplate, self).render(context, request)
+        started = time.perf_counter()
+        metrics.template_depth += 1
+        try:
+            return super(TimedTemplate, self).render(context, request)
+        finally:
+            metrics.template_depth -= 1
+            if not metrics.template_depth:
+                metrics.template_time += time.perf_counter() - started
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """
+    Django template backend measuring the time spent rendering its templates.
+    """
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return TimedTemplate(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
+
+
+def view_name(request):
+    """
+    Gets the name of the view that handled a request.
+
+    :param request: (HttpRequest) The request
+    :return: Name of the URL pattern with its namespace, or 'unresolved' when no pattern matched
+    :rtype: string
+    """
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return UNRESOLVED
+    return match.view_name or '{}.{}'.format(match.func.__module__, match.func.__name__)
+
+
+def observe(view, values):
+    """
+    Adds the measurements of a request to the histograms of its view.
+
+    :param view: (string) Name of the view
+    :param values: (dict) Dictionary of the keys of HISTOGRAMS to the measured values
+    """
+    with _lock:
+        for metric, value in values.items():
+            bounds = buckets(metric)
+            index = next((i for i, bound in enumerate(bounds) if value <= bound), len(bounds))
+            _pending[metric, view, str(index)] += 1
+            _pending[metric, view, 'sum'] += int(round(value * 1000000 if HISTOGRAMS[metric][2] else value))
+
+
+def _add(metric, view, bucket, value):
+    counters = MetricCounter.objects.filter(metric=metric, view=view, bucket=bucket)
+    if counters.update(value=F('value') + value):
+        return
+    try:
+        with transaction.atomic():
+            MetricCounter.objects.create(metric=metric, view=view, bucket=bucket, value=value)
+    except IntegrityError:
+        # Another process has just created the counter
+        counters.update(value=F('value') + value)
+
+
+def flush():
+    """
+    Adds the measurements collected by this process to the shared counters.
+    """
+    with _lock:
+        pending = dict(_pending)
+        _pending.clear()
+        _last_flush[0] = time.time()
+    for (metric, view, bucket), value in sorted(pending.items()):
+        _add(metric, view, bucket, value)
+
+
+def maybe_flush():
+    """
+    Flushes the collected measurements when METRICS_FLUSH_INTERVAL has passed since the last flush.
+    """
+    if time.time() - _last_flush[0] >= flush_interval():
+        flush()
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render():
+    """
+    Renders the shared histograms in the Prometheus text exposition format.
+
+    :return: The metrics
+    :rtype: string
+    """
+    stored = {(metric, view, bucket): value for metric, view, bucket, value in
+              MetricCounter.objects.values_list('metric', 'view', 'bucket', 'value')}
+    views = sorted({view for metric, view, bucket in stored})
+    lines = []
+    for metric, (name, description, duration) in HISTOGRAMS.items():
+        lines.extend(['# HELP {} {}.'.format(name, description), '# TYPE {} histogram'.format(name)])
+        bounds = buckets(metric)
+        for view in views:
+            label = 'view="{}"'.format(_escape(view))
+            cumulative = 0
+            for index, bound in enumerate(list(bounds) + ['+Inf']):
+                cumulative += stored.get((metric, view, str(index)), 0)
+                lines.append('{}_bucket{{{},le="{}"}} {}'.format(name, label, bound, cumulative))
+            total = stored.get((metric, view, 'sum'), 0)
+            lines.append('{}_sum{{{}}} {}'.format(name, label, _number(total / 1000000 if duration else total)))
+            lines.append('{}_count{{{}}} {}'.format(name, label, cumulative))
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsMiddleware(object):
+    """
+    Middleware measuring every request, see the module documentation. Has to be the first middleware, so that the
+    others are included in the measured time.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        for connection in connections.all():
+            install_cursor_wrapper(connection)
+        metrics = _local.metrics = RequestMetrics()
+        try:
+            response = self.get_response(request)
+        finally:
+            _local.metrics = None
+        total = time.perf_counter() - metrics.started
+        response['Server-Timing'] = metrics.server_timing(total)
+        view = view_name(request)
+        logger.info(json.dumps(OrderedDict([
+            ('view', view), ('method', request.method), ('path', request.path), ('status', response.status_code),
+            ('duration_ms', round(total * 1000, 1)), ('sql_queries', metrics.sql_count),
+            ('sql_ms', round(metrics.sql_time * 1000, 1)), ('template_ms', round(metrics.template_time * 1000, 1)),
+        ])))
+        observe(view, metrics.values(total))
+        maybe_flush()
+        return response
@@ -0,0 +1,21 @@
+from . import roles
+
+
+class RoleCacheMiddleware(object):
+    """
+    Middleware keeping the role names of the logged in user in the session, so that consecutive requests do not have
+    to query the group membership again. Does nothing unless ROLE_SESSION_CACHE is enabled. Has to be placed after
+    the AuthenticationMiddleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        enabled = roles.session_cache_enabled()
+        if enabled:
+            roles.load_session_roles(request)
+        response = self.get_response(request)
+        if enabled:
+            roles.save_session_roles(request)
+        return response
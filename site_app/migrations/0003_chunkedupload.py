@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.5 on 2026-10-18 15:15
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('site_app', '0002_topic_list_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChunkedUpload',
+            fields=[
+                ('id', models.CharField(max_length=32, primary_key=True, serialize=False, verbose_name='upload ID')),
+                ('kind', models.CharField(choices=[('thesis', 'thesis'), ('review', 'review')], max_length=10, verbose_name='uploaded file kind')),
+                ('object_id', models.PositiveIntegerField(verbose_name='thesis or review ID')),
+                ('filename', models.CharField(max_length=255, verbose_name='file name')),
+                ('size', models.BigIntegerField(verbose_name='file size')),
+                ('offset', models.BigIntegerField(default=0, verbose_name='received bytes')),
+                ('checksum', models.CharField(blank=True, default='', max_length=64, verbose_name='expected SHA-256 checksum')),
+                ('created', models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='created')),
+                ('completed', models.BooleanField(default=False, verbose_name='completed')),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='uploads', to=settings.AUTH_USER_MODEL, verbose_name='upload owner')),
+            ],
+            options={
+                'verbose_name': 'chunked upload',
+                'verbose_name_plural': 'chunked uploads',
+                'abstract': False,
+            },
+        ),
+    ]
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.5 on 2026-10-18 15:19
+from __future__ import unicode_literals
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def compute_deadlines(apps, schema_editor):
+    Review = apps.get_model('site_app', 'Review')
+    period = timedelta(days=getattr(settings, 'REVIEW_PERIOD_DAYS', 14))
+    for review in Review.objects.select_related('thesis').iterator():
+        Review.objects.filter(pk=review.pk).update(deadline=review.thesis.finished_date.date() + period)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('site_app', '0004_content_addressed_storage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='review',
+            name='deadline',
+            field=models.DateField(blank=True, db_index=True, editable=False, null=True, verbose_name='deadline'),
+        ),
+        migrations.AlterIndexTogether(
+            name='review',
+            index_together=set([('author', 'deadline')]),
+        ),
+        migrations.RunPython(compute_deadlines, migrations.RunPython.noop),
+    ]
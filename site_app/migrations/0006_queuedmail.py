@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.5 on 2026-10-18 15:21
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('site_app', '0005_review_deadline'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QueuedMail',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('subject', models.CharField(max_length=998, verbose_name='subject')),
+                ('body', models.TextField(verbose_name='body')),
+                ('html_body', models.TextField(blank=True, default='', verbose_name='HTML body')),
+                ('from_email', models.CharField(max_length=254, verbose_name='from')),
+                ('to', models.TextField(verbose_name='to')),
+                ('cc', models.TextField(blank=True, default='', verbose_name='cc')),
+                ('bcc', models.TextField(blank=True, default='', verbose_name='bcc')),
+                ('status', models.CharField(choices=[('queued', 'queued'), ('sending', 'sending'), ('sent', 'sent'), ('failed', 'failed')], default='queued', max_length=10, verbose_name='status')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='delivery attempts')),
+                ('next_attempt', models.DateTimeField(default=django.utils.timezone.now, verbose_name='next attempt')),
+                ('claim', models.CharField(blank=True, default='', max_length=32, verbose_name='claimed by worker')),
+                ('last_error', models.TextField(blank=True, default='', verbose_name='last error')),
+                ('created', models.DateTimeField(default=django.utils.timezone.now, verbose_name='created')),
+                ('sent', models.DateTimeField(blank=True, null=True, verbose_name='sent')),
+            ],
+            options={
+                'verbose_name': 'queued mail',
+                'verbose_name_plural': 'queued mail',
+                'abstract': False,
+            },
+        ),
+        migrations.AlterIndexTogether(
+            name='queuedmail',
+            index_together=set([('status', 'next_attempt')]),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.5 on 2026-10-18 15:26
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('site_app', '0006_queuedmail'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='defense',
+            name='room',
+            field=models.CharField(blank=True, default='', max_length=50, verbose_name='room'),
+        ),
+        migrations.AlterField(
+            model_name='defense',
+            name='date',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='defense date'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.5 on 2026-10-18 15:29
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+from site_app import search
+
+
+def create_index(apps, schema_editor):
+    search.create_index(schema_editor.connection)
+
+
+def drop_index(apps, schema_editor):
+    search.drop_index(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('site_app', '0007_defense_room'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
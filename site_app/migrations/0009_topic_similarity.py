@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.5 on 2026-10-18 15:33
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+import hashlib
+import random
+import re
+import struct
+import zlib
+
+from django.db import DatabaseError
+
+# The signatures of site_app.similarity and the search index of site_app.search as of this migration, kept here so
+# that later changes of the application cannot change what the migration does
+SHINGLE_SIZE = 4
+BANDS = 16
+ROWS = 4
+_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+_random = random.Random(20170203)
+_HASH_PARAMS = [(_random.randrange(1, _PRIME), _random.randrange(0, _PRIME)) for i in range(BANDS * ROWS)]
+
+FTS_TABLE = 'site_app_topic_fts'
+TOPIC_TABLE = 'site_app_topic'
+INDEX_SQL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5(name, short_description, content='{table}', "
+    "content_rowid='id', tokenize='unicode61 remove_diacritics 1')",
+    "CREATE TRIGGER IF NOT EXISTS {fts}_insert AFTER INSERT ON {table} BEGIN "
+    "INSERT INTO {fts}(rowid, name, short_description) VALUES (new.id, new.name, new.short_description); END",
+    "CREATE TRIGGER IF NOT EXISTS {fts}_delete AFTER DELETE ON {table} BEGIN "
+    "INSERT INTO {fts}({fts}, rowid, name, short_description) "
+    "VALUES ('delete', old.id, old.name, old.short_description); END",
+    "CREATE TRIGGER IF NOT EXISTS {fts}_update AFTER UPDATE OF name, short_description ON {table} BEGIN "
+    "INSERT INTO {fts}({fts}, rowid, name, short_description) "
+    "VALUES ('delete', old.id, old.name, old.short_description); "
+    "INSERT INTO {fts}(rowid, name, short_description) VALUES (new.id, new.name, new.short_description); END",
+    "INSERT INTO {fts}({fts}) VALUES ('rebuild')",
+]
+
+
+def _signature(name, description):
+    shingles = set()
+    for text in (name, description):
+        for word in re.findall(r'\w+', (text or '').lower()):
+            word = ' {} '.format(word)
+            shingles.update(word[i:i + SHINGLE_SIZE] for i in range(max(1, len(word) - SHINGLE_SIZE + 1)))
+    values = [zlib.crc32(item.encode('utf-8')) for item in shingles]
+    if not values:
+        return None
+    return tuple(min((a * value + b) % _PRIME for value in values) & _MAX_HASH for a, b in _HASH_PARAMS)
+
+
+def _buckets(signature):
+    result = []
+    for band in range(BANDS):
+        data = struct.pack('<H{}I'.format(ROWS), band, *signature[band * ROWS:(band + 1) * ROWS])
+        result.append(int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), 'little', signed=True))
+    return result
+
+
+def index_topics(apps, schema_editor):
+    Topic = apps.get_model('site_app', 'Topic')
+    TopicSignature = apps.get_model('site_app', 'TopicSignature')
+    TopicBand = apps.get_model('site_app', 'TopicBand')
+    for topic in Topic.objects.iterator():
+        signature = _signature(topic.name, topic.short_description)
+        if signature is not None:
+            TopicSignature.objects.create(topic_id=topic.id,
+                                          signature=struct.pack('<{}I'.format(BANDS * ROWS), *signature))
+            TopicBand.objects.bulk_create([TopicBand(topic_id=topic.id, bucket=bucket)
+                                           for bucket in _buckets(signature)])
+
+
+def recreate_search_index(apps, schema_editor):
+    # Adding a column rebuilds the topic table on SQLite, dropping the triggers of the search index
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    try:
+        with schema_editor.connection.cursor() as cursor:
+            for statement in INDEX_SQL:
+                cursor.execute(statement.format(fts=FTS_TABLE, table=TOPIC_TABLE))
+    except DatabaseError:
+        # SQLite compiled without FTS5
+        pass
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('site_app', '0008_topic_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TopicBand',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.BigIntegerField(verbose_name='bucket')),
+            ],
+            options={
+                'verbose_name': 'topic band',
+                'verbose_name_plural': 'topic bands',
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='TopicSignature',
+            fields=[
+                ('topic', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='signature', serialize=False, to='site_app.Topic')),
+                ('signature', models.BinaryField(verbose_name='MinHash signature')),
+            ],
+            options={
+                'verbose_name': 'topic signature',
+                'verbose_name_plural': 'topic signatures',
+                'abstract': False,
+            },
+        ),
+        migrations.AddField(
+            model_name='topic',
+            name='similar_to',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='site_app.Topic', verbose_name='possible duplicate of'),
+        ),
+        migrations.AddField(
+            model_name='topicband',
+            name='topic',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='bands', to='site_app.Topic'),
+        ),
+        migrations.AlterIndexTogether(
+            name='topicband',
+            index_together=set([('bucket', 'topic')]),
+        ),
+        migrations.RunPython(index_topics, migrations.RunPython.noop),
+        migrations.RunPython(recreate_search_index, migrations.RunPython.noop),
+    ]
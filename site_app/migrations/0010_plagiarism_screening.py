@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.5 on 2026-10-18 15:35
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('site_app', '0009_topic_similarity'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlagiarismMatch',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('similarity', models.FloatField(verbose_name='estimated similarity')),
+            ],
+            options={
+                'verbose_name': 'plagiarism match',
+                'verbose_name_plural': 'plagiarism matches',
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='ThesisBand',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.BigIntegerField(verbose_name='bucket')),
+            ],
+            options={
+                'verbose_name': 'thesis band',
+                'verbose_name_plural': 'thesis bands',
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='ThesisSignature',
+            fields=[
+                ('thesis', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='signature', serialize=False, to='site_app.Thesis')),
+                ('file_name', models.CharField(max_length=255, verbose_name='screened file')),
+                ('signature', models.BinaryField(null=True, verbose_name='MinHash signature')),
+                ('shingles', models.PositiveIntegerField(default=0, verbose_name='number of shingles')),
+                ('error', models.CharField(blank=True, default='', max_length=255, verbose_name='text extraction error')),
+                ('screened', models.DateTimeField(default=django.utils.timezone.now, verbose_name='screened')),
+            ],
+            options={
+                'verbose_name': 'thesis signature',
+                'verbose_name_plural': 'thesis signatures',
+                'abstract': False,
+            },
+        ),
+        migrations.AddField(
+            model_name='thesisband',
+            name='thesis',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='bands', to='site_app.Thesis'),
+        ),
+        migrations.AddField(
+            model_name='plagiarismmatch',
+            name='other',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='site_app.Thesis', verbose_name='matching thesis'),
+        ),
+        migrations.AddField(
+            model_name='plagiarismmatch',
+            name='thesis',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='plagiarism_matches', to='site_app.Thesis'),
+        ),
+        migrations.AlterIndexTogether(
+            name='thesisband',
+            index_together=set([('bucket', 'thesis')]),
+        ),
+        migrations.AlterUniqueTogether(
+            name='plagiarismmatch',
+            unique_together=set([('thesis', 'other')]),
+        ),
+    ]
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.5 on 2026-10-18 15:49
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+from collections import Counter
+
+from django.db.models import Case, Count, IntegerField, Q, Sum, When
+
+
+def _flag(condition):
+    return Sum(Case(When(condition, then=1), default=0, output_field=IntegerField()))
+
+
+def count_rows(apps, schema_editor):
+    # The counting of site_app.statistics as of this migration, kept here so that later changes of the application
+    # cannot change what the migration does
+    Topic = apps.get_model('site_app', 'Topic')
+    Thesis = apps.get_model('site_app', 'Thesis')
+    Review = apps.get_model('site_app', 'Review')
+    Defense = apps.get_model('site_app', 'Defense')
+    Statistic = apps.get_model('site_app', 'Statistic')
+    counts = Counter()
+
+    def add(rows, level, supervisor, metrics):
+        for row in rows:
+            for metric in metrics:
+                counts[metric, row[level] or '', row[supervisor]] += row[metric] or 0
+
+    add(Topic.objects.order_by().values('level', 'supervisor').annotate(
+        topics_proposed=_flag(Q(student__isnull=False)), topics_checked=_flag(Q(checked=True)),
+        topics_available=_flag(Q(available=True))),
+        'level', 'supervisor', ('topics_proposed', 'topics_checked', 'topics_available'))
+    add(Thesis.objects.filter(finished=True).order_by().values('topic__level', 'supervisor').annotate(
+        theses_finished=Count('id')), 'topic__level', 'supervisor', ('theses_finished',))
+    add(Review.objects.filter(Q(file='') | Q(file__isnull=True)).order_by().values(
+        'thesis__topic__level', 'thesis__supervisor').annotate(reviews_pending=Count('id')),
+        'thesis__topic__level', 'thesis__supervisor', ('reviews_pending',))
+    add(Defense.objects.order_by().values('thesis__topic__level', 'thesis__supervisor').annotate(
+        defenses_successful=_flag(Q(successful=True)), defenses_second=_flag(Q(second_defense=True))),
+        'thesis__topic__level', 'thesis__supervisor', ('defenses_successful', 'defenses_second'))
+    Statistic.objects.bulk_create([Statistic(metric=metric, level=level, supervisor_id=supervisor_id, count=number)
+                                   for (metric, level, supervisor_id), number in sorted(counts.items(), key=str)
+                                   if number])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('site_app', '0011_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Statistic',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('metric', models.CharField(choices=[('topics_proposed', 'Proposed topics'), ('topics_checked', 'Checked topics'), ('topics_available', 'Available topics'), ('theses_finished', 'Finished theses'), ('reviews_pending', 'Pending reviews'), ('defenses_successful', 'Successful defenses'), ('defenses_second', 'Second defenses required')], max_length=30, verbose_name='metric')),
+                ('level', models.CharField(blank=True, default='', max_length=255, verbose_name='level')),
+                ('count', models.IntegerField(default=0, verbose_name='count')),
+                ('supervisor', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='supervisor')),
+            ],
+            options={
+                'verbose_name': 'statistic',
+                'verbose_name_plural': 'statistics',
+                'abstract': False,
+            },
+        ),
+        migrations.AlterIndexTogether(
+            name='statistic',
+            index_together=set([('metric', 'level', 'supervisor')]),
+        ),
+        migrations.RunPython(count_rows, migrations.RunPython.noop),
+    ]
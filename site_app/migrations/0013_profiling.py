@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.5 on 2026-10-18 16:05
+from __future__ import unicode_literals
+
+from django.conf import settings
+import django.core.validators
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+import site_app.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('site_app', '0012_statistic'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProfilingRule',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('path_pattern', models.CharField(blank=True, default='', help_text='Regular expression searched for in the path of the requests', max_length=255, validators=[site_app.models.validate_pattern], verbose_name='path pattern')),
+                ('percentage', models.PositiveSmallIntegerField(default=100, validators=[django.core.validators.MinValueValidator(1), django.core.validators.MaxValueValidator(100)], verbose_name='percentage of requests')),
+                ('enabled', models.BooleanField(default=True, verbose_name='enabled')),
+                ('expires', models.DateTimeField(blank=True, null=True, verbose_name='expires')),
+                ('created', models.DateTimeField(default=django.utils.timezone.now, verbose_name='created')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='user')),
+            ],
+            options={
+                'verbose_name': 'profiling rule',
+                'verbose_name_plural': 'profiling rules',
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='RequestProfile',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('method', models.CharField(max_length=10, verbose_name='method')),
+                ('path', models.CharField(max_length=255, verbose_name='path')),
+                ('view', models.CharField(blank=True, default='', max_length=255, verbose_name='view')),
+                ('status', models.PositiveSmallIntegerField(verbose_name='status')),
+                ('duration', models.FloatField(verbose_name='duration in seconds')),
+                ('samples', models.PositiveIntegerField(default=0, verbose_name='samples')),
+                ('stacks', models.TextField(blank=True, default='', verbose_name='collapsed stacks')),
+                ('created', models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='created')),
+                ('rule', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='profiles', to='site_app.ProfilingRule', verbose_name='rule')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='user')),
+            ],
+            options={
+                'verbose_name': 'request profile',
+                'verbose_name_plural': 'request profiles',
+                'abstract': False,
+            },
+        ),
+    ]
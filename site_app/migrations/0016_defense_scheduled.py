@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.5 on 2026-10-18 16:40
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+def mark_scheduled(apps, schema_editor):
+    # Rooms are only given to defenses placed by the scheduler or an administrator
+    Defense = apps.get_model('site_app', 'Defense')
+    Defense.objects.exclude(room='').update(scheduled=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('site_app', '0015_queuedmail_mime'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='defense',
+            name='scheduled',
+            field=models.BooleanField(default=False, verbose_name='scheduled'),
+        ),
+        migrations.RunPython(mark_scheduled, migrations.RunPython.noop),
+    ]
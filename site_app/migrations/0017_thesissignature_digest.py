@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.5 on 2026-10-18 16:29
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+def fill_digests(apps, schema_editor):
+    # Only files not replaced since they were screened get the digest of their current content
+    ThesisSignature = apps.get_model('site_app', 'ThesisSignature')
+    StoredFile = apps.get_model('site_app', 'StoredFile')
+    signatures = ThesisSignature.objects.values_list('thesis_id', 'file_name', 'screened')
+    for thesis_id, file_name, screened in signatures.iterator():
+        digest = StoredFile.objects.filter(name=file_name, updated__lte=screened).values_list('blob_id', flat=True)
+        ThesisSignature.objects.filter(pk=thesis_id).update(digest=digest.first() or '')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('site_app', '0016_defense_scheduled'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='thesissignature',
+            name='digest',
+            field=models.CharField(blank=True, default='', max_length=64,
+                                   verbose_name='SHA-256 digest of the screened file'),
+        ),
+        migrations.RunPython(fill_digests, migrations.RunPython.noop),
+    ]
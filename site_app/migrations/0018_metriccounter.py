@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.5 on 2026-10-18 16:45
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('site_app', '0017_thesissignature_digest'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MetricCounter',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('metric', models.CharField(max_length=20, verbose_name='metric')),
+                ('view', models.CharField(max_length=255, verbose_name='view')),
+                ('bucket', models.CharField(max_length=10, verbose_name='bucket')),
+                ('value', models.BigIntegerField(default=0, verbose_name='value')),
+            ],
+            options={
+                'verbose_name': 'metric counter',
+                'verbose_name_plural': 'metric counters',
+                'abstract': False,
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='metriccounter',
+            unique_together=set([('metric', 'view', 'bucket')]),
+        ),
+    ]
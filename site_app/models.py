@@ -1,17 +1,33 @@
 import os
+import re
 
 from django.conf import settings
 from django.contrib.auth.base_user import BaseUserManager, AbstractBaseUser
 from django.contrib.auth.models import PermissionsMixin, Group
-from django.core.mail import send_mail
+from django.core.exceptions import ValidationError
+from django.core.validators import MaxValueValidator, MinValueValidator
 from django.utils import timezone
 from django.db import models
+from django.db.models import Q
 from model_utils import Choices
+from collections import defaultdict
 from datetime import timedelta
+from . import caching
+from . import roles
 
 LEVELS = Choices('Bachelor', 'Master', 'Doctor')
 
 
+def review_period():
+    """
+    Gets the time reviewers have for reviewing a finished thesis, configured by the REVIEW_PERIOD_DAYS setting.
+
+    :return: The review period
+    :rtype: timedelta
+    """
+    return timedelta(days=getattr(settings, 'REVIEW_PERIOD_DAYS', 14))
+
+
 class Faculty(models.Model):
     class Meta:
         app_label = 'site_app'
@@ -120,7 +136,7 @@ class User(AbstractBaseUser, PermissionsMixin):
         :return: Indicator whether user is a reviewer
         :rtype: bool
         """
-        return self.is_staff or self.groups.filter(name='Reviewer')
+        return roles.has_role(self, 'Reviewer')
 
     @property
     def is_student(self):
@@ -130,11 +146,44 @@ class User(AbstractBaseUser, PermissionsMixin):
         :return: Indicator whether user is a student
         :rtype: bool
         """
-        return self.is_staff or self.groups.filter(name='Student')
+        return roles.has_role(self, 'Student')
 
     objects = UserManager()
 
     USERNAME_FIELD = 'email'
+    # Fields shown in the cached pages and the supervisor directory
+    DISPLAYED_FIELDS = ('email', 'first_name', 'last_name')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """
+        Creates an instance from a database row, remembering the values of its displayed fields.
+        """
+        instance = super(User, cls).from_db(db, field_names, values)
+        instance.remember_displayed_fields()
+        return instance
+
+    def _displayed_values(self):
+        if not all(name in self.__dict__ for name in self.DISPLAYED_FIELDS):
+            # Some of the fields are deferred
+            return None
+        return tuple(self.__dict__[name] for name in self.DISPLAYED_FIELDS)
+
+    def remember_displayed_fields(self):
+        """
+        Remembers the current values of the displayed fields, e.g. after they were saved.
+        """
+        self._stored_displayed_values = self._displayed_values()
+
+    def displayed_fields_changed(self):
+        """
+        Checks whether the displayed fields may differ from the values loaded or saved last.
+
+        :return: Indicator whether the fields changed, True when their previous values are not known
+        :rtype: bool
+        """
+        stored = getattr(self, '_stored_displayed_values', None)
+        return stored is None or stored != self._displayed_values()
 
     class Meta:
         app_label = 'site_app'
@@ -153,10 +202,29 @@ class User(AbstractBaseUser, PermissionsMixin):
         return self.first_name
 
     def email_user(self, subject, message, from_email=None, **kwargs):
-        send_mail(subject, message, from_email, [self.email], **kwargs)
+        """
+        Queues an e-mail to the user. It is sent by the send_queued_mail management command.
+
+        :param subject: (string) Subject of the message
+        :param message: (string) Plain text body of the message
+        :param from_email: (string) Sender address, defaults to DEFAULT_FROM_EMAIL
+        :param kwargs: Optional html_message
+        :return: The queued message
+        :rtype: QueuedMail
+        """
+        return QueuedMail.enqueue(subject, message, from_email, [self.email], html_message=kwargs.get('html_message'))
 
 
 class Topic(models.Model):
+    class Meta:
+        app_label = 'site_app'
+        # Back the filtering and keyset ordering of the list of available topics
+        index_together = [
+            ('available', 'name'),
+            ('available', 'supervisor'),
+            ('available', 'level', 'name'),
+        ]
+
     student = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name='topic owner',
                                 related_name='topic_owner', null=True, blank=True)
     supervisor = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name='topic supervisor',
@@ -167,6 +235,9 @@ class Topic(models.Model):
     available = models.NullBooleanField('available', null=True, blank=True, default=False)
     checked = models.NullBooleanField('checked', null=True, blank=True, default=False)
     short_description = models.CharField('short description', max_length=255, null=True, blank=True)
+    # Set when the topic was proposed, if an existing topic looked like its duplicate
+    similar_to = models.ForeignKey('self', on_delete=models.SET_NULL, null=True, blank=True, related_name='+',
+                                   verbose_name='possible duplicate of')
     REQUIRED_FIELDS = ['name', ]
 
     def __str__(self):
@@ -220,6 +291,19 @@ class Thesis(models.Model):
 
     file = models.FileField(upload_to=get_file_path, verbose_name='thesis file', null=True, blank=True)
 
+    def is_accessible_by(self, user):
+        """
+        Checks whether user may download the thesis file. Allowed are administrators, the student, the supervisor and
+        the reviewers of the thesis.
+
+        :param user: (User) The user requesting the file
+        :return: Indicator whether user may access the thesis
+        :rtype: bool
+        """
+        if user.is_admin or user.id in (self.student_id, self.supervisor_id):
+            return True
+        return Review.objects.filter(thesis_id=self.id, author_id=user.id).exists()
+
     @property
     def reviewed(self):
         """
@@ -251,14 +335,82 @@ class Thesis(models.Model):
         return thesis_name.strip()
 
 
+class ReviewQuerySet(models.QuerySet):
+    """
+    QuerySet of the Review model providing the queries of the deadline lists. They are answered by range scans of the
+    indexes on the deadline.
+    """
+
+    def pending(self):
+        """
+        Gets the reviews whose file was not uploaded yet.
+
+        :return: Unfinished reviews
+        :rtype: ReviewQuerySet
+        """
+        return self.filter(Q(file='') | Q(file__isnull=True))
+
+    def overdue(self, today=None):
+        """
+        Gets the unfinished reviews whose deadline has passed.
+
+        :param today: (date) The current date, defaults to today
+        :return: Overdue reviews
+        :rtype: ReviewQuerySet
+        """
+        today = today or timezone.now().date()
+        return self.pending().filter(deadline__lt=today)
+
+    def due_within(self, days, today=None):
+        """
+        Gets the unfinished reviews whose deadline comes within given number of days.
+
+        :param days: (int) Number of days, including today
+        :param today: (date) The current date, defaults to today
+        :return: Reviews due soon
+        :rtype: ReviewQuerySet
+        """
+        today = today or timezone.now().date()
+        return self.pending().filter(deadline__gte=today, deadline__lt=today + timedelta(days=days))
+
+    def refresh_deadlines(self, batch_size=500):
+        """
+        Recomputes the stored deadlines of the reviews, e.g. after the review period was changed.
+
+        :param batch_size: (int) Number of theses whose reviews are updated by one query
+        :return: Number of updated reviews
+        :rtype: int
+        """
+        theses = defaultdict(list)
+        finished_dates = Thesis.objects.filter(reviewed_thesis__in=self).distinct().values_list('id', 'finished_date')
+        for thesis_id, finished_date in finished_dates.iterator():
+            theses[Review.compute_deadline(finished_date)].append(thesis_id)
+        updated = 0
+        for deadline, thesis_ids in theses.items():
+            for i in range(0, len(thesis_ids), batch_size):
+                updated += self.filter(thesis_id__in=thesis_ids[i:i + batch_size]).update(deadline=deadline)
+        if updated:
+            caching.bump_versions(caching.REVIEWS)
+        return updated
+
+
 class Review(models.Model):
     """
     Review class represents the Review table in the database. It contains following attributes:
-    author, thesis, finished, finished_date
+    author, thesis, finished, finished_date, deadline
     which can be used to access database regardless of the language it uses
     Methods:
-    deadline(), get_file_path(filename), __str__(), get_review_name()
+    compute_deadline(finished_date), get_file_path(filename), __str__(), get_review_name()
     """
+
+    class Meta:
+        """
+        Meta class required by administration tools of Django
+        """
+        app_label = 'site_app'
+        # Back the lists of overdue and upcoming reviews of a reviewer
+        index_together = [('author', 'deadline')]
+
     author = models.ForeignKey(User, on_delete=models.CASCADE,
                                verbose_name='review author', related_name='review_author')
     thesis = models.ForeignKey(Thesis, on_delete=models.CASCADE,
@@ -275,16 +427,21 @@ class Review(models.Model):
         return True if self.file.name else False
 
     finished_date = models.DateTimeField('finished date', null=True, blank=True, default=None)
+    # Kept in sync with the finished date of the thesis by the signal receivers of the application
+    deadline = models.DateField('deadline', null=True, blank=True, editable=False, db_index=True)
 
-    @property
-    def deadline(self):
+    objects = ReviewQuerySet.as_manager()
+
+    @staticmethod
+    def compute_deadline(finished_date):
         """
-        Used to calculate the deadline of current review.
+        Used to calculate the deadline of reviews of a thesis.
 
+        :param finished_date: (datetime) The moment the thesis was finished
         :return: The date by which review has to be submitted
-        :rtype: datetime
+        :rtype: date
         """
-        return self.thesis.finished_date.date() + timedelta(weeks=2)
+        return finished_date.date() + review_period()
 
     def get_file_path(self, filename):
         """
@@ -295,10 +452,21 @@ class Review(models.Model):
         :rtype: string
         """
         file_ext = filename.split('.')[-1]
-        return os.path.join(settings.MEDIA_ROOT, 'theses/thesis_{0}/review.{1}'.format(self.thesis.id, file_ext))
+        return 'theses/thesis_{0}/review.{1}'.format(self.thesis.id, file_ext)
 
     file = models.FileField(upload_to=get_file_path, verbose_name='review file', null=True, blank=True)
 
+    def is_accessible_by(self, user):
+        """
+        Checks whether user may download the review file. Allowed are administrators, the author of the review and the
+        student and supervisor of the reviewed thesis.
+
+        :param user: (User) The user requesting the file
+        :return: Indicator whether user may access the review
+        :rtype: bool
+        """
+        return user.is_admin or user.id in (self.author_id, self.thesis.student_id, self.thesis.supervisor_id)
+
     def __str__(self):
         """
         Used to get the string representation of Review model. Overrides default __str__() function.
@@ -322,16 +490,19 @@ class Review(models.Model):
 class Defense(models.Model):
     """
     Defense class represents the Defense table in the database. It contains following attributes:
-    thesis, date, successful, second_defense
-    which can be used to access database regardless of the language it uses
+    thesis, date, room, successful, second_defense, scheduled
+    which can be used to access database regardless of the language it uses. Defenses which are not scheduled yet wait
+    for the schedule_defenses command, their date is not meaningful.
     Methods:
     __str__, get_defense_name()
     """
     thesis = models.ForeignKey(Thesis, on_delete=models.CASCADE,
                                verbose_name='defended thesis', related_name='defended_thesis')
-    date = models.DateTimeField('defense date', default=timezone.now)
+    date = models.DateTimeField('defense date', default=timezone.now, db_index=True)
+    room = models.CharField('room', max_length=50, blank=True, default='')
     successful = models.BooleanField('successful')
     second_defense = models.BooleanField('second defense required')
+    scheduled = models.BooleanField('scheduled', default=False)
 
     def __str__(self):
         """
@@ -351,3 +522,537 @@ class Defense(models.Model):
         """
         defense_name = 'Defense #{} of {}'.format(self.id, self.thesis.get_thesis_name)
         return defense_name.strip()
+
+
+class ChunkedUpload(models.Model):
+    """
+    ChunkedUpload class represents an upload of a thesis or review file sent in chunks. It contains following
+    attributes:
+    id, owner, kind, object_id, filename, size, offset, checksum, created, completed, claimed
+    Chunks are appended to a partial file, which is moved to its final place once all of them were received. The
+    request writing a chunk claims the upload first, so that concurrent requests never write the partial file.
+    Methods:
+    partial_path(), __str__()
+    """
+
+    class Meta:
+        app_label = 'site_app'
+        verbose_name = 'chunked upload'
+        verbose_name_plural = 'chunked uploads'
+        abstract = False
+
+    KINDS = Choices('thesis', 'review')
+
+    id = models.CharField('upload ID', max_length=32, primary_key=True)
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name='upload owner', related_name='uploads')
+    kind = models.CharField('uploaded file kind', max_length=10, choices=KINDS)
+    object_id = models.PositiveIntegerField('thesis or review ID')
+    filename = models.CharField('file name', max_length=255)
+    size = models.BigIntegerField('file size')
+    offset = models.BigIntegerField('received bytes', default=0)
+    checksum = models.CharField('expected SHA-256 checksum', max_length=64, blank=True, default='')
+    created = models.DateTimeField('created', default=timezone.now, db_index=True)
+    completed = models.BooleanField('completed', default=False)
+    claimed = models.DateTimeField('chunk being written since', null=True, blank=True)
+
+    def partial_path(self):
+        """
+        Gets the path of the file the received chunks are written to.
+
+        :return: Absolute path of the partial file
+        :rtype: string
+        """
+        return os.path.join(settings.CHUNKED_UPLOAD_DIR, '{}.part'.format(self.id))
+
+    def __str__(self):
+        """
+        Used to get the string representation of ChunkedUpload model. Overrides default __str__() function.
+
+        :return: String representation of ChunkedUpload
+        :rtype: string
+        """
+        return 'Upload {} of {} ({}/{} bytes)'.format(self.id, self.filename, self.offset, self.size)
+
+
+class StoredBlob(models.Model):
+    """
+    StoredBlob class represents a file content kept by the content-addressed storage. It contains following attributes:
+    digest, size, refcount, created
+    Methods:
+    __str__()
+    """
+
+    class Meta:
+        app_label = 'site_app'
+        verbose_name = 'stored blob'
+        verbose_name_plural = 'stored blobs'
+        abstract = False
+
+    digest = models.CharField('SHA-256 digest', max_length=64, primary_key=True)
+    size = models.BigIntegerField('size')
+    refcount = models.IntegerField('reference count', default=0, db_index=True)
+    created = models.DateTimeField('created', default=timezone.now)
+
+    def __str__(self):
+        """
+        Used to get the string representation of StoredBlob model. Overrides default __str__() function.
+
+        :return: String representation of StoredBlob
+        :rtype: string
+        """
+        return 'Blob {} ({} bytes, {} references)'.format(self.digest, self.size, self.refcount)
+
+
+class StoredFile(models.Model):
+    """
+    StoredFile class represents a logical file name of the content-addressed storage, i.e. a name saved in a file
+    field, mapped to the blob holding its content. It contains following attributes:
+    name, blob, updated
+    Methods:
+    __str__()
+    """
+
+    class Meta:
+        app_label = 'site_app'
+        verbose_name = 'stored file'
+        verbose_name_plural = 'stored files'
+        abstract = False
+
+    name = models.CharField('logical name', max_length=255, unique=True)
+    blob = models.ForeignKey(StoredBlob, on_delete=models.PROTECT, verbose_name='content', related_name='files')
+    updated = models.DateTimeField('updated', auto_now=True, db_index=True)
+
+    def __str__(self):
+        """
+        Used to get the string representation of StoredFile model. Overrides default __str__() function.
+
+        :return: String representation of StoredFile
+        :rtype: string
+        """
+        return '{} -> {}'.format(self.name, self.blob_id)
+
+
+class QueuedMail(models.Model):
+    """
+    QueuedMail class represents an e-mail waiting in the outbound queue. It contains following attributes:
+    subject, body, html_body, from_email, to, cc, bcc, mime, status, attempts, next_attempt, claim, last_error, created,
+    sent
+    Recipient lists are stored one address per line. Messages queued by QueuedEmailBackend are also stored serialized
+    in mime, which keeps their attachments, headers and alternative bodies.
+    Methods:
+    enqueue(subject, message, from_email, recipient_list), __str__()
+    """
+
+    class Meta:
+        app_label = 'site_app'
+        verbose_name = 'queued mail'
+        verbose_name_plural = 'queued mail'
+        abstract = False
+        # Backs the selection of messages due for delivery
+        index_together = [('status', 'next_attempt')]
+
+    STATUSES = Choices('queued', 'sending', 'sent', 'failed')
+
+    subject = models.CharField('subject', max_length=998)
+    body = models.TextField('body')
+    html_body = models.TextField('HTML body', blank=True, default='')
+    from_email = models.CharField('from', max_length=254)
+    to = models.TextField('to')
+    cc = models.TextField('cc', blank=True, default='')
+    bcc = models.TextField('bcc', blank=True, default='')
+    mime = models.BinaryField('serialized MIME message', null=True)
+    status = models.CharField('status', max_length=10, choices=STATUSES, default=STATUSES.queued)
+    attempts = models.PositiveIntegerField('delivery attempts', default=0)
+    next_attempt = models.DateTimeField('next attempt', default=timezone.now)
+    claim = models.CharField('claimed by worker', max_length=32, blank=True, default='')
+    last_error = models.TextField('last error', blank=True, default='')
+    created = models.DateTimeField('created', default=timezone.now)
+    sent = models.DateTimeField('sent', null=True, blank=True)
+
+    @classmethod
+    def enqueue(cls, subject, message, from_email, recipient_list, html_message=None):
+        """
+        Adds a message to the outbound queue. Arguments follow send_mail().
+
+        :param subject: (string) Subject of the message
+        :param message: (string) Plain text body of the message
+        :param from_email: (string) Sender address, defaults to DEFAULT_FROM_EMAIL
+        :param recipient_list: (list) Recipient addresses
+        :param html_message: (string) Optional HTML body of the message
+        :return: The queued message
+        :rtype: QueuedMail
+        """
+        return cls.objects.create(subject=subject, body=message, html_body=html_message or '',
+                                  from_email=from_email or settings.DEFAULT_FROM_EMAIL, to='\n'.join(recipient_list))
+
+    def __str__(self):
+        """
+        Used to get the string representation of QueuedMail model. Overrides default __str__() function.
+
+        :return: String representation of QueuedMail
+        :rtype: string
+        """
+        return '{} to {} ({})'.format(self.subject, self.to.replace('\n', ', '), self.status)
+
+
+class TopicSignature(models.Model):
+    """
+    TopicSignature class represents the MinHash signature of the name and short description of a topic, used to
+    estimate the similarity of topics. It contains following attributes:
+    topic, signature
+    Methods:
+    __str__()
+    """
+
+    class Meta:
+        app_label = 'site_app'
+        verbose_name = 'topic signature'
+        verbose_name_plural = 'topic signatures'
+        abstract = False
+
+    topic = models.OneToOneField(Topic, on_delete=models.CASCADE, primary_key=True, related_name='signature')
+    signature = models.BinaryField('MinHash signature')
+
+    def __str__(self):
+        """
+        Used to get the string representation of TopicSignature model. Overrides default __str__() function.
+
+        :return: String representation of TopicSignature
+        :rtype: string
+        """
+        return 'Signature of topic #{}'.format(self.topic_id)
+
+
+class TopicBand(models.Model):
+    """
+    TopicBand class represents a locality-sensitive hashing bucket of a topic. Topics sharing a bucket are candidates
+    for duplicates. It contains following attributes:
+    topic, bucket
+    Methods:
+    __str__()
+    """
+
+    class Meta:
+        app_label = 'site_app'
+        verbose_name = 'topic band'
+        verbose_name_plural = 'topic bands'
+        abstract = False
+        index_together = [('bucket', 'topic')]
+
+    topic = models.ForeignKey(Topic, on_delete=models.CASCADE, related_name='bands')
+    bucket = models.BigIntegerField('bucket')
+
+    def __str__(self):
+        """
+        Used to get the string representation of TopicBand model. Overrides default __str__() function.
+
+        :return: String representation of TopicBand
+        :rtype: string
+        """
+        return 'Bucket {} of topic #{}'.format(self.bucket, self.topic_id)
+
+
+class ThesisSignature(models.Model):
+    """
+    ThesisSignature class represents the MinHash signature of the text of a thesis file, used to screen theses for
+    plagiarism. It contains following attributes:
+    thesis, file_name, digest, signature, shingles, error, screened
+    The file name and the SHA-256 digest of its content tell which version of the thesis file was screened. Files saved
+    before the content-addressed storage have no digest.
+    Methods:
+    __str__()
+    """
+
+    class Meta:
+        app_label = 'site_app'
+        verbose_name = 'thesis signature'
+        verbose_name_plural = 'thesis signatures'
+        abstract = False
+
+    thesis = models.OneToOneField(Thesis, on_delete=models.CASCADE, primary_key=True, related_name='signature')
+    file_name = models.CharField('screened file', max_length=255)
+    digest = models.CharField('SHA-256 digest of the screened file', max_length=64, blank=True, default='')
+    signature = models.BinaryField('MinHash signature', null=True)
+    shingles = models.PositiveIntegerField('number of shingles', default=0)
+    error = models.CharField('text extraction error', max_length=255, blank=True, default='')
+    screened = models.DateTimeField('screened', default=timezone.now)
+
+    def __str__(self):
+        """
+        Used to get the string representation of ThesisSignature model. Overrides default __str__() function.
+
+        :return: String representation of ThesisSignature
+        :rtype: string
+        """
+        return 'Signature of thesis #{}'.format(self.thesis_id)
+
+
+class ThesisBand(models.Model):
+    """
+    ThesisBand class represents a locality-sensitive hashing bucket of a thesis. Theses sharing a bucket are compared
+    when screening for plagiarism. It contains following attributes:
+    thesis, bucket
+    Methods:
+    __str__()
+    """
+
+    class Meta:
+        app_label = 'site_app'
+        verbose_name = 'thesis band'
+        verbose_name_plural = 'thesis bands'
+        abstract = False
+        index_together = [('bucket', 'thesis')]
+
+    thesis = models.ForeignKey(Thesis, on_delete=models.CASCADE, related_name='bands')
+    bucket = models.BigIntegerField('bucket')
+
+    def __str__(self):
+        """
+        Used to get the string representation of ThesisBand model. Overrides default __str__() function.
+
+        :return: String representation of ThesisBand
+        :rtype: string
+        """
+        return 'Bucket {} of thesis #{}'.format(self.bucket, self.thesis_id)
+
+
+class PlagiarismMatch(models.Model):
+    """
+    PlagiarismMatch class represents a pair of theses whose texts overlap. Every match is stored for both theses. It
+    contains following attributes:
+    thesis, other, similarity
+    Methods:
+    __str__()
+    """
+
+    class Meta:
+        app_label = 'site_app'
+        verbose_name = 'plagiarism match'
+        verbose_name_plural = 'plagiarism matches'
+        abstract = False
+        unique_together = [('thesis', 'other')]
+
+    thesis = models.ForeignKey(Thesis, on_delete=models.CASCADE, related_name='plagiarism_matches')
+    other = models.ForeignKey(Thesis, on_delete=models.CASCADE, related_name='+', verbose_name='matching thesis')
+    similarity = models.FloatField('estimated similarity')
+
+    def __str__(self):
+        """
+        Used to get the string representation of PlagiarismMatch model. Overrides default __str__() function.
+
+        :return: String representation of PlagiarismMatch
+        :rtype: string
+        """
+        return 'Thesis #{} matches thesis #{} ({:.0%})'.format(self.thesis_id, self.other_id, self.similarity)
+
+
+class Job(models.Model):
+    """
+    Job class represents a background task waiting in the job queue, e.g. post-processing of an uploaded file. It
+    contains following attributes:
+    kind, arguments, priority, status, attempts, next_attempt, claim, last_error, created, finished
+    Arguments are stored as a JSON object, jobs of higher priority run first.
+    Methods:
+    __str__()
+    """
+
+    class Meta:
+        app_label = 'site_app'
+        verbose_name = 'job'
+        verbose_name_plural = 'jobs'
+        abstract = False
+        # Backs the selection of jobs due to run and the queue depth
+        index_together = [('status', 'next_attempt'), ('kind', 'status')]
+
+    STATUSES = Choices('queued', 'running', 'done', 'failed')
+
+    kind = models.CharField('kind', max_length=50)
+    arguments = models.TextField('arguments', default='{}')
+    priority = models.SmallIntegerField('priority', default=0)
+    status = models.CharField('status', max_length=10, choices=STATUSES, default=STATUSES.queued)
+    attempts = models.PositiveIntegerField('attempts', default=0)
+    next_attempt = models.DateTimeField('next attempt', default=timezone.now)
+    claim = models.CharField('claimed by worker', max_length=32, blank=True, default='')
+    last_error = models.TextField('last error', blank=True, default='')
+    created = models.DateTimeField('created', default=timezone.now)
+    finished = models.DateTimeField('finished', null=True, blank=True)
+
+    def __str__(self):
+        """
+        Used to get the string representation of Job model. Overrides default __str__() function.
+
+        :return: String representation of Job
+        :rtype: string
+        """
+        return '{} {} ({})'.format(self.kind, self.arguments, self.status)
+
+
+class Statistic(models.Model):
+    """
+    Statistic class represents a counter of the statistics dashboard, the number of topics, theses, reviews or defenses
+    of one level and supervisor meeting the condition of a metric. It contains following attributes:
+    metric, level, supervisor, count
+    Counters are kept up to date by the signal receivers of the application, see site_app.statistics.
+    Methods:
+    __str__()
+    """
+
+    class Meta:
+        app_label = 'site_app'
+        verbose_name = 'statistic'
+        verbose_name_plural = 'statistics'
+        abstract = False
+        index_together = [('metric', 'level', 'supervisor')]
+
+    METRICS = Choices(('topics_proposed', 'Proposed topics'),
+                      ('topics_checked', 'Checked topics'),
+                      ('topics_available', 'Available topics'),
+                      ('theses_finished', 'Finished theses'),
+                      ('reviews_pending', 'Pending reviews'),
+                      ('defenses_successful', 'Successful defenses'),
+                      ('defenses_second', 'Second defenses required'))
+
+    metric = models.CharField('metric', max_length=30, choices=METRICS)
+    level = models.CharField('level', max_length=255, blank=True, default='')
+    supervisor = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, related_name='+',
+                                   verbose_name='supervisor')
+    count = models.IntegerField('count', default=0)
+
+    def __str__(self):
+        """
+        Used to get the string representation of Statistic model. Overrides default __str__() function.
+
+        :return: String representation of Statistic
+        :rtype: string
+        """
+        return '{} ({}, supervisor #{}): {}'.format(self.get_metric_display(), self.level or 'no level',
+                                                    self.supervisor_id, self.count)
+
+
+def validate_pattern(value):
+    """
+    Checks that a value is a valid regular expression.
+
+    :param value: (string) The value
+    :raises: ValidationError
+    """
+    try:
+        re.compile(value)
+    except re.error as e:
+        raise ValidationError('Invalid regular expression: {}'.format(e))
+
+
+class ProfilingRule(models.Model):
+    """
+    ProfilingRule class represents a request of the administrators to profile live requests, see site_app.profiling.
+    It contains following attributes:
+    user, path_pattern, percentage, enabled, expires, created
+    A request is profiled by an enabled rule that has not expired when it is made by the user of the rule, its path
+    matches the pattern of the rule and it is among the sampled percentage of requests. Empty conditions match any
+    request.
+    Methods:
+    __str__()
+    """
+
+    class Meta:
+        app_label = 'site_app'
+        verbose_name = 'profiling rule'
+        verbose_name_plural = 'profiling rules'
+        abstract = False
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, related_name='+',
+                             verbose_name='user')
+    path_pattern = models.CharField('path pattern', max_length=255, blank=True, default='',
+                                    validators=[validate_pattern],
+                                    help_text='Regular expression searched for in the path of the requests')
+    percentage = models.PositiveSmallIntegerField('percentage of requests', default=100,
+                                                  validators=[MinValueValidator(1), MaxValueValidator(100)])
+    enabled = models.BooleanField('enabled', default=True)
+    expires = models.DateTimeField('expires', null=True, blank=True)
+    created = models.DateTimeField('created', default=timezone.now)
+
+    def __str__(self):
+        """
+        Used to get the string representation of ProfilingRule model. Overrides default __str__() function.
+
+        :return: String representation of ProfilingRule
+        :rtype: string
+        """
+        conditions = ['{}% of requests'.format(self.percentage)]
+        if self.user_id is not None:
+            conditions.append('of user #{}'.format(self.user_id))
+        if self.path_pattern:
+            conditions.append('matching {}'.format(self.path_pattern))
+        return 'Profile ' + ' '.join(conditions)
+
+
+class RequestProfile(models.Model):
+    """
+    RequestProfile class represents the profile of a live request, the call stacks sampled while it was handled. It
+    contains following attributes:
+    rule, user, method, path, view, status, duration, samples, stacks, created
+    Stacks are stored collapsed, one line per distinct stack with the frames from the outermost separated by
+    semicolons, followed by the number of its samples.
+    Methods:
+    __str__()
+    """
+
+    class Meta:
+        app_label = 'site_app'
+        verbose_name = 'request profile'
+        verbose_name_plural = 'request profiles'
+        abstract = False
+
+    rule = models.ForeignKey(ProfilingRule, on_delete=models.SET_NULL, null=True, blank=True, related_name='profiles',
+                             verbose_name='rule')
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+',
+                             verbose_name='user')
+    method = models.CharField('method', max_length=10)
+    path = models.CharField('path', max_length=255)
+    view = models.CharField('view', max_length=255, blank=True, default='')
+    status = models.PositiveSmallIntegerField('status')
+    duration = models.FloatField('duration in seconds')
+    samples = models.PositiveIntegerField('samples', default=0)
+    stacks = models.TextField('collapsed stacks', blank=True, default='')
+    created = models.DateTimeField('created', default=timezone.now, db_index=True)
+
+    def __str__(self):
+        """
+        Used to get the string representation of RequestProfile model. Overrides default __str__() function.
+
+        :return: String representation of RequestProfile
+        :rtype: string
+        """
+        return '{} {} ({:.0f} ms)'.format(self.method, self.path, self.duration * 1000)
+
+
+class MetricCounter(models.Model):
+    """
+    MetricCounter class represents a bucket of a histogram of the request metrics, or the sum of its observed values,
+    shared by the worker processes. It contains following attributes:
+    metric, view, bucket, value
+    Counters are increased by the workers, see site_app.metrics.
+    Methods:
+    __str__()
+    """
+
+    class Meta:
+        app_label = 'site_app'
+        verbose_name = 'metric counter'
+        verbose_name_plural = 'metric counters'
+        abstract = False
+        unique_together = [('metric', 'view', 'bucket')]
+
+    metric = models.CharField('metric', max_length=20)
+    view = models.CharField('view', max_length=255)
+    bucket = models.CharField('bucket', max_length=10)
+    value = models.BigIntegerField('value', default=0)
+
+    def __str__(self):
+        """
+        Used to get the string representation of MetricCounter model. Overrides default __str__() function.
+
+        :return: String representation of MetricCounter
+        :rtype: string
+        """
+        return '{} of {} ({}): {}'.format(self.metric, self.view, self.bucket, self.value)
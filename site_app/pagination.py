@@ -0,0 +1,200 @@
+"""
+Keyset (cursor) pagination. Instead of an OFFSET, every page continues right after the last row of the previous page,
+so fetching a page costs the same regardless of how deep into the list it is and can be answered from an index
+covering the ordering fields.
+
+The module also provides a paginator for the administration site that avoids counting all rows of large tables.
+"""
+import base64
+import json
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.core.paginator import Paginator
+from django.db import connection
+from django.db.models import Q
+from django.db.models.constants import LOOKUP_SEP
+from django.utils.functional import cached_property
+
+
+def encode_cursor(values):
+    """
+    Encodes the ordering values of a row into an opaque cursor.
+
+    :param values: (list) Values of the ordering fields
+    :return: URL-safe cursor
+    :rtype: string
+    """
+    return base64.urlsafe_b64encode(json.dumps(values).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """
+    Decodes a cursor created by encode_cursor.
+
+    :param cursor: (string) The cursor
+    :raises: ValueError
+    :return: Values of the ordering fields
+    :rtype: list
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+    except (TypeError, ValueError, UnicodeError):
+        raise ValueError('Invalid cursor')
+    if not isinstance(values, list) or not all(
+            value is None or isinstance(value, (str, int, float)) for value in values):
+        raise ValueError('Invalid cursor')
+    return values
+
+
+def _after(field, descending, value, tail):
+    # NULLs sort first in ascending order in SQLite and MySQL and last in PostgreSQL and Oracle, in descending order
+    # the other way round
+    nulls_first = descending == connection.features.nulls_order_largest
+    later = Q(**{field + ('__lt' if descending else '__gt'): value})
+    if nulls_first:
+        if value is None:
+            return Q(**{field + '__isnull': False}) | (Q(**{field + '__isnull': True}) & tail)
+        return later | (Q(**{field: value}) & tail)
+    if value is None:
+        return Q(**{field + '__isnull': True}) & tail
+    return later | Q(**{field + '__isnull': True}) | (Q(**{field: value}) & tail)
+
+
+def keyset_filter(ordering, values):
+    """
+    Builds a condition selecting rows that come after the row with given values in given ordering.
+
+    :param ordering: (list) Ordering fields or lookups of related fields, optionally prefixed with '-'. The last one
+        has to be unique and not null.
+    :param values: (list) Values of the ordering fields of the last row seen
+    :raises: ValueError
+    :return: Filter condition
+    :rtype: Q
+    """
+    if len(ordering) != len(values):
+        raise ValueError('Invalid cursor')
+    fields = [(name.lstrip('-'), name.startswith('-')) for name in ordering]
+    field, descending = fields[-1]
+    if values[-1] is None:
+        raise ValueError('Invalid cursor')
+    condition = Q(**{field + ('__lt' if descending else '__gt'): values[-1]})
+    for (field, descending), value in reversed(list(zip(fields[:-1], values[:-1]))):
+        condition = _after(field, descending, value, condition)
+    return condition
+
+
+class KeysetPage(object):
+    """
+    A single page of keyset pagination. Attributes:
+    object_list, has_next, next_cursor
+    Ordering fields have to be concrete fields of the model, of related models selected with the rows, or annotations,
+    so that their values can be read from fetched rows.
+    """
+
+    def __init__(self, queryset, ordering, cursor=None, size=50):
+        """
+        Fetches the page with a single query.
+
+        :param queryset: (QuerySet) Filtered rows to paginate
+        :param ordering: (list) Ordering fields, the last one has to be unique
+        :param cursor: (string) Cursor of the previous page, None for the first one
+        :param size: (int) Number of rows on a page
+        :raises: ValueError
+        """
+        self.ordering = list(ordering)
+        queryset = queryset.order_by(*self.ordering)
+        if cursor:
+            queryset = queryset.filter(keyset_filter(self.ordering, decode_cursor(cursor)))
+        rows = list(queryset[:size + 1])
+        self.has_next = len(rows) > size
+        self.object_list = rows[:size]
+        self.next_cursor = encode_cursor(self.cursor_values(self.object_list[-1])) if self.has_next else None
+
+    def cursor_values(self, obj):
+        """
+        Reads the values of ordering fields of the given row.
+
+        :param obj: (Model) The row
+        :return: Values of the ordering fields
+        :rtype: list
+        """
+        values = []
+        for name in self.ordering:
+            name = name.lstrip('-')
+            if isinstance(obj, dict):
+                # Rows of values() querysets are keyed by the lookups
+                values.append(obj[name])
+                continue
+            value = obj
+            *related, name = name.split(LOOKUP_SEP)
+            # Lookups of related fields are followed through the related objects, which should be selected with the
+            # rows
+            for part in related:
+                value = getattr(value, part) if value is not None else None
+            if value is not None:
+                try:
+                    name = value._meta.get_field(name).attname
+                except FieldDoesNotExist:
+                    # Annotations are read under their own name
+                    pass
+                value = getattr(value, name)
+            values.append(value)
+        return values
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator estimating the number of rows of unfiltered querysets of large tables instead of counting them.
+    The estimate is read from the statistics of the query planner, which are kept up to date by ANALYZE. Filtered
+    querysets and tables smaller than ESTIMATED_COUNT_THRESHOLD are counted exactly. Tables without statistics are
+    counted up to ESTIMATED_COUNT_LIMIT rows, the pages of further rows are only reachable by filtering the list.
+    Unfiltered querysets are counted without their annotations, which would otherwise be computed for every row of the
+    table.
+    """
+
+    @cached_property
+    def count(self):
+        query = getattr(self.object_list, 'query', None)
+        if query is not None and not query.where and not query.distinct:
+            model = self.object_list.model
+            estimate = estimate_count(model)
+            if estimate is not None and estimate >= getattr(settings, 'ESTIMATED_COUNT_THRESHOLD', 10000):
+                return estimate
+            # A sliced queryset is counted in a subquery, which stops reading the table at the limit
+            return model._default_manager.all()[:getattr(settings, 'ESTIMATED_COUNT_LIMIT', 100000)].count()
+        return super(EstimatedCountPaginator, self).count
+
+
+def estimate_count(model):
+    """
+    Estimates the number of rows of the table of given model from the statistics of the query planner, without
+    scanning it. SQLite only keeps the statistics after ANALYZE was run.
+
+    :param model: (Model) The model
+    :return: Estimated number of rows, None if the database has no statistics of the table
+    :rtype: int
+    """
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SELECT reltuples FROM pg_class WHERE relname = %s', [table])
+        elif connection.vendor == 'sqlite':
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'")
+            if cursor.fetchone() is None:
+                return None
+            # The first number of the statistics of every index is the number of rows of the table
+            cursor.execute('SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1', [table])
+        else:
+            return None
+        row = cursor.fetchone()
+    # PostgreSQL reports -1 rows for tables that were never analyzed
+    if row is None or float(str(row[0]).split()[0]) < 0:
+        return None
+    return int(float(str(row[0]).split()[0]))
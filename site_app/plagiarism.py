@@ -0,0 +1,217 @@
+"""
+Plagiarism screening of thesis files. The text of every uploaded thesis is extracted and split into shingles, runs of
+five consecutive words, summarised by a MinHash signature. The bands of the signatures are stored as buckets in an
+indexed table (locality-sensitive hashing), so a new submission is only compared with the archived theses sharing one
+of its buckets instead of with the whole archive. Pairs whose estimated similarity reaches PLAGIARISM_THRESHOLD are
+stored as matches of both theses and shown to their reviewers.
+
+Screening runs in the background, because extracting and hashing a long thesis takes about a second. Uploads queue a
+screen_thesis job, see site_app.jobs, and the screen_theses management command screens any thesis whose current file
+was not screened yet. The signature records the SHA-256 digest of the screened content, so a file replaced under the
+same name is screened again.
+
+Text is extracted from plain text, DOCX and ODT files with the standard library, from PDF files with pdfminer.six when
+it is installed, and from other files, e.g. legacy DOC, by collecting the runs of readable characters.
+"""
+import re
+import zipfile
+from xml.etree import ElementTree
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import BooleanField, F, Q
+from django.db.models.expressions import RawSQL
+from django.utils import timezone
+
+from .models import Thesis, ThesisSignature, ThesisBand, PlagiarismMatch, StoredFile
+from . import caching
+from . import similarity
+
+SHINGLE_WORDS = 5
+# Rows of a band, two rows make theses with a third of their shingles in common very likely to share a bucket
+BAND_ROWS = 2
+# Extracted text is truncated to this many characters
+MAX_TEXT_LENGTH = 2 * 1024 * 1024
+TEXT_EXTENSIONS = ('.txt', '.md', '.tex', '.rst', '.html')
+XML_DOCUMENTS = {'.docx': 'word/document.xml', '.odt': 'content.xml'}
+# Runs of letters, digits and punctuation in binary files such as legacy DOC
+READABLE_RUN = re.compile(rb'[\x20-\x7e\t\r\n]{4,}|(?:[\x20-\x7e]\x00){4,}')
+
+
+class ExtractionError(Exception):
+    """
+    Error raised when no text can be extracted from a thesis file.
+    """
+
+
+def plagiarism_threshold():
+    """
+    Gets the estimated similarity from which theses are reported, configured by the PLAGIARISM_THRESHOLD setting.
+
+    :return: The threshold between 0 and 1
+    :rtype: float
+    """
+    return getattr(settings, 'PLAGIARISM_THRESHOLD', 0.3)
+
+
+def _xml_text(data):
+    root = ElementTree.fromstring(data)
+    return ' '.join(text for text in root.itertext())
+
+
+def _pdf_text(f):
+    try:
+        from pdfminer.high_level import extract_text
+    except ImportError:
+        raise ExtractionError('Extracting text from PDF files requires pdfminer.six')
+    return extract_text(f)
+
+
+def extract_text(fieldfile):
+    """
+    Extracts the text of a thesis file.
+
+    :param fieldfile: (FieldFile) The file
+    :raises: ExtractionError
+    :return: The text
+    :rtype: string
+    """
+    name = fieldfile.name.lower()
+    extension = name[name.rfind('.'):] if '.' in name else ''
+    with fieldfile.storage.open(fieldfile.name, 'rb') as f:
+        if extension in TEXT_EXTENSIONS:
+            return f.read(MAX_TEXT_LENGTH).decode('utf-8', 'replace')
+        if extension in XML_DOCUMENTS:
+            try:
+                with zipfile.ZipFile(f) as document:
+                    return _xml_text(document.read(XML_DOCUMENTS[extension]))[:MAX_TEXT_LENGTH]
+            except (zipfile.BadZipfile, KeyError, ElementTree.ParseError):
+                raise ExtractionError('Damaged {} file'.format(extension))
+        if extension == '.pdf':
+            return _pdf_text(f)[:MAX_TEXT_LENGTH]
+        data = f.read(4 * MAX_TEXT_LENGTH)
+    runs = [run.replace(b'\x00', b'') for run in READABLE_RUN.findall(data)]
+    return b' '.join(runs).decode('ascii', 'replace')[:MAX_TEXT_LENGTH]
+
+
+def shingles(text):
+    """
+    Splits a text into the set of its runs of five consecutive words.
+
+    :param text: (string) The text
+    :return: The shingles
+    :rtype: set
+    """
+    words = re.findall(r'\w+', text.lower())
+    if len(words) < SHINGLE_WORDS:
+        return {' '.join(words)} if words else set()
+    return {' '.join(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)}
+
+
+def _content_changed():
+    """
+    Builds the condition that the stored content of the thesis file differs from the screened content.
+
+    :return: EXISTS subquery usable as a queryset annotation
+    :rtype: RawSQL
+    """
+    qn = connection.ops.quote_name
+    thesis, stored, signature = Thesis._meta, StoredFile._meta, ThesisSignature._meta
+    sql = ('EXISTS (SELECT 1 FROM {stored} WHERE {stored}.{name} = {thesis}.{file} AND {stored}.{blob} <> COALESCE('
+           "(SELECT {signature}.{digest} FROM {signature} WHERE {signature}.{thesis_id} = {thesis}.{pk}), ''))")
+    sql = sql.format(stored=qn(stored.db_table), name=qn(stored.get_field('name').column),
+                     blob=qn(stored.get_field('blob').column), thesis=qn(thesis.db_table),
+                     file=qn(thesis.get_field('file').column), pk=qn(thesis.pk.column),
+                     signature=qn(signature.db_table), digest=qn(signature.get_field('digest').column),
+                     thesis_id=qn(signature.get_field('thesis').column))
+    return RawSQL(sql, (), output_field=BooleanField())
+
+
+def pending_theses():
+    """
+    Gets the theses whose current file was not screened yet, either because its name or its content changed.
+
+    :return: The theses
+    :rtype: QuerySet
+    """
+    theses = Thesis.objects.exclude(Q(file='') | Q(file__isnull=True)).annotate(content_changed=_content_changed())
+    return theses.filter(Q(signature__isnull=True) | ~Q(signature__file_name=F('file')) | Q(content_changed=True))
+
+
+def screen_thesis(thesis):
+    """
+    Computes the signature of a thesis file, stores it in the index and records the matching archived theses.
+
+    :param thesis: (Thesis) The thesis
+    :return: The matches of the thesis, the most similar first
+    :rtype: list
+    """
+    # Read before the text, so that content replaced meanwhile is screened again
+    digest = StoredFile.objects.filter(name=thesis.file.name).values_list('blob_id', flat=True).first() or ''
+    try:
+        items = shingles(extract_text(thesis.file))
+        error = '' if items else 'The file contains no text'
+    except (ExtractionError, OSError) as e:
+        items, error = set(), str(e)[:255]
+    signature = similarity.minhash(items)
+    buckets = similarity.buckets(signature, BAND_ROWS) if signature else []
+
+    threshold, scores = plagiarism_threshold(), {}
+    if buckets:
+        candidates = ThesisBand.objects.filter(bucket__in=buckets).exclude(thesis_id=thesis.id).values('thesis_id')
+        stored = ThesisSignature.objects.filter(thesis_id__in=candidates, signature__isnull=False)
+        for other_id, data in stored.values_list('thesis_id', 'signature'):
+            score = similarity.similarity(signature, similarity.unpack_signature(data))
+            if score >= threshold:
+                scores[other_id] = score
+
+    with transaction.atomic():
+        ThesisSignature.objects.update_or_create(thesis_id=thesis.id, defaults={
+            'file_name': thesis.file.name, 'digest': digest,
+            'signature': similarity.pack_signature(signature) if signature else None, 'shingles': len(items),
+            'error': error, 'screened': timezone.now()})
+        ThesisBand.objects.filter(thesis_id=thesis.id).delete()
+        ThesisBand.objects.bulk_create([ThesisBand(thesis_id=thesis.id, bucket=bucket) for bucket in buckets])
+        PlagiarismMatch.objects.filter(Q(thesis_id=thesis.id) | Q(other_id=thesis.id)).delete()
+        PlagiarismMatch.objects.bulk_create(
+            [PlagiarismMatch(thesis_id=thesis.id, other_id=other_id, similarity=score)
+             for other_id, score in scores.items()] +
+            [PlagiarismMatch(thesis_id=other_id, other_id=thesis.id, similarity=score)
+             for other_id, score in scores.items()])
+    # The reports are shown in the cached review lists
+    caching.bump_versions(caching.THESES)
+    return sorted(scores.items(), key=lambda item: -item[1])
+
+
+def screen_pending(limit=None):
+    """
+    Screens the theses whose current file was not screened yet.
+
+    :param limit: (int) Maximal number of screened theses, None for all
+    :return: Number of screened theses
+    :rtype: int
+    """
+    theses = pending_theses().order_by('id').only('id', 'file')
+    if limit is not None:
+        theses = theses[:limit]
+    count = 0
+    for thesis in theses:
+        screen_thesis(thesis)
+        count += 1
+    return count
+
+
+def attach_reports(theses):
+    """
+    Loads the plagiarism reports of theses with a single query and stores them in their plagiarism_report attribute,
+    a list of matches ordered from the most similar.
+
+    :param theses: (iterable) The theses
+    """
+    theses = {thesis.id: thesis for thesis in theses}
+    for thesis in theses.values():
+        thesis.plagiarism_report = []
+    matches = PlagiarismMatch.objects.filter(thesis_id__in=list(theses)).select_related(
+        'other__topic', 'other__student').order_by('-similarity')
+    for match in matches:
+        theses[match.thesis_id].plagiarism_report.append(match)
@@ -0,0 +1,249 @@
+"""
+Sampling profiler of live requests. Administrators switch it on with profiling rules selecting the requests of a user,
+the requests whose path matches a pattern and a percentage of them. While a selected request is handled, a sampler
+thread records the call stack of the thread handling it every PROFILING_INTERVAL seconds. The stacks are stored
+collapsed, in the format read by flamegraph.pl and speedscope, as a RequestProfile, and shown as a flame graph in the
+administration site.
+
+The enabled rules are kept in the process memory and reloaded when the version of the rules in the shared cache
+changes, which happens whenever a rule is saved or deleted. With no rules enabled the ProfilingMiddleware only reads
+that version, and requests that are not selected run without the sampler.
+"""
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from .models import ProfilingRule, RequestProfile
+
+RULES_VERSION_KEY = 'site_app:profiling:version'
+# Boxes of the flame graph narrower than this percentage of the samples are left out
+MIN_BOX_WIDTH = 0.1
+
+_rules = {'version': None, 'rules': []}
+
+
+def sampling_interval():
+    """
+    Gets the time between two samples of a profiled request, configured by the PROFILING_INTERVAL setting.
+
+    :return: Number of seconds
+    :rtype: float
+    """
+    return getattr(settings, 'PROFILING_INTERVAL', 0.005)
+
+
+def get_rules():
+    """
+    Gets the enabled profiling rules. The rules are loaded on first use and then served from the process memory until
+    they are invalidated.
+
+    :return: Tuples of the rule ID, user ID, compiled path pattern, percentage and expiry of the rules
+    :rtype: list
+    """
+    version = cache.get_or_set(RULES_VERSION_KEY, uuid.uuid4().hex, None)
+    if _rules['version'] != version:
+        rules = ProfilingRule.objects.filter(enabled=True).values_list(
+            'id', 'user_id', 'path_pattern', 'percentage', 'expires')
+        _rules.update(version=version, rules=[
+            (rule_id, user_id, re.compile(pattern) if pattern else None, percentage, expires)
+            for rule_id, user_id, pattern, percentage, expires in rules])
+    return _rules['rules']
+
+
+def invalidate_rules():
+    """
+    Makes every process reload the profiling rules.
+    """
+    cache.delete(RULES_VERSION_KEY)
+
+
+def select_rule(request, rules):
+    """
+    Finds the rule selecting a request for profiling.
+
+    :param request: (HttpRequest) The request
+    :param rules: (list) The rules, see get_rules
+    :return: ID of the first matching rule, None if the request is not profiled
+    :rtype: int
+    """
+    now = timezone.now()
+    for rule_id, user_id, pattern, percentage, expires in rules:
+        if expires is not None and expires <= now:
+            continue
+        if pattern is not None and not pattern.search(request.path):
+            continue
+        if user_id is not None and getattr(getattr(request, 'user', None), 'pk', None) != user_id:
+            continue
+        if random.random() * 100 < percentage:
+            return rule_id
+    return None
+
+
+def collapse(frame, stop_code=None):
+    """
+    Collapses a call stack into a line of frames from the outermost one separated by semicolons.
+
+    :param frame: (frame) The innermost frame
+    :param stop_code: (code) Code of the frame the stack starts after, None for the whole stack
+    :return: The collapsed stack
+    :rtype: string
+    """
+    names = []
+    while frame is not None and frame.f_code is not stop_code:
+        names.append('{}:{}'.format(frame.f_globals.get('__name__', '?'), frame.f_code.co_name))
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class Sampler(threading.Thread):
+    """
+    Thread sampling the call stack of another thread until it is stopped. Attributes:
+    stacks, a Counter of collapsed stacks to the number of their samples
+    """
+
+    def __init__(self, thread_id, stop_code=None, interval=None):
+        """
+        Prepares the sampler, which starts sampling when started.
+
+        :param thread_id: (int) Identifier of the sampled thread
+        :param stop_code: (code) Code of the frame the recorded stacks start after
+        :param interval: (float) Seconds between two samples, defaults to PROFILING_INTERVAL
+        """
+        super(Sampler, self).__init__(name='profiling-sampler', daemon=True)
+        self.thread_id = thread_id
+        self.stop_code = stop_code
+        self.interval = interval or sampling_interval()
+        self.stacks = Counter()
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.stacks[collapse(frame, self.stop_code)] += 1
+
+    def stop(self):
+        """
+        Stops sampling and waits for the thread to finish.
+
+        :return: The sampled stacks
+        :rtype: Counter
+        """
+        self._stopped.set()
+        self.join()
+        return self.stacks
+
+
+def format_stacks(stacks):
+    """
+    Formats sampled stacks in the collapsed format, the most frequent first.
+
+    :param stacks: (Counter) Collapsed stacks to the number of their samples
+    :return: The lines of the stacks
+    :rtype: string
+    """
+    return ''.join('{} {}\n'.format(stack, samples) for stack, samples in stacks.most_common())
+
+
+def parse_stacks(text):
+    """
+    Reads stacks in the collapsed format.
+
+    :param text: (string) The lines of the stacks
+    :return: Collapsed stacks to the number of their samples
+    :rtype: Counter
+    """
+    stacks = Counter()
+    for line in text.splitlines():
+        stack, _, samples = line.rpartition(' ')
+        if stack and samples.isdigit():
+            stacks[stack] += int(samples)
+    return stacks
+
+
+def merge_profiles(profiles):
+    """
+    Sums the stacks of several profiles.
+
+    :param profiles: (iterable) The profiles
+    :return: Collapsed stacks to the number of their samples
+    :rtype: Counter
+    """
+    stacks = Counter()
+    for profile in profiles:
+        stacks.update(parse_stacks(profile.stacks))
+    return stacks
+
+
+def flame_graph(stacks):
+    """
+    Lays out sampled stacks as the boxes of a flame graph, the outermost frames at the top.
+
+    :param stacks: (Counter) Collapsed stacks to the number of their samples
+    :return: Dictionaries with the frame name, depth, samples and the offset and width in percent of the samples,
+        of every box wide enough to be shown
+    :rtype: list
+    """
+    total = sum(stacks.values())
+    if not total:
+        return []
+    tree = {}
+    for stack, samples in stacks.items():
+        children = tree
+        for name in stack.split(';'):
+            node = children.setdefault(name, [0, {}])
+            node[0] += samples
+            children = node[1]
+    boxes = []
+    pending = [(tree, 0, 0)]
+    while pending:
+        children, depth, offset = pending.pop()
+        for name in sorted(children):
+            samples, grandchildren = children[name]
+            width = samples * 100.0 / total
+            if width >= MIN_BOX_WIDTH:
+                boxes.append({'name': name, 'depth': depth, 'samples': samples, 'left': offset * 100.0 / total,
+                              'width': width})
+                pending.append((grandchildren, depth + 1, offset))
+            offset += samples
+    return sorted(boxes, key=lambda box: (box['depth'], box['left']))
+
+
+class ProfilingMiddleware(object):
+    """
+    Middleware profiling the requests selected by the profiling rules. Has to be placed after the
+    AuthenticationMiddleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        rules = get_rules()
+        rule_id = select_rule(request, rules) if rules else None
+        if rule_id is None:
+            return self.get_response(request)
+        sampler = Sampler(threading.get_ident(), stop_code=sys._getframe().f_code)
+        started = time.perf_counter()
+        sampler.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            stacks = sampler.stop()
+        duration = time.perf_counter() - started
+        user = getattr(request, 'user', None)
+        match = getattr(request, 'resolver_match', None)
+        RequestProfile.objects.create(
+            rule_id=rule_id, user_id=user.pk if user is not None and user.is_authenticated else None,
+            method=request.method, path=request.path[:255], view=match.view_name if match is not None else '',
+            status=response.status_code, duration=duration, samples=sum(stacks.values()),
+            stacks=format_stacks(stacks))
+        return response
@@ -0,0 +1,152 @@
+"""
+Role resolution for the users of the site. The names of the groups a user belongs to are loaded once per request and
+kept on the user instance, so the navigation bar, the profile page and the view permission checks share one lookup.
+When ROLE_SESSION_CACHE is enabled the names are also kept in the session between requests.
+
+The module also keeps the directory of supervisors offered in the forms, cached in the process and in the shared cache
+until the membership of the Supervisor group changes.
+"""
+import uuid
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.utils.functional import empty
+
+from . import caching
+
+ROLE_CACHE_ATTR = '_role_names'
+ROLE_SESSION_KEY = '_role_names'
+ROLE_VERSION_KEY = 'site_app:roles:{}'
+SUPERVISOR_GROUP = 'Supervisor'
+SUPERVISOR_VERSION_KEY = 'site_app:supervisors:version'
+SUPERVISOR_DIRECTORY_KEY = 'site_app:supervisors:{}'
+
+# Copy of the supervisor directory kept by this process, together with the version it was built for
+_supervisor_directory = {'version': None, 'choices': None}
+
+
+def get_role_names(user):
+    """
+    Gets the names of the groups of the given user. The result is cached on the user instance.
+
+    :param user: (User) The user whose roles are resolved
+    :return: Names of the groups the user belongs to
+    :rtype: frozenset
+    """
+    if not user.is_authenticated:
+        return frozenset()
+    names = getattr(user, ROLE_CACHE_ATTR, None)
+    if names is None:
+        names = frozenset(user.groups.values_list('name', flat=True))
+        setattr(user, ROLE_CACHE_ATTR, names)
+    return names
+
+
+def has_role(user, group_name):
+    """
+    Checks whether user belongs to the given group. Administrators have every role.
+
+    :param user: (User) The user to check
+    :param group_name: (string) Name of the group
+    :return: Indicator whether user has the role
+    :rtype: bool
+    """
+    if not user.is_authenticated:
+        return False
+    return user.is_admin or group_name in get_role_names(user)
+
+
+def get_role_version(user_id):
+    """
+    Gets the token describing the current state of the group membership of a user. The token changes every time the
+    membership is invalidated, which makes the copies kept in sessions stale.
+
+    :param user_id: (int) ID of the user
+    :return: Version token
+    :rtype: string
+    """
+    return cache.get_or_set(ROLE_VERSION_KEY.format(user_id), uuid.uuid4().hex, None)
+
+
+def invalidate_roles(user_ids, instance=None):
+    """
+    Invalidates cached roles of the given users.
+
+    :param user_ids: (iterable) IDs of the users whose group membership changed
+    :param instance: (User) Optional user instance whose in-memory cache should be dropped as well
+    """
+    if instance is not None and hasattr(instance, ROLE_CACHE_ATTR):
+        delattr(instance, ROLE_CACHE_ATTR)
+    cache.delete_many([ROLE_VERSION_KEY.format(user_id) for user_id in user_ids])
+
+
+def load_session_roles(request):
+    """
+    Primes the role cache of the request user with the names stored in the session, if they are still current.
+
+    :param request: (HttpRequest) The request performed by user
+    """
+    stored = request.session.get(ROLE_SESSION_KEY)
+    if not stored or not request.user.is_authenticated:
+        return
+    version, names = stored
+    if version == get_role_version(request.user.pk):
+        setattr(request.user, ROLE_CACHE_ATTR, frozenset(names))
+
+
+def save_session_roles(request):
+    """
+    Stores the role names resolved during the request in the session.
+
+    :param request: (HttpRequest) The request performed by user
+    """
+    user = getattr(request, 'user', None)
+    # Do not load the user only to store its roles
+    if user is None or getattr(user, '_wrapped', None) is empty or not hasattr(request, 'session'):
+        return
+    names = getattr(user, ROLE_CACHE_ATTR, None) if user.is_authenticated else None
+    if names is None:
+        return
+    stored = [get_role_version(user.pk), sorted(names)]
+    if request.session.get(ROLE_SESSION_KEY) != stored:
+        request.session[ROLE_SESSION_KEY] = stored
+
+
+def session_cache_enabled():
+    """
+    Checks whether roles should be kept in the session between requests.
+
+    :return: Value of the ROLE_SESSION_CACHE setting
+    :rtype: bool
+    """
+    return getattr(settings, 'ROLE_SESSION_CACHE', False)
+
+
+def get_supervisor_choices():
+    """
+    Gets the directory of supervisors as form choices. The directory is built on first use and then served from the
+    process memory or the shared cache until it is invalidated.
+
+    :return: Pairs of supervisor ID and name
+    :rtype: list
+    """
+    version = cache.get_or_set(SUPERVISOR_VERSION_KEY, uuid.uuid4().hex, None)
+    if _supervisor_directory['version'] == version:
+        return _supervisor_directory['choices']
+    key = SUPERVISOR_DIRECTORY_KEY.format(version)
+    choices = cache.get(key)
+    if choices is None:
+        supervisors = get_user_model().objects.filter(groups__name=SUPERVISOR_GROUP).order_by('last_name', 'id')
+        choices = [(supervisor.id, str(supervisor)) for supervisor in supervisors]
+        cache.set(key, choices, None)
+    _supervisor_directory.update(version=version, choices=choices)
+    return choices
+
+
+def invalidate_supervisor_directory():
+    """
+    Invalidates the directory of supervisors in every process and the cached forms offering it.
+    """
+    cache.delete(SUPERVISOR_VERSION_KEY)
+    caching.bump_versions(caching.USERS)
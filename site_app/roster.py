@@ -0,0 +1,278 @@
+"""
+Bulk import of user rosters. A roster is a CSV or XLSX file with a header row and one user per row. Recognised columns:
+email (required), index_number, first_name, last_name, degree, faculty (code), department, password and groups
+(names separated by semicolons). Unknown columns are ignored.
+
+Rows are read as a stream and imported in batches. Users are matched by e-mail, ignoring its case, or by index number
+unless it is the default one; existing users are updated in place and new ones are created with a single bulk insert
+per batch, together with their group memberships. Initial passwords are hashed in a pool of worker processes while the
+batch is being matched against the database. Rows without a password get an unusable one, so that the user has to
+reset it. XLSX rosters require openpyxl.
+"""
+import csv
+import io
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import Group
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.functions import Lower
+
+from .models import User, Faculty, LEVELS
+from . import roles
+
+FIELDS = ('index_number', 'first_name', 'last_name', 'degree', 'faculty', 'department')
+GROUP_SEPARATOR = ';'
+# Index number given to users created without one, it does not identify anybody
+DEFAULT_INDEX_NUMBER = User._meta.get_field('index_number').default
+
+
+class RosterError(Exception):
+    """
+    Error making the whole roster unreadable.
+    """
+
+
+class ImportResult(object):
+    """
+    Summary of a roster import. Attributes:
+    created, updated, errors (list of line number and message pairs)
+    """
+
+    def __init__(self):
+        self.created = 0
+        self.updated = 0
+        self.errors = []
+
+    def __str__(self):
+        return 'Created {} users, updated {}, skipped {} rows'.format(self.created, self.updated, len(self.errors))
+
+
+def _normalize_header(name):
+    return str(name or '').strip().lower().replace(' ', '_')
+
+
+def _read_csv(f):
+    if not isinstance(f, io.TextIOBase):
+        f = io.TextIOWrapper(f, encoding='utf-8-sig', newline='')
+    reader = csv.reader(f)
+    header = [_normalize_header(name) for name in next(reader, [])]
+    for row in reader:
+        yield dict(zip(header, row))
+
+
+def _read_xlsx(f):
+    try:
+        import openpyxl
+    except ImportError:
+        raise RosterError('Importing XLSX rosters requires openpyxl')
+    sheet = openpyxl.load_workbook(f, read_only=True).active
+    rows = sheet.iter_rows()
+    header = [_normalize_header(cell.value) for cell in next(rows, [])]
+    for row in rows:
+        yield dict(zip(header, ['' if cell.value is None else str(cell.value) for cell in row]))
+
+
+def read_roster(f, filename):
+    """
+    Reads the rows of a roster one at a time.
+
+    :param f: (file) Binary file object of the roster
+    :param filename: (string) Name of the file, its extension selects the format
+    :raises: RosterError
+    :return: Generator of line numbers and rows, rows being dictionaries of the column values
+    :rtype: generator
+    """
+    rows = _read_xlsx(f) if filename.lower().endswith('.xlsx') else _read_csv(f)
+    for line, row in enumerate(rows, start=2):
+        row = {key: value.strip() for key, value in row.items() if key}
+        if any(row.values()):
+            yield line, row
+
+
+def hash_password(password):
+    """
+    Hashes an initial password, run in the worker processes.
+
+    :param password: (string) The password or an empty string for an unusable one
+    :return: Encoded password hash
+    :rtype: string
+    """
+    return make_password(password or None)
+
+
+def _batches(rows, size):
+    batch = []
+    for item in rows:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class RosterImporter(object):
+    """
+    Imports rows of a roster in batches. See the module documentation for the columns.
+    """
+
+    def __init__(self, batch_size=500, workers=None, groups=()):
+        """
+        :param batch_size: (int) Number of rows written in a single transaction
+        :param workers: (int) Number of processes hashing passwords, 0 hashes them in this process, None uses the
+            number of CPUs
+        :param groups: (list) Names of groups every imported user is added to
+        """
+        self.batch_size = batch_size
+        self.workers = workers
+        self.default_groups = list(groups)
+        self.faculties = dict(Faculty.objects.values_list('code', 'id'))
+        self.groups = dict(Group.objects.values_list('name', 'id'))
+        missing = [name for name in self.default_groups if name not in self.groups]
+        if missing:
+            raise RosterError('Unknown groups: {}'.format(', '.join(missing)))
+        self.result = ImportResult()
+
+    def run(self, rows):
+        """
+        Imports the rows.
+
+        :param rows: (iterable) Line numbers and rows as returned by read_roster
+        :return: Summary of the import
+        :rtype: ImportResult
+        """
+        pool = ProcessPoolExecutor(self.workers) if self.workers != 0 else None
+        touched_supervisors = False
+        try:
+            for batch in _batches(rows, self.batch_size):
+                touched_supervisors |= self.import_batch(batch, pool)
+        finally:
+            if pool is not None:
+                pool.shutdown()
+        if touched_supervisors:
+            roles.invalidate_supervisor_directory()
+        return self.result
+
+    def clean_row(self, line, row):
+        """
+        Validates a row and converts it into user field values.
+
+        :param line: (int) Line number of the row, used in error messages
+        :param row: (dict) Column values
+        :raises: ValidationError
+        :return: E-mail, field values, password and group IDs
+        :rtype: tuple
+        """
+        email = User.objects.normalize_email(row.get('email', ''))
+        validate_email(email)
+        values = {field: row[field] for field in FIELDS if row.get(field)}
+        if 'degree' in values and values['degree'] not in LEVELS:
+            raise ValidationError('Unknown degree {}'.format(values['degree']))
+        if 'faculty' in values:
+            if values['faculty'] not in self.faculties:
+                raise ValidationError('Unknown faculty {}'.format(values['faculty']))
+            values['faculty_id'] = self.faculties[values.pop('faculty')]
+        names = [name.strip() for name in row.get('groups', '').split(GROUP_SEPARATOR) if name.strip()]
+        unknown = [name for name in names if name not in self.groups]
+        if unknown:
+            raise ValidationError('Unknown groups: {}'.format(', '.join(unknown)))
+        group_ids = {self.groups[name] for name in names + self.default_groups}
+        return email, values, row.get('password', ''), group_ids
+
+    def import_batch(self, batch, pool):
+        """
+        Imports a batch of rows in a single transaction.
+
+        :param batch: (list) Line numbers and rows
+        :param pool: (ProcessPoolExecutor) Pool hashing the passwords or None to hash them in this process
+        :return: Indicator whether a supervisor was created or changed
+        :rtype: bool
+        """
+        cleaned = {}
+        for line, row in batch:
+            try:
+                email, values, password, group_ids = self.clean_row(line, row)
+            except ValidationError as e:
+                self.result.errors.append((line, '; '.join(e.messages)))
+                continue
+            # A later row for the same user replaces the earlier one
+            cleaned[email.lower()] = (email, values, password, group_ids)
+        if not cleaned:
+            return False
+
+        rows = list(cleaned.values())
+        new_passwords = [password for email, values, password, group_ids in rows]
+        hashes = pool.map(hash_password, new_passwords, chunksize=max(1, len(rows) // 32)) if pool else None
+
+        # Matching runs while the workers hash the passwords
+        indexes = [values['index_number'] for email, values, password, group_ids in rows
+                   if values.get('index_number', DEFAULT_INDEX_NUMBER) != DEFAULT_INDEX_NUMBER]
+        existing = User.objects.annotate(email_lower=Lower('email')).filter(
+            Q(email_lower__in=list(cleaned)) | Q(index_number__in=indexes))
+        by_email, by_index = {}, {}
+        for user_id, email, index_number in existing.order_by('id').values_list('id', 'email', 'index_number'):
+            by_email.setdefault(email.lower(), user_id)
+            if index_number != DEFAULT_INDEX_NUMBER:
+                by_index.setdefault(index_number, user_id)
+
+        hashes = list(hashes) if hashes is not None else [hash_password(password) for password in new_passwords]
+        created, updated, memberships = [], [], {}
+        for (email, values, password, group_ids), encoded in zip(rows, hashes):
+            user_id = by_email.get(email.lower()) or by_index.get(values.get('index_number'))
+            if user_id is None:
+                created.append(User(email=email, password=encoded, **values))
+                memberships[email] = group_ids
+            else:
+                if password:
+                    values['password'] = encoded
+                updated.append((user_id, values))
+                memberships[user_id] = group_ids
+
+        with transaction.atomic():
+            for user_id, values in updated:
+                if values:
+                    User.objects.filter(pk=user_id).update(**values)
+            User.objects.bulk_create(created)
+            # Primary keys of bulk inserted rows are not returned by every database
+            new_ids = dict(User.objects.filter(email__in=[user.email for user in created]).values_list('email', 'id'))
+            memberships = {new_ids.get(key, key): group_ids for key, group_ids in memberships.items()}
+            through = User.groups.through
+            current = set(through.objects.filter(user_id__in=memberships).values_list('user_id', 'group_id'))
+            through.objects.bulk_create([through(user_id=user_id, group_id=group_id)
+                                         for user_id, group_ids in memberships.items() for group_id in group_ids
+                                         if (user_id, group_id) not in current])
+
+        self.result.created += len(created)
+        self.result.updated += len(updated)
+        roles.invalidate_roles([user_id for user_id, values in updated])
+        supervisor_id = self.groups.get(roles.SUPERVISOR_GROUP)
+        return any(supervisor_id in group_ids for group_ids in memberships.values()) or bool(updated)
+
+
+def import_roster(f, filename, batch_size=500, workers=None, groups=(), max_rows=None):
+    """
+    Imports a roster file.
+
+    :param f: (file) Binary file object of the roster
+    :param filename: (string) Name of the file, its extension selects the format
+    :param batch_size: (int) Number of rows written in a single transaction
+    :param workers: (int) Number of processes hashing passwords, 0 hashes them in this process
+    :param groups: (list) Names of groups every imported user is added to
+    :param max_rows: (int) Rosters with more rows are rejected before anything is imported, None for no limit
+    :raises: RosterError
+    :return: Summary of the import
+    :rtype: ImportResult
+    """
+    importer = RosterImporter(batch_size, workers, groups)
+    rows = read_roster(f, filename)
+    if max_rows is not None:
+        rows = list(islice(rows, max_rows + 1))
+        if len(rows) > max_rows:
+            raise RosterError('The roster has more than {} rows, import it with the import_roster command'.format(
+                max_rows))
+    return importer.run(rows)
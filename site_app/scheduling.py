@@ -0,0 +1,205 @@
+"""
+Scheduling of thesis defenses. Every defense occupies one slot, i.e. a period in a room, and two defenses can not share
+a period when the same person takes part in both of them. The people taking part in a defense are the student and the
+supervisor of the thesis and the authors of its reviews.
+
+Scheduling is a greedy colouring of the conflict graph of the defenses, with the periods as colours. The defenses
+whose people take part in the most defenses are placed first, each into the earliest period in which a room is free
+and none of its people is busy. Whether a person is busy is read from an index of the periods of every person, so the
+defenses are never compared pairwise. Scheduled defenses outside the re-planned set keep their slots and block every
+period they overlap, also when they do not start at the start of a period.
+"""
+import csv
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from django.db import transaction
+from django.db.models import Case, When, Value, DateTimeField, CharField
+from django.utils import timezone
+
+from .models import Defense, Review
+
+UPDATE_BATCH_SIZE = 500
+# Length of a defense
+DEFAULT_DURATION = timedelta(minutes=30)
+
+
+class Schedule(object):
+    """
+    Computed schedule of defenses. Attributes:
+    slots (dictionary of defense ID to period start and room), unscheduled (IDs of defenses no slot was found for)
+    """
+
+    def __init__(self):
+        self.slots = {}
+        self.unscheduled = []
+
+    def __len__(self):
+        return len(self.slots)
+
+
+def generate_periods(first_day, days, day_start, day_end, duration, skip_weekends=True):
+    """
+    Generates the periods available for defenses.
+
+    :param first_day: (date) The first day of the defenses
+    :param days: (int) Number of days, weekends are not counted if they are skipped
+    :param day_start: (time) Start of the first period of a day
+    :param day_end: (time) End of the last period of a day
+    :param duration: (timedelta) Length of a period
+    :param skip_weekends: (bool) Indicator whether Saturdays and Sundays are skipped
+    :return: Starts of the periods in chronological order
+    :rtype: list
+    """
+    periods, day = [], first_day
+    while days > 0:
+        if not skip_weekends or day.weekday() < 5:
+            start = timezone.make_aware(datetime.combine(day, day_start))
+            end = timezone.make_aware(datetime.combine(day, day_end))
+            while start + duration <= end:
+                periods.append(start)
+                start += duration
+            days -= 1
+        day += timedelta(days=1)
+    return periods
+
+
+def participants(defenses):
+    """
+    Finds the people taking part in each of the defenses.
+
+    :param defenses: (QuerySet) The defenses
+    :return: Dictionary of defense ID to the set of IDs of its student, supervisor and reviewers
+    :rtype: dict
+    """
+    people, by_thesis = {}, defaultdict(list)
+    for defense_id, thesis_id, student_id, supervisor_id in defenses.values_list(
+            'id', 'thesis_id', 'thesis__student_id', 'thesis__supervisor_id').iterator():
+        people[defense_id] = {student_id, supervisor_id}
+        by_thesis[thesis_id].append(defense_id)
+    for thesis_id, author_id in Review.objects.filter(thesis_id__in=list(by_thesis)).values_list('thesis_id',
+                                                                                                'author_id'):
+        for defense_id in by_thesis[thesis_id]:
+            people[defense_id].add(author_id)
+    return people
+
+
+def plan_schedule(defenses, periods, rooms, duration=DEFAULT_DURATION):
+    """
+    Assigns a slot to each of the defenses.
+
+    :param defenses: (QuerySet) Defenses to schedule
+    :param periods: (list) Starts of the available periods in chronological order
+    :param rooms: (list) Names of the available rooms
+    :param duration: (timedelta) Length of a defense, also of the scheduled defenses that are not re-planned
+    :return: The schedule
+    :rtype: Schedule
+    """
+    schedule = Schedule()
+    people = participants(defenses)
+
+    # Scheduled defenses that are not re-planned keep their slots
+    busy = defaultdict(set)
+    free_rooms = [list(rooms) for period in periods]
+    fixed = Defense.objects.filter(scheduled=True).exclude(id__in=defenses.values('id'))
+    fixed = fixed.filter(date__gt=periods[0] - duration, date__lt=periods[-1] + duration) if periods else fixed.none()
+    fixed_people = participants(fixed)
+    for defense_id, date, room in fixed.values_list('id', 'date', 'room'):
+        # Periods starting less than a defense before or after the fixed defense overlap it
+        for i in range(bisect_right(periods, date - duration), bisect_left(periods, date + duration)):
+            if room in free_rooms[i]:
+                free_rooms[i].remove(room)
+            for person_id in fixed_people[defense_id]:
+                busy[person_id].add(i)
+
+    # The most constrained defenses are placed first, while there is still a choice of periods
+    counts = defaultdict(int)
+    for people_ids in people.values():
+        for person_id in people_ids:
+            counts[person_id] += 1
+    order = sorted(people, key=lambda defense_id: (-sum(counts[p] for p in people[defense_id]), defense_id))
+    # Periods before this one have no free room left
+    first_free = 0
+    for defense_id in order:
+        people_busy = [busy[person_id] for person_id in people[defense_id]]
+        for i in range(first_free, len(periods)):
+            if free_rooms[i] and not any(i in periods_busy for periods_busy in people_busy):
+                break
+        else:
+            schedule.unscheduled.append(defense_id)
+            continue
+        schedule.slots[defense_id] = (periods[i], free_rooms[i].pop(0))
+        for periods_busy in people_busy:
+            periods_busy.add(i)
+        while first_free < len(periods) and not free_rooms[first_free]:
+            first_free += 1
+    return schedule
+
+
+def apply_schedule(schedule, batch_size=UPDATE_BATCH_SIZE):
+    """
+    Stores the slots of a schedule in a single transaction, updating a batch of defenses with one query. The defenses
+    are marked as scheduled.
+
+    :param schedule: (Schedule) The schedule
+    :param batch_size: (int) Number of defenses updated by one query
+    :return: Number of updated defenses
+    :rtype: int
+    """
+    items = sorted(schedule.slots.items())
+    updated = 0
+    with transaction.atomic():
+        for start in range(0, len(items), batch_size):
+            batch = items[start:start + batch_size]
+            dates = Case(*[When(pk=defense_id, then=Value(date)) for defense_id, (date, room) in batch],
+                         output_field=DateTimeField())
+            rooms = Case(*[When(pk=defense_id, then=Value(room)) for defense_id, (date, room) in batch],
+                         output_field=CharField())
+            updated += Defense.objects.filter(pk__in=[defense_id for defense_id, slot in batch]).update(
+                date=dates, room=rooms, scheduled=True)
+    return updated
+
+
+def find_conflicts(defenses, duration=DEFAULT_DURATION):
+    """
+    Finds overlapping defenses sharing a room or a person.
+
+    :param defenses: (QuerySet) The defenses to check
+    :param duration: (timedelta) Length of a defense
+    :return: Pairs of the conflicting defense IDs and the reason
+    :rtype: list
+    """
+    people = participants(defenses)
+    # Defenses started less than a defense before the current one, which they overlap
+    running, conflicts = [], []
+    for defense_id, date, room in defenses.order_by('date', 'id').values_list('id', 'date', 'room'):
+        running = [item for item in running if item[1] + duration > date]
+        for other, other_date, other_room in running:
+            if room and room == other_room:
+                conflicts.append((other, defense_id, 'room {}'.format(room)))
+            for person_id in sorted(people[defense_id] & people[other]):
+                conflicts.append((other, defense_id, 'person #{}'.format(person_id)))
+        running.append((defense_id, date, room))
+    return conflicts
+
+
+def export_csv(defenses, f):
+    """
+    Writes the schedule of the defenses as CSV.
+
+    :param defenses: (QuerySet) The defenses
+    :param f: (file) Text file the rows are written to
+    """
+    reviewers = defaultdict(list)
+    reviews = Review.objects.filter(thesis__defended_thesis__in=defenses).select_related('author').distinct()
+    for review in reviews:
+        reviewers[review.thesis_id].append(review.author.get_full_name())
+    writer = csv.writer(f)
+    writer.writerow(['date', 'room', 'topic', 'student', 'supervisor', 'reviewers'])
+    rows = defenses.select_related('thesis__topic', 'thesis__student', 'thesis__supervisor').order_by('date', 'room')
+    for defense in rows.iterator():
+        thesis = defense.thesis
+        writer.writerow([timezone.localtime(defense.date).strftime('%Y-%m-%d %H:%M'), defense.room, thesis.topic.name,
+                         thesis.student.get_full_name(), thesis.supervisor.get_full_name(),
+                         '; '.join(reviewers[thesis.id])])
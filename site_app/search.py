@@ -0,0 +1,138 @@
+"""
+Full-text search of topics. On SQLite the names and short descriptions of topics are indexed by an FTS5 table using
+the topic table as its external content. Triggers created together with the index keep it up to date on every insert,
+update and delete, including bulk operations bypassing the models. Matches are ranked by BM25, a match in the name
+weighing more than a match in the description.
+
+Other databases, or SQLite builds without FTS5, fall back to unranked substring matching.
+
+Rebuilding the topic table on SQLite, which some schema migrations do, drops its triggers. The rebuild_search_index
+management command recreates them and reindexes all topics.
+"""
+import re
+
+from django.db import connection, DatabaseError
+from django.db.models import FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+FTS_TABLE = 'site_app_topic_fts'
+TOPIC_TABLE = 'site_app_topic'
+# Weights of the name and short description columns in the BM25 ranking
+NAME_WEIGHT = 10.0
+DESCRIPTION_WEIGHT = 1.0
+
+INDEX_SQL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5(name, short_description, content='{table}', "
+    "content_rowid='id', tokenize='unicode61 remove_diacritics 1')",
+    "CREATE TRIGGER IF NOT EXISTS {fts}_insert AFTER INSERT ON {table} BEGIN "
+    "INSERT INTO {fts}(rowid, name, short_description) VALUES (new.id, new.name, new.short_description); END",
+    "CREATE TRIGGER IF NOT EXISTS {fts}_delete AFTER DELETE ON {table} BEGIN "
+    "INSERT INTO {fts}({fts}, rowid, name, short_description) "
+    "VALUES ('delete', old.id, old.name, old.short_description); END",
+    "CREATE TRIGGER IF NOT EXISTS {fts}_update AFTER UPDATE OF name, short_description ON {table} BEGIN "
+    "INSERT INTO {fts}({fts}, rowid, name, short_description) "
+    "VALUES ('delete', old.id, old.name, old.short_description); "
+    "INSERT INTO {fts}(rowid, name, short_description) VALUES (new.id, new.name, new.short_description); END",
+]
+DROP_SQL = [
+    'DROP TRIGGER IF EXISTS {fts}_insert',
+    'DROP TRIGGER IF EXISTS {fts}_delete',
+    'DROP TRIGGER IF EXISTS {fts}_update',
+    'DROP TABLE IF EXISTS {fts}',
+]
+
+# Whether the index exists, checked once per database alias
+_index_available = {}
+
+
+def _execute(db, statements):
+    with db.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement.format(fts=FTS_TABLE, table=TOPIC_TABLE))
+
+
+def create_index(db=connection):
+    """
+    Creates the full-text index and its triggers if they do not exist and indexes all topics.
+
+    :param db: Database connection, defaults to the default one
+    :return: Indicator whether the index was created, False if the database does not support it
+    :rtype: bool
+    """
+    if db.vendor != 'sqlite':
+        return False
+    try:
+        _execute(db, INDEX_SQL)
+    except DatabaseError:
+        # SQLite compiled without FTS5
+        return False
+    _execute(db, ["INSERT INTO {fts}({fts}) VALUES ('rebuild')"])
+    _index_available[db.alias] = True
+    return True
+
+
+def drop_index(db=connection):
+    """
+    Drops the full-text index and its triggers.
+
+    :param db: Database connection, defaults to the default one
+    """
+    if db.vendor == 'sqlite':
+        _execute(db, DROP_SQL)
+    _index_available[db.alias] = False
+
+
+def index_available(db=connection):
+    """
+    Checks whether the full-text index exists.
+
+    :param db: Database connection, defaults to the default one
+    :return: Indicator whether the topics can be searched with the index
+    :rtype: bool
+    """
+    if db.alias not in _index_available:
+        _index_available[db.alias] = db.vendor == 'sqlite' and FTS_TABLE in db.introspection.table_names()
+    return _index_available[db.alias]
+
+
+def match_expression(query):
+    """
+    Converts a query typed by user into an FTS5 query matching topics containing all its words, the last word also as
+    a prefix. Operators of the FTS5 syntax are not passed through.
+
+    :param query: (string) The query
+    :return: FTS5 query or None if the query has no words
+    :rtype: string
+    """
+    words = re.findall(r'\w+', query)
+    if not words:
+        return None
+    terms = ['"{}"'.format(word) for word in words]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def search_topics(queryset, query):
+    """
+    Filters topics matching a query and annotates them with their search_rank, lower meaning more relevant.
+
+    :param queryset: (QuerySet) Topics to search
+    :param query: (string) The query typed by user
+    :return: Matching topics
+    :rtype: QuerySet
+    """
+    expression = match_expression(query)
+    if expression is None or not index_available():
+        condition = Q()
+        for word in re.findall(r'\w+', query):
+            condition &= Q(name__icontains=word) | Q(short_description__icontains=word)
+        queryset = queryset.filter(condition) if expression else queryset.none()
+        return queryset.annotate(search_rank=Value(0.0, output_field=FloatField()))
+    rank = RawSQL('SELECT bm25({0}, {1}, {2}) FROM {0} WHERE {0} MATCH %s AND rowid = {3}.id'.format(
+        FTS_TABLE, NAME_WEIGHT, DESCRIPTION_WEIGHT, connection.ops.quote_name(TOPIC_TABLE)), [expression],
+        output_field=FloatField())
+    # A RawSQL expression would be wrapped in another pair of parentheses, which makes SQLite compare the ID with the
+    # first match only
+    matches = '{0}.id IN (SELECT rowid FROM {1} WHERE {1} MATCH %s)'.format(connection.ops.quote_name(TOPIC_TABLE),
+                                                                       FTS_TABLE)
+    return queryset.extra(where=[matches], params=[expression]).annotate(search_rank=rank)
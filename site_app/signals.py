@@ -0,0 +1,164 @@
+"""
+Signal receivers of the site application. They are connected when the application registry is ready.
+"""
+from django.contrib.auth.models import Group
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import caching
+from . import profiling
+from . import roles
+from . import similarity
+from . import statistics
+from .models import User, Topic, Thesis, Review, Defense, ProfilingRule
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def group_membership_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Invalidates the cached roles of the users whose group membership changed and the supervisor directory if the
+    Supervisor group was involved.
+    """
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if not reverse:
+        if action == 'pre_clear':
+            supervisor_changed = roles.SUPERVISOR_GROUP in roles.get_role_names(instance)
+        else:
+            supervisor_changed = Group.objects.filter(pk__in=pk_set, name=roles.SUPERVISOR_GROUP).exists()
+        roles.invalidate_roles([instance.pk], instance=instance)
+    else:
+        supervisor_changed = instance.name == roles.SUPERVISOR_GROUP
+        if action == 'pre_clear':
+            roles.invalidate_roles(instance.user_set.values_list('pk', flat=True))
+        else:
+            roles.invalidate_roles(pk_set)
+    if supervisor_changed:
+        roles.invalidate_supervisor_directory()
+
+
+@receiver(post_save, sender=Group)
+@receiver(pre_delete, sender=Group)
+def group_changed(sender, instance, **kwargs):
+    """
+    Invalidates the cached roles of the members of a renamed or deleted group.
+    """
+    roles.invalidate_roles(instance.user_set.values_list('pk', flat=True))
+    roles.invalidate_supervisor_directory()
+
+
+@receiver(post_save, sender=User)
+@receiver(pre_delete, sender=User)
+def user_changed(sender, instance, created=False, update_fields=None, signal=None, **kwargs):
+    """
+    Invalidates the supervisor directory when a supervisor is renamed or deleted and the cached pages showing the
+    names of users. Saves leaving the names and the e-mail address as they were loaded invalidate nothing.
+    """
+    if signal is post_save:
+        changed = not created and instance.displayed_fields_changed() and (
+            update_fields is None or set(User.DISPLAYED_FIELDS).intersection(update_fields))
+        if update_fields is None or set(User.DISPLAYED_FIELDS) <= set(update_fields):
+            instance.remember_displayed_fields()
+        if not changed:
+            return
+    caching.bump_versions(caching.USERS)
+    if roles.SUPERVISOR_GROUP in roles.get_role_names(instance):
+        roles.invalidate_supervisor_directory()
+
+
+@receiver(pre_save, sender=Review)
+def review_saving(sender, instance, update_fields=None, **kwargs):
+    """
+    Stores the deadline of a review computed from the finished date of its thesis.
+    """
+    if update_fields is None or 'thesis' in update_fields or 'deadline' in update_fields:
+        instance.deadline = Review.compute_deadline(instance.thesis.finished_date)
+
+
+@receiver(post_save, sender=Thesis)
+def thesis_saved(sender, instance, created, update_fields=None, **kwargs):
+    """
+    Updates the deadlines of the reviews of a thesis whose finished date may have changed.
+    """
+    if not created and (update_fields is None or 'finished_date' in update_fields):
+        Review.objects.filter(thesis=instance).update(deadline=Review.compute_deadline(instance.finished_date))
+
+
+@receiver(post_save, sender=Topic)
+def topic_saved(sender, instance, raw=False, update_fields=None, **kwargs):
+    """
+    Updates the similarity signature of a topic whose name or description may have changed.
+    """
+    if raw or (update_fields is not None and not {'name', 'short_description'} & set(update_fields)):
+        return
+    similarity.index_topics([instance])
+
+
+@receiver(post_save, sender=Topic)
+@receiver(post_delete, sender=Topic)
+@receiver(post_save, sender=Thesis)
+@receiver(post_delete, sender=Thesis)
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def cached_row_changed(sender, raw=False, **kwargs):
+    """
+    Makes the cached pages showing rows of the model of a saved or deleted instance stale.
+    """
+    if not raw:
+        caching.bump_versions(sender._meta.model_name)
+
+
+@receiver(pre_save, sender=Topic)
+@receiver(pre_save, sender=Thesis)
+@receiver(pre_save, sender=Review)
+@receiver(pre_save, sender=Defense)
+def counted_row_saving(sender, instance, raw=False, update_fields=None, **kwargs):
+    """
+    Counts the rows of the statistics dashboard affected by saving an instance, before it is saved.
+    """
+    if raw:
+        instance._statistics_rows = None
+    else:
+        statistics.count_before_save(instance, update_fields)
+
+
+@receiver(post_save, sender=Topic)
+@receiver(post_save, sender=Thesis)
+@receiver(post_save, sender=Review)
+@receiver(post_save, sender=Defense)
+def counted_row_saved(sender, instance, **kwargs):
+    """
+    Updates the counters of the statistics dashboard with the changes made by saving an instance.
+    """
+    statistics.count_after_save(instance)
+
+
+@receiver(pre_delete, sender=Topic)
+@receiver(pre_delete, sender=Thesis)
+@receiver(pre_delete, sender=Review)
+@receiver(pre_delete, sender=Defense)
+def counted_row_deleting(sender, instance, **kwargs):
+    """
+    Counts an instance about to be deleted for the statistics dashboard.
+    """
+    statistics.count_before_delete(instance)
+
+
+@receiver(post_delete, sender=Topic)
+@receiver(post_delete, sender=Thesis)
+@receiver(post_delete, sender=Review)
+@receiver(post_delete, sender=Defense)
+def counted_row_deleted(sender, instance, **kwargs):
+    """
+    Removes a deleted instance from the counters of the statistics dashboard.
+    """
+    statistics.count_after_delete(instance)
+
+
+@receiver(post_save, sender=ProfilingRule)
+@receiver(post_delete, sender=ProfilingRule)
+def profiling_rule_changed(sender, **kwargs):
+    """
+    Makes every process reload the profiling rules.
+    """
+    profiling.invalidate_rules()
@@ -0,0 +1,233 @@
+"""
+Detection of near-duplicate topics. The name and short description of every topic are split into shingles, the
+character 4-grams of their words, and summarised by a MinHash signature, the fraction of equal values of two signatures
+estimating the Jaccard similarity of their shingle sets. Signatures are split into bands hashed into buckets stored in
+an indexed table (locality-sensitive hashing), so that the candidates for duplicates of a topic are found by a single
+index lookup of its buckets instead of comparing it with every other topic.
+
+Signatures and buckets are updated by a signal receiver whenever a topic is saved. The cluster_topics management
+command groups the duplicates already present among the stored topics.
+"""
+import hashlib
+import random
+import re
+import struct
+import zlib
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+
+from .models import Topic, TopicSignature, TopicBand
+
+SHINGLE_SIZE = 4
+BANDS = 16
+ROWS = 4
+NUM_HASHES = BANDS * ROWS
+_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+_random = random.Random(20170203)
+_HASH_PARAMS = [(_random.randrange(1, _PRIME), _random.randrange(0, _PRIME)) for i in range(NUM_HASHES)]
+_SIGNATURE_FORMAT = '<{}I'.format(NUM_HASHES)
+
+
+def duplicate_threshold():
+    """
+    Gets the estimated similarity from which topics are reported as duplicates, configured by the
+    TOPIC_DUPLICATE_THRESHOLD setting.
+
+    :return: The threshold between 0 and 1
+    :rtype: float
+    """
+    return getattr(settings, 'TOPIC_DUPLICATE_THRESHOLD', 0.5)
+
+
+def shingles(*texts):
+    """
+    Splits texts into the set of character 4-grams of their words, shorter words being kept whole.
+
+    :param texts: (string) Texts to split, None is ignored
+    :return: The shingles
+    :rtype: set
+    """
+    result = set()
+    for text in texts:
+        for word in re.findall(r'\w+', (text or '').lower()):
+            word = ' {} '.format(word)
+            result.update(word[i:i + SHINGLE_SIZE] for i in range(max(1, len(word) - SHINGLE_SIZE + 1)))
+    return result
+
+
+def compute_signature(name, description):
+    """
+    Computes the MinHash signature of a topic.
+
+    :param name: (string) Name of the topic
+    :param description: (string) Short description of the topic
+    :return: Minimal hash values of the shingles or None if the topic has no words
+    :rtype: tuple
+    """
+    return minhash(shingles(name, description))
+
+
+def minhash(items):
+    """
+    Computes the MinHash signature of a set of strings.
+
+    :param items: (set) The strings, e.g. shingles
+    :return: Minimal hash values of the strings or None if the set is empty
+    :rtype: tuple
+    """
+    values = [zlib.crc32(item.encode('utf-8')) for item in items]
+    if not values:
+        return None
+    return tuple(min((a * value + b) % _PRIME for value in values) & _MAX_HASH for a, b in _HASH_PARAMS)
+
+
+def pack_signature(signature):
+    """
+    Packs a signature into bytes stored in the database.
+
+    :param signature: (tuple) The signature
+    :return: The packed signature
+    :rtype: bytes
+    """
+    return struct.pack(_SIGNATURE_FORMAT, *signature)
+
+
+def unpack_signature(data):
+    """
+    Unpacks a signature stored in the database.
+
+    :param data: (bytes) The packed signature
+    :return: The signature
+    :rtype: tuple
+    """
+    return struct.unpack(_SIGNATURE_FORMAT, bytes(data))
+
+
+def buckets(signature, rows=ROWS):
+    """
+    Hashes the bands of a signature into buckets. Buckets of different bands never collide on purpose. Fewer rows per
+    band make less similar signatures share a bucket.
+
+    :param signature: (tuple) The signature
+    :param rows: (int) Number of signature values in a band
+    :return: Signed 64-bit bucket of every band
+    :rtype: list
+    """
+    result = []
+    for band in range(len(signature) // rows):
+        data = struct.pack('<H{}I'.format(rows), band, *signature[band * rows:(band + 1) * rows])
+        result.append(int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), 'little', signed=True))
+    return result
+
+
+def similarity(first, second):
+    """
+    Estimates the Jaccard similarity of the shingles of two topics from their signatures.
+
+    :param first: (tuple) Signature of the first topic
+    :param second: (tuple) Signature of the second topic
+    :return: The estimated similarity between 0 and 1
+    :rtype: float
+    """
+    return sum(a == b for a, b in zip(first, second)) / NUM_HASHES
+
+
+def index_topics(topics):
+    """
+    Stores the signatures and buckets of topics, replacing the previous ones.
+
+    :param topics: (iterable) The topics
+    """
+    topics = list(topics)
+    signatures, bands = [], []
+    for topic in topics:
+        signature = compute_signature(topic.name, topic.short_description)
+        if signature is not None:
+            signatures.append(TopicSignature(topic_id=topic.id, signature=pack_signature(signature)))
+            bands.extend(TopicBand(topic_id=topic.id, bucket=bucket) for bucket in buckets(signature))
+    topic_ids = [topic.id for topic in topics]
+    with transaction.atomic():
+        TopicSignature.objects.filter(topic_id__in=topic_ids).delete()
+        TopicBand.objects.filter(topic_id__in=topic_ids).delete()
+        TopicSignature.objects.bulk_create(signatures)
+        TopicBand.objects.bulk_create(bands)
+
+
+def find_duplicates(name, description, exclude=None, threshold=None, limit=5):
+    """
+    Finds existing topics similar to a topic.
+
+    :param name: (string) Name of the topic
+    :param description: (string) Short description of the topic
+    :param exclude: (int) ID of a topic left out of the results, e.g. the topic itself
+    :param threshold: (float) Minimal estimated similarity, defaults to TOPIC_DUPLICATE_THRESHOLD
+    :param limit: (int) Maximal number of returned topics
+    :return: Pairs of topic and estimated similarity, the most similar first
+    :rtype: list
+    """
+    signature = compute_signature(name, description)
+    if signature is None:
+        return []
+    threshold = duplicate_threshold() if threshold is None else threshold
+    candidates = TopicBand.objects.filter(bucket__in=buckets(signature)).exclude(topic_id=exclude)
+    stored = TopicSignature.objects.filter(topic_id__in=candidates.values('topic_id')).values_list('topic_id',
+                                                                                                     'signature')
+    scores = {}
+    for topic_id, data in stored:
+        score = similarity(signature, unpack_signature(data))
+        if score >= threshold:
+            scores[topic_id] = score
+    best = sorted(scores, key=lambda topic_id: (-scores[topic_id], topic_id))[:limit]
+    topics = Topic.objects.select_related('supervisor').in_bulk(best)
+    return [(topics[topic_id], scores[topic_id]) for topic_id in best]
+
+
+def cluster_topics(threshold=None, batch_size=500):
+    """
+    Groups the stored topics into clusters of near-duplicates. Only topics sharing a bucket are compared.
+
+    :param threshold: (float) Minimal estimated similarity of duplicates, defaults to TOPIC_DUPLICATE_THRESHOLD
+    :param batch_size: (int) Number of buckets read by one query
+    :return: Sorted IDs of the topics of every cluster with more than one topic
+    :rtype: list
+    """
+    threshold = duplicate_threshold() if threshold is None else threshold
+    shared = list(TopicBand.objects.values('bucket').annotate(topics=Count('topic_id')).filter(topics__gt=1)
+                  .values_list('bucket', flat=True))
+    pairs = set()
+    for start in range(0, len(shared), batch_size):
+        members = defaultdict(list)
+        for bucket, topic_id in TopicBand.objects.filter(bucket__in=shared[start:start + batch_size]).values_list(
+                'bucket', 'topic_id'):
+            members[bucket].append(topic_id)
+        for topic_ids in members.values():
+            topic_ids.sort()
+            pairs.update((a, b) for i, a in enumerate(topic_ids) for b in topic_ids[i + 1:])
+
+    signatures = {}
+    topic_ids = sorted({topic_id for pair in pairs for topic_id in pair})
+    for start in range(0, len(topic_ids), batch_size):
+        for topic_id, data in TopicSignature.objects.filter(
+                topic_id__in=topic_ids[start:start + batch_size]).values_list('topic_id', 'signature'):
+            signatures[topic_id] = unpack_signature(data)
+
+    # Union-find over the pairs of duplicates
+    parent = {}
+
+    def find(topic_id):
+        while parent.setdefault(topic_id, topic_id) != topic_id:
+            parent[topic_id] = parent[parent[topic_id]]
+            topic_id = parent[topic_id]
+        return topic_id
+
+    for a, b in pairs:
+        if a in signatures and b in signatures and similarity(signatures[a], signatures[b]) >= threshold:
+            parent[find(a)] = find(b)
+    clusters = defaultdict(list)
+    for topic_id in parent:
+        clusters[find(topic_id)].append(topic_id)
+    return sorted(sorted(cluster) for cluster in clusters.values() if len(cluster) > 1)
@@ -0,0 +1,255 @@
+"""
+Statistics dashboard of the administrators. The numbers of proposed, checked and available topics, finished theses,
+pending reviews and successful and second defenses are kept as counters in the Statistic table, one per metric, level
+and supervisor, so the dashboard reads a table whose size depends on the number of supervisors instead of scanning
+the topics, theses, reviews and defenses on every view. The faculty of a counter is the faculty of its supervisor.
+
+Signal receivers count the rows affected by a change, i.e. the saved or deleted instance and, when the level or the
+supervisor it passes on changes, the rows depending on it, before and after the change and add the difference to the
+counters. Bulk operations bypassing the models add the inserted rows with add. The
+rebuild_statistics management command recounts everything, e.g. after fixtures were loaded.
+"""
+from collections import Counter, OrderedDict
+
+from django.db import transaction
+from django.db.models import Case, Count, F, IntegerField, Q, Sum, When
+
+from .models import LEVELS, Faculty, Topic, Thesis, Review, Defense, Statistic
+
+METRICS = Statistic.METRICS
+# Fields whose changes alter the counted numbers and fields passed on to the rows depending on an instance
+COUNTED_FIELDS = {
+    Topic: ({'student', 'checked', 'available', 'level', 'supervisor'}, ('level',)),
+    Thesis: ({'finished', 'supervisor', 'topic'}, ('supervisor', 'topic')),
+    Review: ({'file', 'thesis'}, ()),
+    Defense: ({'successful', 'second_defense', 'thesis'}, ()),
+}
+NO_FACULTY = 'No faculty'
+
+
+def _flag(condition):
+    return Sum(Case(When(condition, then=1), default=0, output_field=IntegerField()))
+
+
+def count(topics=None, theses=None, reviews=None, defenses=None):
+    """
+    Counts rows for the metrics, grouped by level and supervisor.
+
+    :param topics: (QuerySet) Counted topics
+    :param theses: (QuerySet) Counted theses
+    :param reviews: (QuerySet) Counted reviews
+    :param defenses: (QuerySet) Counted defenses
+    :return: Counter of (metric, level, supervisor ID) to the number of rows
+    :rtype: Counter
+    """
+    counts = Counter()
+
+    def add(rows, level, supervisor, metrics):
+        for row in rows:
+            for metric in metrics:
+                counts[metric, row[level] or '', row[supervisor]] += row[metric] or 0
+
+    if topics is not None:
+        add(topics.order_by().values('level', 'supervisor').annotate(
+            topics_proposed=_flag(Q(student__isnull=False)), topics_checked=_flag(Q(checked=True)),
+            topics_available=_flag(Q(available=True))),
+            'level', 'supervisor', (METRICS.topics_proposed, METRICS.topics_checked, METRICS.topics_available))
+    if theses is not None:
+        add(theses.filter(finished=True).order_by().values('topic__level', 'supervisor').annotate(
+            theses_finished=Count('id')), 'topic__level', 'supervisor', (METRICS.theses_finished,))
+    if reviews is not None:
+        add(reviews.filter(Q(file='') | Q(file__isnull=True)).order_by().values(
+            'thesis__topic__level', 'thesis__supervisor').annotate(reviews_pending=Count('id')),
+            'thesis__topic__level', 'thesis__supervisor', (METRICS.reviews_pending,))
+    if defenses is not None:
+        add(defenses.order_by().values('thesis__topic__level', 'thesis__supervisor').annotate(
+            defenses_successful=_flag(Q(successful=True)), defenses_second=_flag(Q(second_defense=True))),
+            'thesis__topic__level', 'thesis__supervisor', (METRICS.defenses_successful, METRICS.defenses_second))
+    return +counts
+
+
+def affected_rows(instance, dependents=True):
+    """
+    Gets the rows whose counts may change together with an instance.
+
+    :param instance: (Topic, Thesis, Review or Defense) The instance
+    :param dependents: (bool) Whether the rows taking their level or supervisor from the instance are included
+    :return: Keyword arguments of count
+    :rtype: dict
+    """
+    pk = instance.pk
+    if isinstance(instance, Topic):
+        rows = {'topics': Topic.objects.filter(pk=pk)}
+        if dependents:
+            rows.update(theses=Thesis.objects.filter(topic_id=pk), reviews=Review.objects.filter(thesis__topic_id=pk),
+                        defenses=Defense.objects.filter(thesis__topic_id=pk))
+    elif isinstance(instance, Thesis):
+        rows = {'theses': Thesis.objects.filter(pk=pk)}
+        if dependents:
+            rows.update(reviews=Review.objects.filter(thesis_id=pk), defenses=Defense.objects.filter(thesis_id=pk))
+    elif isinstance(instance, Review):
+        rows = {'reviews': Review.objects.filter(pk=pk)}
+    else:
+        rows = {'defenses': Defense.objects.filter(pk=pk)}
+    return rows
+
+
+def apply(before, after):
+    """
+    Adds the difference of two counts to the stored counters.
+
+    :param before: (Counter) Counts before a change
+    :param after: (Counter) Counts after the change
+    """
+    changes = {key: after[key] - before[key] for key in set(before) | set(after) if after[key] != before[key]}
+    if not changes:
+        return
+    metrics, levels = {key[0] for key in changes}, {key[1] for key in changes}
+    supervisors = {key[2] for key in changes}
+    stored = Statistic.objects.filter(metric__in=metrics, level__in=levels).filter(
+        Q(supervisor_id__in=supervisors - {None}) | Q(supervisor__isnull=True))
+    # Counters missing after their supervisor was deleted are not recreated by decrements
+    existing = {}
+    for pk, metric, level, supervisor_id in stored.values_list('id', 'metric', 'level', 'supervisor_id'):
+        existing.setdefault((metric, level, supervisor_id), pk)
+    created = []
+    for key, difference in sorted(changes.items(), key=lambda item: str(item[0])):
+        if key in existing:
+            Statistic.objects.filter(pk=existing[key]).update(count=F('count') + difference)
+        elif difference > 0:
+            created.append(Statistic(metric=key[0], level=key[1], supervisor_id=key[2], count=difference))
+    Statistic.objects.bulk_create(created)
+
+
+def add(**rows):
+    """
+    Adds inserted rows to the counters, e.g. after a bulk insert sending no signals.
+
+    :param rows: Keyword arguments of count selecting the inserted rows
+    """
+    apply(Counter(), count(**rows))
+
+
+def count_before_save(instance, update_fields=None):
+    """
+    Counts the rows affected by saving an instance before it is saved. Called by the pre_save signal receiver.
+
+    :param instance: (Topic, Thesis, Review or Defense) The saved instance
+    :param update_fields: (iterable) Names of the saved fields, None for all
+    """
+    counted, passed_on = COUNTED_FIELDS[type(instance)]
+    update_fields = None if update_fields is None else set(update_fields)
+    if update_fields is not None and not counted & update_fields:
+        instance._statistics_rows = None
+        return
+    dependents = False
+    if not instance._state.adding and passed_on and (update_fields is None or update_fields & set(passed_on)):
+        attnames = [instance._meta.get_field(name).attname for name in passed_on]
+        stored = type(instance).objects.filter(pk=instance.pk).values(*attnames).first()
+        dependents = stored is not None and any(stored[name] != getattr(instance, name) for name in attnames)
+    instance._statistics_rows = dependents
+    instance._statistics_before = Counter() if instance._state.adding else count(
+        **affected_rows(instance, dependents))
+
+
+def count_after_save(instance):
+    """
+    Adds the changes made by saving an instance to the counters. Called by the post_save signal receiver.
+
+    :param instance: (Topic, Thesis, Review or Defense) The saved instance
+    """
+    dependents = getattr(instance, '_statistics_rows', None)
+    if dependents is not None:
+        apply(instance._statistics_before, count(**affected_rows(instance, dependents)))
+        instance._statistics_rows = None
+
+
+def count_before_delete(instance):
+    """
+    Counts an instance before it is deleted. Called by the pre_delete signal receiver. The rows depending on the
+    instance are deleted by the cascade, which sends signals for each of them.
+
+    :param instance: (Topic, Thesis, Review or Defense) The deleted instance
+    """
+    instance._statistics_before = count(**affected_rows(instance, False))
+
+
+def count_after_delete(instance):
+    """
+    Removes a deleted instance from the counters. Called by the post_delete signal receiver.
+
+    :param instance: (Topic, Thesis, Review or Defense) The deleted instance
+    """
+    apply(getattr(instance, '_statistics_before', Counter()), Counter())
+
+
+def store(model, counts):
+    """
+    Replaces the stored counters.
+
+    :param model: (Model) The Statistic model
+    :param counts: (Counter) Counts of (metric, level, supervisor ID)
+    :return: Number of stored counters
+    :rtype: int
+    """
+    with transaction.atomic():
+        model.objects.all().delete()
+        model.objects.bulk_create([model(metric=metric, level=level, supervisor_id=supervisor_id, count=number)
+                                   for (metric, level, supervisor_id), number in sorted(counts.items(), key=str)])
+    return len(counts)
+
+
+def rebuild():
+    """
+    Recounts all topics, theses, reviews and defenses and replaces the stored counters.
+
+    :return: Number of stored counters
+    :rtype: int
+    """
+    return store(Statistic, count(topics=Topic.objects.all(), theses=Thesis.objects.all(),
+                                  reviews=Review.objects.all(), defenses=Defense.objects.all()))
+
+
+def dashboard(level=None, faculty=None):
+    """
+    Sums the counters for the dashboard, in total and by faculty, level and supervisor.
+
+    :param level: (string) Level the counters are limited to, None for all
+    :param faculty: (int) ID of the faculty the counters are limited to, None for all
+    :return: Dictionary with the totals, a list of numbers in the order of METRICS, and the lists of pairs of label
+        and numbers of the faculties, levels and supervisors
+    :rtype: dict
+    """
+    counters = Statistic.objects.exclude(count=0)
+    if level:
+        counters = counters.filter(level=level)
+    if faculty:
+        counters = counters.filter(supervisor__faculty_id=faculty)
+    totals, faculties, levels, supervisors = Counter(), {}, {}, {}
+    rows = counters.values_list('metric', 'level', 'count', 'supervisor_id', 'supervisor__first_name',
+                                'supervisor__last_name', 'supervisor__email', 'supervisor__faculty_id')
+    faculty_names = {obj.id: str(obj) for obj in Faculty.objects.all()}
+    for metric, row_level, number, supervisor_id, first_name, last_name, email, faculty_id in rows:
+        totals[metric] += number
+        faculty_name = faculty_names.get(faculty_id, NO_FACULTY)
+        faculties.setdefault(faculty_name, Counter())[metric] += number
+        levels.setdefault(row_level, Counter())[metric] += number
+        if supervisor_id is None:
+            name = 'No supervisor'
+        else:
+            name = '{} {}'.format(first_name or '', last_name or '').strip() or email
+        supervisors.setdefault((name, supervisor_id), Counter())[metric] += number
+
+    def numbers(counts):
+        return [counts[metric] for metric, label in METRICS]
+
+    level_order = [level for level, label in LEVELS]
+    return OrderedDict([
+        ('totals', numbers(totals)),
+        ('faculties', [(name, numbers(faculties[name])) for name in sorted(faculties)]),
+        ('levels', [(row_level or 'No level', numbers(levels[row_level])) for row_level in sorted(
+            levels, key=lambda row_level: (level_order.index(row_level) if row_level in level_order else len(
+                level_order), row_level))]),
+        ('supervisors', [(name, numbers(supervisors[name, supervisor_id]))
+                         for name, supervisor_id in sorted(supervisors, key=lambda key: (key[0], key[1] or 0))]),
+    ])
@@ -0,0 +1,216 @@
+"""
+Content-addressed storage of the uploaded files. Every distinct content is stored once, as a blob named by its SHA-256
+digest in a sharded directory tree (blobs/ab/cd/abcd...). The names saved in the file fields are logical names mapped to
+blobs by StoredFile rows, and every blob counts the logical names referencing it. Like in other storages, a file saved
+under a name already taken gets a new unique name, and the content of a logical file is only replaced by the replace
+method. Blobs nobody references any more are removed by the gc_media management command.
+
+Files saved before the storage was introduced are not mapped to blobs and are still read from their original paths.
+"""
+import errno
+import hashlib
+import os
+import tempfile
+from datetime import timedelta
+
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+from django.utils import timezone
+
+from .models import StoredBlob, StoredFile, Thesis, Review
+
+BLOB_DIR = 'blobs'
+READ_SIZE = 64 * 1024
+
+
+def blob_name(digest):
+    """
+    Gets the path of a blob relative to the storage location.
+
+    :param digest: (string) SHA-256 digest of the blob content
+    :return: Path of the blob
+    :rtype: string
+    """
+    return '/'.join([BLOB_DIR, digest[:2], digest[2:4], digest])
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    File system storage keeping every distinct content once. See the module documentation for the layout.
+    """
+
+    def _lookup(self, name):
+        return StoredFile.objects.filter(name=name).select_related('blob').first()
+
+    def _makedirs(self, directory):
+        try:
+            os.makedirs(directory)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+
+    def _spool(self, content):
+        # Writes the content to a temporary file next to the blobs, hashing it on the way
+        tmp_dir = os.path.join(self.location, BLOB_DIR, 'tmp')
+        self._makedirs(tmp_dir)
+        hasher = hashlib.sha256()
+        fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+        with os.fdopen(fd, 'wb') as f:
+            for chunk in content.chunks():
+                if not isinstance(chunk, bytes):
+                    chunk = chunk.encode('utf-8')
+                hasher.update(chunk)
+                f.write(chunk)
+        return tmp_path, hasher.hexdigest()
+
+    def _hash_file(self, path):
+        hasher = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for data in iter(lambda: f.read(READ_SIZE), b''):
+                hasher.update(data)
+        return hasher.hexdigest()
+
+    def _save(self, name, content):
+        return self._store(name, content)
+
+    def replace(self, name, content):
+        """
+        Replaces the content of a logical file, or saves it when the name is not taken yet.
+
+        :param name: (string) The logical name
+        :param content: (File) The new content
+        :return: The logical name
+        :rtype: string
+        """
+        return self._store(name, content, replace=True)
+
+    def _store(self, name, content, replace=False):
+        # Files already on disk (completed chunked or temporary uploads) are moved instead of copied. Their digest
+        # is reused when the uploader computed it already.
+        if hasattr(content, 'temporary_file_path'):
+            source = content.temporary_file_path()
+            digest = getattr(content, 'sha256', None) or self._hash_file(source)
+        else:
+            source, digest = self._spool(content)
+        size = os.path.getsize(source)
+        blob_path = super(ContentAddressedStorage, self).path(blob_name(digest))
+
+        with transaction.atomic():
+            blob, created = StoredBlob.objects.select_for_update().get_or_create(digest=digest,
+                                                                                 defaults={'size': size})
+            if os.path.exists(blob_path):
+                os.remove(source)
+            else:
+                self._makedirs(os.path.dirname(blob_path))
+                file_move_safe(source, blob_path, allow_overwrite=True)
+                if self.file_permissions_mode is not None:
+                    os.chmod(blob_path, self.file_permissions_mode)
+
+            stored = StoredFile.objects.select_for_update().filter(name=name).first() if replace else None
+            if stored is not None and stored.blob_id == digest:
+                stored.save(update_fields=['updated'])
+                return name
+            if stored is not None:
+                StoredBlob.objects.filter(pk=stored.blob_id).update(refcount=F('refcount') - 1)
+                stored.blob = blob
+                stored.save()
+            else:
+                while True:
+                    try:
+                        with transaction.atomic():
+                            StoredFile.objects.create(name=name, blob=blob)
+                        break
+                    except IntegrityError:
+                        # Another request took the name since get_available_name checked it
+                        name = self.get_available_name(name)
+            StoredBlob.objects.filter(pk=digest).update(refcount=F('refcount') + 1)
+        return name
+
+    def _open(self, name, mode='rb'):
+        # Blobs may be shared by many logical files, so they are never modified in place
+        if set(mode) & set('wax+'):
+            raise ValueError('Files of the content-addressed storage can only be opened for reading')
+        return super(ContentAddressedStorage, self)._open(name, mode)
+
+    def path(self, name):
+        stored = self._lookup(name)
+        if stored is None:
+            return super(ContentAddressedStorage, self).path(name)
+        return super(ContentAddressedStorage, self).path(blob_name(stored.blob_id))
+
+    def delete(self, name):
+        assert name, 'The name argument is not allowed to be empty.'
+        with transaction.atomic():
+            stored = StoredFile.objects.select_for_update().filter(name=name).first()
+            if stored is None:
+                return super(ContentAddressedStorage, self).delete(name)
+            stored.delete()
+            StoredBlob.objects.filter(pk=stored.blob_id).update(refcount=F('refcount') - 1)
+
+    def exists(self, name):
+        return StoredFile.objects.filter(name=name).exists() or super(ContentAddressedStorage, self).exists(name)
+
+    def listdir(self, path):
+        prefix = path.strip('/') + '/' if path.strip('/') else ''
+        directories, files = set(), []
+        for name in StoredFile.objects.filter(name__startswith=prefix).values_list('name', flat=True):
+            head, sep, tail = name[len(prefix):].partition('/')
+            if sep:
+                directories.add(head)
+            else:
+                files.append(head)
+        return sorted(directories), files
+
+    def size(self, name):
+        stored = self._lookup(name)
+        if stored is None:
+            return super(ContentAddressedStorage, self).size(name)
+        return stored.blob.size
+
+    def get_modified_time(self, name):
+        stored = self._lookup(name)
+        if stored is None:
+            return super(ContentAddressedStorage, self).get_modified_time(name)
+        return stored.updated
+
+
+def collect_garbage(storage, grace=timedelta(hours=1), dry_run=False):
+    """
+    Removes logical files not referenced by any thesis or review and blobs not referenced by any logical file.
+    Reference counts are recomputed on the way. Only files and blobs older than the grace period are removed, so that
+    files saved by requests in progress are kept.
+
+    :param storage: (ContentAddressedStorage) The storage to clean
+    :param grace: (timedelta) Minimal age of removed files and blobs
+    :param dry_run: (bool) If True, nothing is removed
+    :return: Numbers of removed logical files, removed blobs and freed bytes
+    :rtype: tuple
+    """
+    cutoff = timezone.now() - grace
+    referenced = set(Thesis.objects.exclude(file='').values_list('file', flat=True).iterator())
+    referenced.update(Review.objects.exclude(file='').values_list('file', flat=True).iterator())
+    orphans = [name for name in StoredFile.objects.filter(updated__lt=cutoff).values_list('name', flat=True).iterator()
+               if name not in referenced]
+    if not dry_run:
+        for name in orphans:
+            storage.delete(name)
+
+    if not dry_run:
+        with transaction.atomic():
+            for blob in StoredBlob.objects.annotate(references=Count('files')).exclude(refcount=F('references')):
+                StoredBlob.objects.filter(pk=blob.pk).update(refcount=blob.references)
+
+    removed_blobs, freed = 0, 0
+    for blob in StoredBlob.objects.filter(refcount__lte=0, created__lt=cutoff).iterator():
+        if dry_run:
+            removed_blobs, freed = removed_blobs + 1, freed + blob.size
+            continue
+        # A concurrent save may have referenced the blob again
+        if StoredBlob.objects.filter(pk=blob.pk, refcount__lte=0).delete()[0]:
+            path = FileSystemStorage.path(storage, blob_name(blob.pk))
+            if os.path.exists(path):
+                os.remove(path)
+            removed_blobs, freed = removed_blobs + 1, freed + blob.size
+    return len(orphans), removed_blobs, freed
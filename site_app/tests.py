@@ -1,12 +1,57 @@
+import asyncore
+import csv
+import hashlib
+import io
+import itertools
+import json
 import os
+import re
+import sys
 from django.conf import settings
-from django.test import TestCase, Client
+from django.contrib import admin as admin_site
+from django.core import mail
+from django.core.cache import cache
+from django.core.mail import EmailMultiAlternatives
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, Client, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.urls import reverse
 from django.utils import timezone
+from datetime import date, time, timedelta
+from unittest import skipIf
+from unittest.mock import patch
 import shutil
 import ntpath
+import smtpd
+import tempfile
+import threading
+import time as time_module
+import zipfile
+from xml.etree import ElementTree
+from django.core.files.base import ContentFile
+from . import urls
+from . import assignment
+from . import benchmarks
+from . import caching
+from . import exports
+from . import forms
+from . import jobs
+from . import metrics
+from . import mail as queue
 from . import models
+from . import pagination
+from . import plagiarism
+from . import profiling
+from . import roles
+from . import roster
+from . import scheduling
+from . import search
+from . import similarity
+from . import statistics
+from . import storage
+from . import uploads
 
 
 # Unit tests
@@ -79,6 +124,39 @@ class ReviewerTestCase(TestCase):
         self.assertEqual(self.client.get(reverse('reviews')).status_code, 200)
 
 
+class RoleCacheTestCase(TestCase):
+    mock_email = 'student@test.test'
+    mock_password = 'testpass123'
+
+    def setUp(self):
+        self.students = models.Group.objects.create(name='Student')
+        self.reviewers = models.Group.objects.create(name='Reviewer')
+        self.stud = models.User.objects.create_user(email=self.mock_email, password=self.mock_password)
+        self.students.user_set.add(self.stud)
+        self.client = Client()
+
+    def test_roles_resolved_once(self):
+        user = models.User.objects.get(email=self.mock_email)
+        with self.assertNumQueries(1):
+            self.assertTrue(user.is_student)
+            self.assertFalse(user.is_reviewer)
+            self.assertTrue(roles.has_role(user, 'Student'))
+
+    def test_roles_invalidated_on_group_change(self):
+        self.assertFalse(self.stud.is_reviewer)
+        self.stud.groups.add(self.reviewers)
+        self.assertTrue(self.stud.is_reviewer)
+
+    @override_settings(ROLE_SESSION_CACHE=True)
+    def test_roles_kept_in_session(self):
+        self.client.login(username=self.mock_email, password=self.mock_password)
+        self.client.get(reverse('profile'))
+        self.assertEqual(self.client.session[roles.ROLE_SESSION_KEY][1], ['Student'])
+        self.reviewers.user_set.add(self.stud)
+        self.assertEqual(self.client.get(reverse('reviews')).status_code, 200)
+        self.assertEqual(self.client.session[roles.ROLE_SESSION_KEY][1], ['Reviewer', 'Student'])
+
+
 # Integration
 
 class StudentTopicTestCase(TestCase):
@@ -102,6 +180,32 @@ class StudentTopicTestCase(TestCase):
         students.user_set.add(self.stud)
         self.client = Client()
 
+    def test_supervisor_directory_follows_group(self):
+        self.assertIn(self.supervisor.id, dict(roles.get_supervisor_choices()))
+        with self.assertNumQueries(0):
+            forms.StudentTopicProposalForm()
+        late_supervisor = models.User.objects.create_user(email='late@test.test', password='testpass123')
+        late_supervisor.groups.add(models.Group.objects.get(name='Supervisor'))
+        choices = dict(forms.StudentTopicProposalForm().fields['supervisor'].choices)
+        self.assertIn(late_supervisor.id, choices)
+        self.supervisor.groups.clear()
+        self.assertNotIn(self.supervisor.id, dict(roles.get_supervisor_choices()))
+
+    def test_saving_user_invalidates_only_name_changes(self):
+        supervisor = models.User.objects.get(pk=self.supervisor.pk)
+        versions = caching.get_versions([caching.USERS])
+        # Only the update, neither the roles nor the cached pages are touched
+        with self.assertNumQueries(1):
+            supervisor.save()
+        self.assertEqual(caching.get_versions([caching.USERS]), versions)
+        supervisor.last_name = 'Renamed'
+        supervisor.save()
+        self.assertNotEqual(caching.get_versions([caching.USERS]), versions)
+        versions = caching.get_versions([caching.USERS])
+        with self.assertNumQueries(1):
+            supervisor.save()
+        self.assertEqual(caching.get_versions([caching.USERS]), versions)
+
     def test_student_can_propose_topic(self):
         self.client.login(username=self.stud.email, password=self.mock_data['stud_password'])
         self.client.post(reverse('topic_list'), {
@@ -120,6 +224,1674 @@ class StudentTopicTestCase(TestCase):
         self.assertEqual(proposed_topic.student, self.stud)
 
 
+class TopicListPaginationTestCase(TestCase):
+    mock_email = 'student@test.test'
+    mock_password = 'testpass123'
+
+    def setUp(self):
+        students = models.Group.objects.create(name='Student')
+        self.stud = models.User.objects.create_user(email=self.mock_email, password=self.mock_password)
+        self.supervisor = models.User.objects.create_user(email='supervisor@test.test', password=self.mock_password)
+        students.user_set.add(self.stud)
+        models.Topic.objects.bulk_create([
+            models.Topic(name='Topic {:03d}'.format(i), available=True, supervisor=self.supervisor,
+                         level=models.LEVELS.Master if i % 2 else models.LEVELS.Bachelor)
+            for i in range(120)
+        ])
+        models.Topic.objects.create(name='Hidden topic', available=False)
+        self.client = Client()
+        self.client.login(username=self.mock_email, password=self.mock_password)
+
+    def test_pages_cover_available_topics(self):
+        seen = []
+        response = self.client.get(reverse('topic_list'), {'sort': 'name'})
+        while True:
+            seen.extend(topic.name for topic in response.context['topic_list'])
+            if 'next_page_url' not in response.context:
+                break
+            response = self.client.get(reverse('topic_list') + response.context['next_page_url'])
+        self.assertEqual(seen, sorted('Topic {:03d}'.format(i) for i in range(120)))
+
+    def test_descending_sort_and_filter(self):
+        response = self.client.get(reverse('topic_list'), {'sort': '-name', 'level': models.LEVELS.Master})
+        names = [topic.name for topic in response.context['topic_list']]
+        self.assertEqual(names[0], 'Topic 119')
+        self.assertTrue(all(int(name[-3:]) % 2 for name in names))
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.client.get(reverse('topic_list'), {'cursor': 'garbage'}).status_code, 404)
+        cursor = pagination.encode_cursor([[1]])
+        self.assertEqual(self.client.get(reverse('topic_list'), {'cursor': cursor}).status_code, 404)
+
+    def test_sort_by_supervisor_name(self):
+        adams = models.User.objects.create_user(email='adams@test.test', first_name='Ann', last_name='Adams')
+        models.Topic.objects.filter(name__endswith='7').update(supervisor=adams)
+        models.Topic.objects.filter(name__endswith='3').update(supervisor=None)
+        self.supervisor.last_name = 'Zed'
+        self.supervisor.save()
+        for sort in ('supervisor', '-supervisor'):
+            seen = []
+            response = self.client.get(reverse('topic_list'), {'sort': sort})
+            while True:
+                seen.extend((topic.supervisor.last_name if topic.supervisor else None, topic.id)
+                            for topic in response.context['topic_list'])
+                if 'next_page_url' not in response.context:
+                    break
+                response = self.client.get(reverse('topic_list') + response.context['next_page_url'])
+            # NULLs sort first in ascending order on SQLite
+            expected = sorted(seen, key=lambda row: (row[0] is not None, row[0] or '', row[1]))
+            self.assertEqual(seen, expected if sort == 'supervisor' else expected[::-1])
+            self.assertEqual(len(seen), 120)
+
+    def test_keyset_filter_with_nulls_sorted_last(self):
+        models.Topic.objects.filter(name__endswith='3').update(supervisor=None)
+        rows = list(models.Topic.objects.values_list('supervisor_id', 'id'))
+        # The order of PostgreSQL, where NULLs sort last in ascending order and first in descending order
+        ascending = sorted(rows, key=lambda row: (row[0] is None, row[0] or 0, row[1]))
+        with patch.object(connection.features, 'nulls_order_largest', True):
+            for ordering, order in ((['supervisor', 'id'], ascending), (['-supervisor', '-id'], ascending[::-1])):
+                for i in (0, 5, len(order) - 20, len(order) - 1):
+                    after = models.Topic.objects.filter(pagination.keyset_filter(ordering, list(order[i])))
+                    self.assertEqual(set(after.values_list('supervisor_id', 'id')), set(order[i + 1:]))
+
+
+class TopicSearchTestCase(TestCase):
+    mock_email = 'student@test.test'
+    mock_password = 'testpass123'
+
+    def setUp(self):
+        students = models.Group.objects.create(name='Student')
+        self.stud = models.User.objects.create_user(email=self.mock_email, password=self.mock_password)
+        students.user_set.add(self.stud)
+        self.in_name = models.Topic.objects.create(name='Neural networks for image recognition', available=True,
+                                                   short_description='Deep learning')
+        self.in_description = models.Topic.objects.create(name='Traffic prediction', available=True,
+                                                          short_description='Using neural networks')
+        models.Topic.objects.bulk_create([models.Topic(name='Database topic {}'.format(i), available=True)
+                                          for i in range(60)])
+        self.client = Client()
+        self.client.login(username=self.mock_email, password=self.mock_password)
+
+    def search(self, query):
+        return list(search.search_topics(models.Topic.objects.all(), query).order_by('search_rank', 'id'))
+
+    def test_index_is_used(self):
+        self.assertTrue(search.index_available())
+
+    def test_matches_are_ranked(self):
+        self.assertEqual(self.search('neural networks'), [self.in_name, self.in_description])
+        # The last word is matched as a prefix
+        self.assertEqual(self.search('recog'), [self.in_name])
+        self.assertEqual(self.search('"OR'), [])
+        self.assertEqual(self.search('  '), [])
+
+    def test_index_follows_changes(self):
+        models.Topic.objects.filter(pk=self.in_description.pk).update(short_description='Time series')
+        self.assertEqual(self.search('neural'), [self.in_name])
+        self.in_name.delete()
+        self.assertEqual(self.search('neural'), [])
+        models.Topic.objects.create(name='Neural style transfer', available=True)
+        self.assertEqual(len(self.search('neural')), 1)
+
+    def test_topic_list_search(self):
+        response = self.client.get(reverse('topic_list'), {'q': 'networks'})
+        self.assertEqual(response.context['sort'], 'relevance')
+        self.assertEqual(list(response.context['topic_list']), [self.in_name, self.in_description])
+
+    def test_search_results_are_paginated(self):
+        seen = []
+        response = self.client.get(reverse('topic_list'), {'q': 'database'})
+        while True:
+            seen.extend(topic.id for topic in response.context['topic_list'])
+            if 'next_page_url' not in response.context:
+                break
+            response = self.client.get(reverse('topic_list') + response.context['next_page_url'])
+        self.assertEqual(len(seen), 60)
+        self.assertEqual(len(set(seen)), 60)
+
+
+class TopicSimilarityTestCase(TestCase):
+    mock_email = 'student@test.test'
+    mock_password = 'testpass123'
+
+    def setUp(self):
+        students = models.Group.objects.create(name='Student')
+        self.stud = models.User.objects.create_user(email=self.mock_email, password=self.mock_password)
+        self.supervisor = models.User.objects.create_user(email='supervisor@test.test')
+        students.user_set.add(self.stud)
+        self.original = models.Topic.objects.create(name='Detection of plagiarism in student theses',
+                                                    short_description='Text similarity with fingerprints',
+                                                    supervisor=self.supervisor, available=True)
+        self.other = models.Topic.objects.create(name='Scheduling of railway maintenance',
+                                                 short_description='Integer programming', available=True)
+
+    def test_signature_estimates_similarity(self):
+        first = similarity.compute_signature('Detection of plagiarism in student theses', '')
+        self.assertEqual(similarity.similarity(first, first), 1.0)
+        second = similarity.compute_signature('Scheduling of railway maintenance', '')
+        self.assertLess(similarity.similarity(first, second), 0.2)
+        self.assertIsNone(similarity.compute_signature('', None))
+
+    def test_index_follows_topics(self):
+        self.assertEqual(models.TopicBand.objects.filter(topic=self.original).count(), similarity.BANDS)
+        self.original.name = 'Scheduling of railway maintenance'
+        self.original.short_description = 'Integer programming'
+        self.original.save()
+        duplicates = similarity.find_duplicates('Scheduling of railway maintenance', 'Integer programming',
+                                                exclude=self.other.id)
+        self.assertEqual([topic for topic, score in duplicates], [self.original])
+
+    def test_duplicates_are_found_without_pairwise_scan(self):
+        models.Topic.objects.bulk_create([models.Topic(name='Unrelated topic number {}'.format(i)) for i in range(50)])
+        with self.assertNumQueries(2):
+            duplicates = similarity.find_duplicates('Detecting plagiarism in theses of students',
+                                                    'Similarity of texts using fingerprints')
+        self.assertEqual(duplicates[0][0], self.original)
+        self.assertGreaterEqual(duplicates[0][1], similarity.duplicate_threshold())
+
+    def test_proposal_is_flagged(self):
+        self.client.login(username=self.mock_email, password=self.mock_password)
+        response = self.client.post(reverse('topic_list'), {
+            'name': 'Plagiarism detection in student theses', 'supervisor': self.supervisor.id,
+            'description': 'Fingerprints of text similarity'})
+        self.assertEqual([topic for topic, score in response.context['duplicate_topics']], [self.original])
+        proposal = models.Topic.objects.get(student=self.stud)
+        self.assertEqual(proposal.similar_to, self.original)
+
+    def test_backlog_is_clustered(self):
+        copy = models.Topic.objects.create(name='Detection of plagiarism in theses of students',
+                                           short_description='Text similarity with fingerprints')
+        self.assertEqual(similarity.cluster_topics(), [[self.original.id, copy.id]])
+
+
+class ReviewListQueriesTestCase(TestCase):
+    mock_password = 'testpass123'
+
+    def setUp(self):
+        reviewers = models.Group.objects.create(name='Reviewer')
+        self.reviewer = models.User.objects.create_user(email='reviewer@test.test', password=self.mock_password)
+        self.supervisor = models.User.objects.create_user(email='supervisor@test.test', password=self.mock_password)
+        reviewers.user_set.add(self.reviewer)
+        self.client = Client()
+        self.client.login(username=self.reviewer.email, password=self.mock_password)
+
+    def add_reviews(self, count):
+        start = models.Review.objects.count()
+        for i in range(start, start + count):
+            stud = models.User.objects.create_user(email='student{}@test.test'.format(i), password=self.mock_password)
+            topic = models.Topic.objects.create(name='Topic {}'.format(i), student=stud, supervisor=self.supervisor)
+            thesis = models.Thesis.objects.create(topic=topic, student=stud, supervisor=self.supervisor, finished=True)
+            models.Review.objects.create(thesis=thesis, author=self.reviewer)
+
+    def count_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('reviews'))
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_query_count_does_not_grow(self):
+        self.add_reviews(1)
+        few = self.count_queries()
+        self.add_reviews(20)
+        self.assertEqual(self.count_queries(), few)
+
+    def test_deadline_stored_and_synced(self):
+        self.add_reviews(1)
+        review = models.Review.objects.get()
+        self.assertEqual(review.deadline, review.thesis.finished_date.date() + timedelta(weeks=2))
+        review.thesis.finished_date -= timedelta(days=30)
+        review.thesis.save()
+        self.assertEqual(models.Review.objects.overdue().get(), review)
+        with override_settings(REVIEW_PERIOD_DAYS=60):
+            self.assertEqual(models.Review.objects.all().refresh_deadlines(), 1)
+        self.assertFalse(models.Review.objects.overdue().exists())
+
+    def test_deadline_list(self):
+        self.add_reviews(2)
+        overdue = models.Thesis.objects.first()
+        overdue.finished_date -= timedelta(days=20)
+        overdue.save()
+        models.Thesis.objects.exclude(pk=overdue.pk).update(finished_date=timezone.now() - timedelta(days=10))
+        models.Review.objects.all().refresh_deadlines()
+        response = self.client.get(reverse('deadlines'))
+        self.assertEqual([review.thesis_id for review in response.context['overdue_list']], [overdue.id])
+        self.assertEqual(len(response.context['due_list']), 1)
+
+
+class ListCachingTestCase(TestCase):
+    mock_password = 'testpass123'
+
+    def setUp(self):
+        cache.clear()
+        students = models.Group.objects.create(name='Student')
+        reviewers = models.Group.objects.create(name='Reviewer')
+        self.stud = models.User.objects.create_user(email='student@test.test', password=self.mock_password)
+        self.reviewer = models.User.objects.create_user(email='reviewer@test.test', password=self.mock_password)
+        students.user_set.add(self.stud)
+        reviewers.user_set.add(self.reviewer)
+        self.topic = models.Topic.objects.create(name='Cached topic', available=True)
+        self.client = Client()
+
+    def table_rendered(self, response):
+        return any(template.name.endswith('_table.html') for template in response.templates)
+
+    def test_table_is_cached_until_topic_changes(self):
+        self.client.login(username=self.stud.email, password=self.mock_password)
+        self.assertTrue(self.table_rendered(self.client.get(reverse('topic_list'))))
+        response = self.client.get(reverse('topic_list'))
+        self.assertFalse(self.table_rendered(response))
+        self.assertContains(response, 'Cached topic')
+        self.topic.name = 'Renamed topic'
+        self.topic.save()
+        response = self.client.get(reverse('topic_list'))
+        self.assertTrue(self.table_rendered(response))
+        self.assertContains(response, 'Renamed topic')
+        # The proposal form is cached without the CSRF token of the user
+        self.assertContains(response, 'csrfmiddlewaretoken', count=1)
+
+    def test_conditional_get(self):
+        self.client.login(username=self.stud.email, password=self.mock_password)
+        response = self.client.get(reverse('topic_list'))
+        self.assertIn('private', response['Cache-Control'])
+        self.assertEqual(self.client.get(reverse('topic_list'), HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        self.assertEqual(self.client.get(reverse('topic_list'), {'sort': 'name'},
+                                         HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+        models.Topic.objects.create(name='New topic', available=True)
+        self.assertEqual(self.client.get(reverse('topic_list'), HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+    def test_review_table_follows_thesis_and_bulk_changes(self):
+        supervisor = models.User.objects.create_user(email='supervisor@test.test', password=self.mock_password)
+        topic = models.Topic.objects.create(name='Reviewed topic', student=self.stud, supervisor=supervisor)
+        thesis = models.Thesis.objects.create(topic=topic, student=self.stud, supervisor=supervisor, finished=True)
+        self.client.login(username=self.reviewer.email, password=self.mock_password)
+        self.assertContains(self.client.get(reverse('reviews')), 'You have no assigned reviews')
+        plan = assignment.plan_assignment(reviewers=models.User.objects.filter(pk=self.reviewer.pk))
+        assignment.apply_assignment(plan)
+        response = self.client.get(reverse('reviews'))
+        self.assertContains(response, 'Reviewed topic')
+        etag = response['ETag']
+        thesis.finished_date -= timedelta(days=1)
+        thesis.save()
+        self.assertEqual(self.client.get(reverse('reviews'), HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_process_local_cache_is_reported(self):
+        self.assertEqual(caching.check_shared_cache(None), [])
+        with self.settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}):
+            self.assertEqual([error.id for error in caching.check_shared_cache(None)], ['site_app.W001'])
+
+
+class JsonApiTestCase(TestCase):
+    mock_password = 'testpass123'
+
+    def setUp(self):
+        students = models.Group.objects.create(name='Student')
+        reviewers = models.Group.objects.create(name='Reviewer')
+        supervisors = models.Group.objects.create(name='Supervisor')
+        self.stud = models.User.objects.create_user(email='student@test.test', password=self.mock_password)
+        self.reviewer = models.User.objects.create_user(email='reviewer@test.test', password=self.mock_password)
+        self.supervisor = models.User.objects.create_user(email='supervisor@test.test', password=self.mock_password,
+                                                          first_name='Ada', last_name='Lovelace')
+        self.admin = models.User.objects.create_superuser(email='admin@test.test', password=self.mock_password)
+        students.user_set.add(self.stud)
+        reviewers.user_set.add(self.reviewer)
+        supervisors.user_set.add(self.supervisor)
+        self.topics = [models.Topic.objects.create(name='Topic {}'.format(i), available=True,
+                                                   supervisor=self.supervisor) for i in range(5)]
+        self.hidden = models.Topic.objects.create(name='Hidden topic', available=False)
+        self.client = Client()
+
+    def login(self, user):
+        self.client.login(username=user.email, password=self.mock_password)
+
+    def send(self, method, url, data):
+        return getattr(self.client, method)(url, json.dumps(data), content_type='application/json')
+
+    def add_reviews(self, count):
+        start = models.Review.objects.count()
+        for i in range(start, start + count):
+            stud = models.User.objects.create_user(email='author{}@test.test'.format(i))
+            topic = models.Topic.objects.create(name='Reviewed {}'.format(i), student=stud, supervisor=self.supervisor)
+            thesis = models.Thesis.objects.create(topic=topic, student=stud, supervisor=self.supervisor, finished=True)
+            models.Review.objects.create(thesis=thesis, author=self.reviewer)
+
+    def test_cursor_pagination_and_sparse_fields(self):
+        self.login(self.stud)
+        url, names = reverse('api_list', args=['topics']) + '?limit=2&fields=id,supervisor_name&sort=-name', []
+        while url:
+            content = self.client.get(url).json()
+            self.assertTrue(all(set(topic) == {'id', 'supervisor_name'} for topic in content['results']))
+            names.extend(topic['id'] for topic in content['results'])
+            url = content['next']
+        self.assertEqual(names, [topic.id for topic in reversed(self.topics)])
+        self.assertEqual(self.client.get(reverse('api_detail', args=['topics', self.topics[0].id])).json()[
+            'supervisor_name'], 'Ada Lovelace')
+        self.assertEqual(self.client.get(reverse('api_detail', args=['topics', self.hidden.id])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('api_list', args=['topics']), {'fields': 'password'}).status_code, 400)
+
+    def test_role_rules(self):
+        self.assertEqual(self.client.get(reverse('api_list', args=['topics'])).status_code, 401)
+        self.login(self.stud)
+        self.assertEqual(self.client.get(reverse('api_list', args=['reviews'])).status_code, 403)
+        self.add_reviews(1)
+        other = models.User.objects.create_user(email='other@test.test', password=self.mock_password)
+        other.groups.add(models.Group.objects.get(name='Reviewer'))
+        self.login(other)
+        self.assertEqual(self.client.get(reverse('api_list', args=['reviews'])).json()['results'], [])
+        self.assertEqual(self.client.get(reverse('api_list', args=['theses'])).json()['results'], [])
+        self.login(self.reviewer)
+        self.assertEqual(len(self.client.get(reverse('api_list', args=['theses'])).json()['results']), 1)
+        response = self.send('patch', reverse('api_list', args=['reviews']), [{'id': models.Review.objects.get().id,
+                                                                                'author': other.id}])
+        self.assertEqual(response.status_code, 403)
+
+    def test_page_query_count_is_constant(self):
+        self.login(self.reviewer)
+        self.add_reviews(1)
+        for resource in ('reviews', 'theses'):
+            with CaptureQueriesContext(connection) as few:
+                self.client.get(reverse('api_list', args=[resource]))
+            self.add_reviews(20)
+            with CaptureQueriesContext(connection) as many:
+                content = self.client.get(reverse('api_list', args=[resource])).json()
+            self.assertGreater(len(content['results']), 1)
+            self.assertEqual(len(many), len(few))
+
+    def test_student_proposes_topic(self):
+        self.login(self.stud)
+        response = self.send('post', reverse('api_list', args=['topics']),
+                             {'name': 'Compilers', 'short_description': 'Parsing', 'supervisor': self.supervisor.id})
+        self.assertEqual(response.status_code, 201)
+        topic = models.Topic.objects.get(pk=response.json()['id'])
+        self.assertEqual((topic.student, topic.supervisor, topic.available), (self.stud, self.supervisor, False))
+        response = self.send('post', reverse('api_list', args=['topics']),
+                             {'name': 'Compilers', 'supervisor': self.supervisor.id, 'available': True})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('available', response.json()['errors']['0'])
+
+    def test_proposal_values_are_converted(self):
+        self.login(self.stud)
+        response = self.send('post', reverse('api_list', args=['topics']),
+                             {'name': 123, 'short_description': 'x', 'supervisor': self.supervisor.id})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(models.Topic.objects.get(pk=response.json()['id']).name, '123')
+        response = self.send('post', reverse('api_list', args=['topics']),
+                             {'name': 'Compilers', 'short_description': 'x', 'supervisor': 'x'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('supervisor', response.json()['errors']['0'])
+
+    def test_bulk_create_and_update_are_atomic(self):
+        self.login(self.admin)
+        items = [{'name': 'Bulk {}'.format(i), 'supervisor': self.supervisor.id, 'available': True} for i in range(3)]
+        response = self.send('post', reverse('api_list', args=['topics']), items + [{'supervisor': 10 ** 6}])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.json()['errors']['3']), {'name', 'supervisor'})
+        self.assertFalse(models.Topic.objects.filter(name__startswith='Bulk').exists())
+        response = self.send('post', reverse('api_list', args=['topics']), items)
+        self.assertEqual([topic['name'] for topic in response.json()], ['Bulk 0', 'Bulk 1', 'Bulk 2'])
+        updates = [{'id': topic.id, 'available': False} for topic in self.topics[:2]]
+        response = self.send('patch', reverse('api_list', args=['topics']), updates)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(models.Topic.objects.filter(available=False).count(), 3)
+        response = self.send('patch', reverse('api_detail', args=['topics', self.hidden.id]), {'level': 'Nonsense'})
+        self.assertEqual(response.status_code, 400)
+
+
+class PlagiarismScreeningTestCase(TestCase):
+    mock_password = 'testpass123'
+    words = ('thesis analyses the scheduling of defenses with graph colouring and compares greedy heuristics on real '
+             'data from the faculty while measuring the number of conflicts and the length of the defense week').split()
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+        reviewers = models.Group.objects.create(name='Reviewer')
+        self.supervisor = models.User.objects.create_user(email='supervisor@test.test')
+        self.reviewer = models.User.objects.create_user(email='reviewer@test.test', password=self.mock_password)
+        reviewers.user_set.add(self.reviewer)
+        self.original = self.create_thesis(0, 'original.txt', ' '.join(self.words * 3).encode('utf-8'))
+        self.unrelated = self.create_thesis(1, 'unrelated.txt', ' '.join(reversed(self.words * 3)).encode('utf-8'))
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root)
+
+    def create_thesis(self, i, filename, content):
+        student = models.User.objects.create_user(email='student{}@test.test'.format(i))
+        topic = models.Topic.objects.create(name='Topic {}'.format(i), student=student, supervisor=self.supervisor)
+        thesis = models.Thesis.objects.create(topic=topic, student=student, supervisor=self.supervisor, finished=True)
+        thesis.file.save(filename, ContentFile(content))
+        return thesis
+
+    def docx(self, text):
+        data = io.BytesIO()
+        with zipfile.ZipFile(data, 'w') as document:
+            document.writestr('word/document.xml', '<w:document xmlns:w="urn:w"><w:body><w:p><w:t>{}</w:t></w:p>'
+                                                   '</w:body></w:document>'.format(text))
+        return data.getvalue()
+
+    def test_copied_thesis_is_matched(self):
+        self.assertEqual(plagiarism.screen_pending(), 2)
+        self.assertFalse(models.PlagiarismMatch.objects.exists())
+        copy = self.create_thesis(2, 'copy.docx', self.docx(' '.join(self.words[:20] + self.words * 2)))
+        self.assertEqual(list(plagiarism.pending_theses()), [copy])
+        matches = plagiarism.screen_thesis(copy)
+        self.assertEqual([thesis_id for thesis_id, score in matches], [self.original.id])
+        # The match is reported for both theses and the copy is not screened again
+        self.assertEqual(models.PlagiarismMatch.objects.filter(thesis=self.original, other=copy).count(), 1)
+        self.assertEqual(plagiarism.screen_pending(), 0)
+
+    def test_replaced_content_is_screened_again(self):
+        self.assertEqual(plagiarism.screen_pending(), 2)
+        self.unrelated.file.storage.replace(self.unrelated.file.name,
+                                            ContentFile(' '.join(self.words * 3).encode('utf-8')))
+        self.assertEqual(list(plagiarism.pending_theses()), [self.unrelated])
+        self.assertEqual(plagiarism.screen_pending(), 1)
+        self.assertTrue(models.PlagiarismMatch.objects.filter(thesis=self.unrelated, other=self.original).exists())
+        self.assertEqual(plagiarism.screen_pending(), 0)
+
+    def test_legacy_doc_text(self):
+        thesis = self.create_thesis(2, 'legacy.doc', b'\xd0\xcf\x11\xe0' + 'legacy thesis text'.encode('utf-16-le'))
+        self.assertEqual(plagiarism.extract_text(thesis.file), 'legacy thesis text')
+
+    def test_report_is_shown_to_reviewer(self):
+        copy = self.create_thesis(2, 'copy.txt', ' '.join(self.words * 3).encode('utf-8'))
+        models.Review.objects.create(thesis=copy, author=self.reviewer)
+        plagiarism.screen_pending()
+        self.client.login(username=self.reviewer.email, password=self.mock_password)
+        response = self.client.get(reverse('reviews'))
+        review = response.context['review_list'][0]
+        self.assertEqual([match.other for match in review.thesis.plagiarism_report], [self.original])
+        self.assertContains(response, 'Topic 0')
+
+
+class AdminChangeListTestCase(TestCase):
+    mock_password = 'testpass123'
+
+    def setUp(self):
+        self.admin = models.User.objects.create_superuser(email='admin@test.test', password=self.mock_password)
+        self.supervisor = models.User.objects.create_user(email='supervisor@test.test', password=self.mock_password)
+        self.client = Client()
+        self.client.login(username=self.admin.email, password=self.mock_password)
+
+    def add_rows(self, count):
+        start = models.Thesis.objects.count()
+        for i in range(start, start + count):
+            stud = models.User.objects.create_user(email='student{}@test.test'.format(i), password=self.mock_password)
+            topic = models.Topic.objects.create(name='Topic {}'.format(i), student=stud, supervisor=self.supervisor)
+            thesis = models.Thesis.objects.create(topic=topic, student=stud, supervisor=self.supervisor, finished=True)
+            models.Review.objects.create(thesis=thesis, author=self.supervisor)
+            models.Defense.objects.create(thesis=thesis, successful=True, second_defense=False)
+
+    def count_queries(self, url, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_query_count_does_not_grow(self):
+        urls = [reverse('admin:site_app_{}_changelist'.format(name))
+                for name in ('user', 'topic', 'thesis', 'review', 'defense')]
+        self.add_rows(1)
+        few = [self.count_queries(url) for url in urls]
+        self.add_rows(10)
+        self.assertEqual([self.count_queries(url) for url in urls], few)
+
+    def test_annotated_columns_sortable(self):
+        self.add_rows(2)
+        response = self.client.get(reverse('admin:site_app_thesis_changelist'), {'o': '5'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(all(thesis.has_review for thesis in response.context['cl'].result_list))
+        response = self.client.get(reverse('admin:site_app_user_changelist'), {'o': '-8'})
+        self.assertTrue(response.context['cl'].result_list[0].proposed_topic)
+        response = self.client.get(reverse('admin:site_app_review_changelist'), {'o': '5'})
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(ESTIMATED_COUNT_THRESHOLD=5, ESTIMATED_COUNT_LIMIT=8)
+    def test_estimated_count(self):
+        self.add_rows(10)
+        models.Topic.objects.filter(name='Topic 0').delete()
+        url = reverse('admin:site_app_topic_changelist')
+        # Without statistics the table is counted up to the limit
+        self.assertEqual(self.client.get(url).context['cl'].result_count, 8)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        models.Topic.objects.filter(name='Topic 1').delete()
+        self.assertEqual(pagination.estimate_count(models.Topic), models.Topic.objects.count() + 1)
+        self.assertEqual(self.client.get(url).context['cl'].result_count, models.Topic.objects.count() + 1)
+
+
+class QueryRegressionTestCase(TestCase):
+    """
+    Requests every URL of the site and every admin changelist at two sizes of the data. The number of queries must not
+    grow with the number of rows, and no query may read the whole table of topics, theses, reviews or users.
+    """
+    mock_password = 'testpass123'
+    # Tables that must be read through an index
+    indexed_tables = ('site_app_topic', 'site_app_thesis', 'site_app_review', 'site_app_user')
+
+    def setUp(self):
+        cache.clear()
+        self.media_root = tempfile.mkdtemp()
+        # Measurements are flushed before every request, so that their queries are not counted
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root, METRICS_FLUSH_INTERVAL=3600,
+                                                   CHUNKED_UPLOAD_DIR=os.path.join(self.media_root, 'partial'))
+        self.settings_override.enable()
+        self.students = models.Group.objects.create(name='Student')
+        reviewers = models.Group.objects.create(name='Reviewer')
+        supervisors = models.Group.objects.create(name=roles.SUPERVISOR_GROUP)
+        self.admin = models.User.objects.create_superuser(email='admin@test.test', password=self.mock_password)
+        self.reviewer = models.User.objects.create_user(email='reviewer@test.test', password=self.mock_password)
+        reviewers.user_set.add(self.reviewer)
+        supervisors.user_set.add(self.reviewer)
+        self.supervisor = models.User.objects.create_user(email='supervisor@test.test', password=self.mock_password)
+        supervisors.user_set.add(self.supervisor)
+        self.student = self.add_rows(1)[0]
+        self.thesis = models.Thesis.objects.get(student=self.student)
+        self.thesis.file.save('thesis.txt', ContentFile(b'thesis'))
+        self.review = models.Review.objects.get(thesis=self.thesis)
+        self.review.file.save('review.txt', ContentFile(b'review'))
+        self.upload = uploads.start_upload(self.student, 'thesis', self.thesis.id, 'thesis.txt', 6)
+        self.add_rows(2)
+
+    def add_rows(self, count):
+        start = models.User.objects.count()
+        students = []
+        for i in range(start, start + count):
+            student = models.User.objects.create_user(email='student{}@test.test'.format(i))
+            self.students.user_set.add(student)
+            topic = models.Topic.objects.create(name='Topic {}'.format(i), student=student, supervisor=self.supervisor,
+                                                available=True, checked=True)
+            models.Topic.objects.create(name='Offered topic {}'.format(i), supervisor=self.supervisor, available=True)
+            thesis = models.Thesis.objects.create(topic=topic, student=student, supervisor=self.supervisor,
+                                                  finished=True)
+            models.Review.objects.create(thesis=thesis, author=self.reviewer)
+            models.Defense.objects.create(thesis=thesis, successful=True, second_defense=False)
+            students.append(student)
+        return students
+
+    def cases(self):
+        api = [('api_list', self.admin, 'get', reverse('api_list', args=[resource]))
+               for resource in ('topics', 'theses', 'reviews', 'defenses')]
+        details = [('api_detail', self.admin, 'get', reverse('api_detail', args=[resource, obj.id]))
+                   for resource, obj in (('topics', self.thesis.topic), ('theses', self.thesis),
+                                         ('reviews', self.review), ('defenses', self.thesis.defended_thesis.get()))]
+        exports = [('export', self.admin, 'get', reverse('export', args=[name]))
+                   for name in ('theses', 'reviews', 'defenses')]
+        changelists = [('admin:' + model._meta.model_name, self.admin, 'get',
+                        reverse('admin:{}_{}_changelist'.format(model._meta.app_label, model._meta.model_name)))
+                       for model in admin_site.site._registry]
+        return [
+            ('profile', self.student, 'get', reverse('profile')),
+            ('thesis_file', self.student, 'get', reverse('thesis_file', args=[self.thesis.id])),
+            ('review_file', self.reviewer, 'get', reverse('review_file', args=[self.review.id])),
+            ('upload_start', self.student, 'post', reverse('upload_start')),
+            ('upload_chunk', self.student, 'get', reverse('upload_chunk', args=[self.upload.id])),
+            ('deadlines', self.reviewer, 'get', reverse('deadlines')),
+            ('reviews', self.reviewer, 'get', reverse('reviews')),
+            ('topic_list', self.student, 'get', reverse('topic_list')),
+            ('login', None, 'get', reverse('login')),
+            ('logout', self.student, 'get', reverse('logout')),
+            ('metrics', self.admin, 'get', reverse('metrics')),
+        ] + api + details + exports + changelists
+
+    def record(self):
+        """
+        Requests every case with empty caches and records its queries.
+        """
+        cache.clear()
+        recorded = {}
+        for name, user, method, url in self.cases():
+            client = Client()
+            if user is not None:
+                client.force_login(user)
+            data = {'kind': 'thesis', 'object_id': self.thesis.id, 'filename': 'thesis.txt', 'size': 6} \
+                if method == 'post' else {}
+            metrics.flush()
+            with CaptureQueriesContext(connection) as queries:
+                response = getattr(client, method)(url, data)
+                if response.streaming:
+                    b''.join(response.streaming_content)
+            self.assertLess(response.status_code, 400, url)
+            recorded[url] = [query['sql'] for query in queries]
+        return recorded
+
+    def scans(self, sql, params=()):
+        """
+        Gets the tables a query reads whole, directly or through an index. A scan stopping after a LIMIT is not counted,
+        e.g. a keyset page or an admin changelist page ordered by the primary key. That requires the scanned table to be
+        the outermost loop of its (sub)query, read in the order of the ORDER BY without sorting it in a temporary
+        B-tree, and no condition of the WHERE clause on its columns, which could make the scan read past the limit.
+        """
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            plan = [(row[0], row[1], row[-1]) for row in cursor.fetchall()]
+        bounded = ' LIMIT ' in sql and not any(detail.startswith('USE TEMP B-TREE') for node, parent, detail in plan)
+        # Conditions of the outer query, leaving out those of subqueries in parentheses
+        depth, outer = 0, []
+        for char in sql:
+            depth += {'(': 1, ')': -1}.get(char, 0)
+            outer.append(char if depth == 0 and char != ')' else ' ')
+        where = ''.join(outer).partition(' WHERE ')[2].partition(' ORDER BY ')[0]
+        outermost = {}
+        for node, parent, detail in plan:
+            if detail.startswith(('SCAN ', 'SEARCH ')):
+                outermost.setdefault(parent, node)
+        scanned = set()
+        for node, parent, detail in plan:
+            match = re.match(r'SCAN (?:TABLE )?(\w+)(?: AS (\w+))?(?: USING (?:COVERING )?INDEX \w+)?$', detail)
+            if not match or match.group(1) not in self.indexed_tables:
+                continue
+            filtered = '"{}".'.format(match.group(2) or match.group(1)) in where
+            if not bounded or filtered or outermost[parent] != node:
+                scanned.add(match.group(1))
+        return scanned
+
+    def test_scans_are_detected(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('Query plans are checked on SQLite')
+        queries = [
+            # Filters on columns without an index read the table until enough rows match
+            models.Topic.objects.filter(short_description='x').order_by('pk')[:1],
+            models.Topic.objects.filter(short_description='x')[:1],
+            # So does a scan of an index in the requested order
+            models.User.objects.filter(first_name='x').order_by('email')[:1],
+        ]
+        for queryset in queries:
+            self.assertEqual(self.scans(*queryset.query.sql_with_params()), {queryset.model._meta.db_table},
+                             str(queryset.query))
+        for queryset in [models.Topic.objects.order_by('pk')[:10], models.User.objects.order_by('email')[:10]]:
+            self.assertEqual(self.scans(*queryset.query.sql_with_params()), set(), str(queryset.query))
+
+    def test_every_url_is_covered(self):
+        names = {pattern.name for pattern in urls.urlpatterns}
+        self.assertEqual(names, {name for name, user, method, url in self.cases() if ':' not in name})
+
+    def test_query_count_does_not_grow(self):
+        few = self.record()
+        self.add_rows(10)
+        many = self.record()
+        for url, queries in many.items():
+            self.assertEqual(len(queries), len(few[url]), '{} ran {} queries with more rows instead of {}:\n{}'.format(
+                url, len(queries), len(few[url]), '\n'.join(queries)))
+
+    def test_no_full_table_scans(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('Query plans are checked on SQLite')
+        # Changelists fitting on one page are read without a LIMIT, smaller pages make them paginate as on large tables
+        with patch.object(admin_site.ModelAdmin, 'list_per_page', 2):
+            recorded = self.record()
+        for url, queries in recorded.items():
+            for sql in queries:
+                if sql.startswith('SELECT'):
+                    self.assertFalse(self.scans(sql), '{} reads whole tables:\n{}'.format(url, sql))
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root)
+
+
+class MetricsTestCase(TestCase):
+    mock_password = 'testpass123'
+
+    def setUp(self):
+        cache.clear()
+        metrics.flush()
+        self.student = models.User.objects.create_user(email='student@test.test', password=self.mock_password)
+        self.admin = models.User.objects.create_superuser(email='admin@test.test', password=self.mock_password)
+        supervisor = models.User.objects.create_user(email='supervisor@test.test', password=self.mock_password)
+        models.Group.objects.create(name='Student').user_set.add(self.student)
+        models.Topic.objects.create(name='Topic', supervisor=supervisor, available=True)
+
+    def test_server_timing_and_log(self):
+        self.client.login(username=self.student.email, password=self.mock_password)
+        with self.assertLogs('site_app.metrics', 'INFO') as logs:
+            response = self.client.get(reverse('topic_list'))
+        self.assertRegex(response['Server-Timing'],
+                         r'^total;dur=[\d.]+, sql;desc="\d+ queries";dur=[\d.]+, template;dur=[\d.]+$')
+        line = json.loads(logs.records[-1].getMessage())
+        self.assertEqual((line['view'], line['status']), ('topic_list', 200))
+        self.assertGreater(line['sql_queries'], 0)
+        self.assertGreater(line['template_ms'], 0)
+
+    def test_metrics_endpoint(self):
+        self.client.login(username=self.student.email, password=self.mock_password)
+        self.client.get(reverse('topic_list'))
+        self.client.get('/missing/page')
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        self.client.login(username=self.admin.email, password=self.mock_password)
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        text = response.content.decode()
+        self.assertIn('# TYPE diplomatool_request_duration_seconds histogram', text)
+        self.assertIn('diplomatool_request_duration_seconds_count{view="topic_list"} 1', text)
+        self.assertIn('diplomatool_request_sql_queries_bucket{view="unresolved",le="+Inf"} 1', text)
+        counts = re.findall(r'diplomatool_request_sql_seconds_bucket\{view="topic_list",le="[^"]+"\} (\d+)', text)
+        self.assertEqual(counts, sorted(counts, key=int))
+
+    @override_settings(METRICS_FLUSH_INTERVAL=0)
+    def test_measurements_are_shared(self):
+        metrics.observe('view', {'duration': 0.02, 'sql': 0.01, 'template': 0.005, 'queries': 3})
+        metrics.maybe_flush()
+        metrics.observe('view', {'duration': 20, 'sql': 0.01, 'template': 0.005, 'queries': 3})
+        metrics.flush()
+        # The counters are kept when the cache evicts entries
+        cache.clear()
+        text = metrics.render()
+        self.assertIn('diplomatool_request_duration_seconds_bucket{view="view",le="0.025"} 1', text)
+        self.assertIn('diplomatool_request_duration_seconds_bucket{view="view",le="+Inf"} 2', text)
+        self.assertIn('diplomatool_request_duration_seconds_sum{view="view"} 20.02', text)
+        self.assertIn('diplomatool_request_sql_queries_sum{view="view"} 6', text)
+
+
+class ProfilingTestCase(TestCase):
+    mock_password = 'testpass123'
+
+    def setUp(self):
+        cache.clear()
+        self.student = models.User.objects.create_user(email='student@test.test', password=self.mock_password)
+        self.admin = models.User.objects.create_superuser(email='admin@test.test', password=self.mock_password)
+        supervisor = models.User.objects.create_user(email='supervisor@test.test', password=self.mock_password)
+        models.Group.objects.create(name='Student').user_set.add(self.student)
+        models.Topic.objects.create(name='Topic', supervisor=supervisor, available=True)
+        self.client.login(username=self.student.email, password=self.mock_password)
+
+    def test_rules_select_requests(self):
+        self.client.get(reverse('topic_list'))
+        self.assertFalse(models.RequestProfile.objects.exists())
+        rule = models.ProfilingRule.objects.create(user=self.student, path_pattern='^/topic_list')
+        models.ProfilingRule.objects.create(user=self.admin)
+        models.ProfilingRule.objects.create(path_pattern='^/reviews', enabled=False)
+        models.ProfilingRule.objects.create(expires=timezone.now() - timedelta(minutes=1))
+        self.client.get(reverse('profile'))
+        self.client.get(reverse('reviews'))
+        self.client.get(reverse('topic_list'))
+        profile = models.RequestProfile.objects.get()
+        self.assertEqual((profile.rule, profile.user, profile.view, profile.status),
+                         (rule, self.student, 'topic_list', 200))
+        self.assertEqual(profile.samples, sum(profiling.parse_stacks(profile.stacks).values()))
+        models.ProfilingRule.objects.all().delete()
+        self.client.get(reverse('topic_list'))
+        self.assertEqual(models.RequestProfile.objects.count(), 1)
+
+    def test_sampler_records_stacks(self):
+        def busy():
+            deadline = time_module.perf_counter() + 0.1
+            while time_module.perf_counter() < deadline:
+                pass
+
+        sampler = profiling.Sampler(threading.get_ident(), stop_code=sys._getframe().f_code, interval=0.001)
+        sampler.start()
+        busy()
+        stacks = sampler.stop()
+        self.assertIn('site_app.tests:busy', stacks)
+        self.assertEqual(profiling.parse_stacks(profiling.format_stacks(stacks)), stacks)
+
+    def test_flame_graph(self):
+        boxes = profiling.flame_graph(profiling.parse_stacks('a;b 3\na;c 1\nd 4\n'))
+        self.assertEqual([(box['name'], box['depth'], box['left'], box['width']) for box in boxes],
+                         [('a', 0, 0, 50), ('d', 0, 50, 50), ('b', 1, 0, 37.5), ('c', 1, 37.5, 12.5)])
+
+    def test_admin_shows_and_downloads_profiles(self):
+        profile = models.RequestProfile.objects.create(method='GET', path='/topic_list', status=200, duration=0.1,
+                                                       samples=4, stacks='views:get;search:rank 3\nviews:get 1\n')
+        models.RequestProfile.objects.create(method='GET', path='/', status=200, duration=0.1, samples=2,
+                                             stacks='views:get 2\n')
+        self.client.login(username=self.admin.email, password=self.mock_password)
+        response = self.client.get(reverse('admin:site_app_requestprofile_change', args=[profile.id]))
+        self.assertContains(response, 'search:rank (3 samples, 75.0%)')
+        selected = models.RequestProfile.objects.values_list('id', flat=True)
+        response = self.client.post(reverse('admin:site_app_requestprofile_changelist'),
+                                    {'action': 'download_stacks', '_selected_action': selected})
+        self.assertEqual(response.content.decode(), 'views:get 3\nviews:get;search:rank 3\n')
+
+
+class FileDownloadTestCase(TestCase):
+    mock_password = 'testpass123'
+    content = b'0123456789' * 10000
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+        self.stud = models.User.objects.create_user(email='student@test.test', password=self.mock_password)
+        self.supervisor = models.User.objects.create_user(email='supervisor@test.test', password=self.mock_password)
+        self.reviewer = models.User.objects.create_user(email='reviewer@test.test', password=self.mock_password)
+        self.stranger = models.User.objects.create_user(email='stranger@test.test', password=self.mock_password)
+        topic = models.Topic.objects.create(name='Topic', student=self.stud, supervisor=self.supervisor)
+        self.thesis = models.Thesis.objects.create(topic=topic, student=self.stud, supervisor=self.supervisor,
+                                                   finished=True)
+        self.thesis.file.save('thesis.pdf', ContentFile(self.content))
+        models.Review.objects.create(thesis=self.thesis, author=self.reviewer)
+        self.client = Client()
+        self.url = reverse('thesis_file', args=[self.thesis.id])
+
+    def test_reviewer_downloads_thesis(self):
+        self.client.login(username=self.reviewer.email, password=self.mock_password)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+
+    def test_stranger_can_not_download_thesis(self):
+        self.client.login(username=self.stranger.email, password=self.mock_password)
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+    def test_range_and_etag(self):
+        self.client.login(username=self.stud.email, password=self.mock_password)
+        response = self.client.get(self.url, HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), self.content[10:20])
+        self.assertEqual(response['Content-Range'], 'bytes 10-19/{}'.format(len(self.content)))
+        self.assertEqual(self.client.get(self.url, HTTP_RANGE='bytes=-5').status_code, 206)
+        self.assertEqual(self.client.get(self.url, HTTP_RANGE='bytes=999999-').status_code, 416)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH='W/' + response['ETag']).status_code, 304)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH='"other", ' + response['ETag']).status_code, 304)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH='*').status_code, 304)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH='"other"').status_code, 200)
+
+    def test_range_of_empty_file(self):
+        self.thesis.file.save('empty.pdf', ContentFile(b''))
+        self.client.login(username=self.stud.email, password=self.mock_password)
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-10')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */0')
+
+    def test_admin_links_to_protected_download(self):
+        review = models.Review.objects.get(thesis=self.thesis)
+        review.file.save('review.pdf', ContentFile(b'review'))
+        admin = models.User.objects.create_superuser(email='admin@test.test', password=self.mock_password)
+        self.client.force_login(admin)
+        url = reverse('review_file', args=[review.id])
+        self.assertContains(self.client.get(reverse('admin:site_app_review_change', args=[review.id])),
+                            'href="{}"'.format(url))
+        self.assertContains(self.client.get(reverse('admin:site_app_review_changelist')), 'href="{}"'.format(url))
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+    @override_settings(SENDFILE_BACKEND='nginx')
+    def test_accel_redirect(self):
+        self.client.login(username=self.supervisor.email, password=self.mock_password)
+        response = self.client.get(self.url)
+        digest = hashlib.sha256(self.content).hexdigest()
+        self.assertEqual(response['X-Accel-Redirect'], '/protected/' + storage.blob_name(digest))
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root)
+
+
+class ChunkedUploadTestCase(TestCase):
+    mock_password = 'testpass123'
+    content = os.urandom(300000)
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root,
+                                                   CHUNKED_UPLOAD_DIR=os.path.join(self.media_root, 'partial'))
+        self.settings_override.enable()
+        stud = models.User.objects.create_user(email='student@test.test', password=self.mock_password)
+        supervisor = models.User.objects.create_user(email='supervisor@test.test', password=self.mock_password)
+        self.reviewer = models.User.objects.create_user(email='reviewer@test.test', password=self.mock_password)
+        topic = models.Topic.objects.create(name='Topic', student=stud, supervisor=supervisor)
+        thesis = models.Thesis.objects.create(topic=topic, student=stud, supervisor=supervisor, finished=True)
+        self.review = models.Review.objects.create(thesis=thesis, author=self.reviewer)
+        self.client = Client()
+        self.client.login(username=self.reviewer.email, password=self.mock_password)
+
+    def start(self, **data):
+        data = dict({'kind': 'review', 'object_id': self.review.id, 'filename': 'review.doc',
+                     'size': len(self.content)}, **data)
+        return self.client.post(reverse('upload_start'), data)
+
+    def send(self, url, offset, chunk):
+        return self.client.put(url, chunk, content_type='application/octet-stream', HTTP_UPLOAD_OFFSET=str(offset))
+
+    def test_upload_in_chunks_with_resume(self):
+        state = self.start(sha256=hashlib.sha256(self.content).hexdigest()).json()
+        self.assertEqual(self.send(state['url'], 0, self.content[:100000]).json()['offset'], 100000)
+        # A repeated chunk is rejected and the client resumes from the reported offset
+        self.assertEqual(self.send(state['url'], 0, self.content[:100000]).status_code, 409)
+        uploads._hashers.clear()
+        offset = self.client.get(state['url']).json()['offset']
+        state = self.send(state['url'], offset, self.content[offset:]).json()
+        self.assertTrue(state['completed'])
+        self.review.refresh_from_db()
+        self.assertEqual(ntpath.basename(self.review.file.name), 'review.doc')
+        self.assertTrue(self.review.finished)
+        with self.review.file as f:
+            self.assertEqual(f.read(), self.content)
+
+    def test_checksum_mismatch(self):
+        state = self.start(sha256='0' * 64).json()
+        response = self.send(state['url'], 0, self.content)
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(response.json()['offset'], 0)
+
+    def test_only_author_can_upload_review(self):
+        self.client.login(username='student@test.test', password=self.mock_password)
+        self.assertEqual(self.start().status_code, 403)
+
+    def test_concurrent_chunk_is_rejected(self):
+        state = self.start().json()
+        # Another request is writing the first chunk
+        models.ChunkedUpload.objects.filter(pk=state['id']).update(claimed=timezone.now())
+        self.assertEqual(self.send(state['url'], 0, self.content[:100000]).status_code, 409)
+        self.assertEqual(os.path.getsize(models.ChunkedUpload.objects.get(pk=state['id']).partial_path()), 0)
+        # The claim of a request that never finished expires
+        models.ChunkedUpload.objects.filter(pk=state['id']).update(
+            claimed=timezone.now() - uploads.CLAIM_TIMEOUT - timedelta(seconds=1))
+        state = self.send(state['url'], 0, self.content[:100000]).json()
+        self.assertEqual(state['offset'], 100000)
+        self.assertIsNone(models.ChunkedUpload.objects.get(pk=state['id']).claimed)
+
+    def test_upload_size_limit(self):
+        with self.settings(MAX_UPLOAD_SIZE=len(self.content) - 1):
+            self.assertEqual(self.start().status_code, 413)
+        self.assertFalse(models.ChunkedUpload.objects.exists())
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root)
+
+
+class JobQueueTestCase(TestCase):
+    mock_password = 'testpass123'
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+        stud = models.User.objects.create_user(email='student@test.test', password=self.mock_password)
+        supervisor = models.User.objects.create_user(email='supervisor@test.test', password=self.mock_password)
+        topic = models.Topic.objects.create(name='Topic', student=stud, supervisor=supervisor)
+        self.thesis = models.Thesis.objects.create(topic=topic, student=stud, supervisor=supervisor, finished=True)
+        self.calls = []
+        jobs.handler('test_flaky')(self.flaky)
+
+    def flaky(self, name):
+        self.calls.append(name)
+        if self.calls.count(name) == 1:
+            raise IOError('Temporary failure')
+
+    def test_file_jobs(self):
+        self.thesis.file.save('thesis.txt', ContentFile(b'thesis text ' * 100))
+        jobs.enqueue_file_jobs(self.thesis)
+        jobs.enqueue_file_jobs(self.thesis)
+        self.assertEqual(jobs.queue_depth(), {'screen_thesis': {'queued': 1}, 'verify_file': {'queued': 1}})
+        self.assertEqual(jobs.run_batch(), (2, 0))
+        signature = models.ThesisSignature.objects.get(thesis=self.thesis)
+        self.assertEqual(signature.digest, hashlib.sha256(b'thesis text ' * 100).hexdigest())
+        # A new upload of a file with the same name is screened again
+        self.thesis.file.save('thesis.txt', ContentFile(b'new thesis text ' * 100))
+        jobs.enqueue('screen_thesis', thesis_id=self.thesis.pk)
+        self.assertEqual(jobs.run_batch(), (1, 0))
+        self.assertEqual(models.ThesisSignature.objects.get(thesis=self.thesis).digest,
+                         hashlib.sha256(b'new thesis text ' * 100).hexdigest())
+        # Corrupted content fails the check without retries
+        with open(self.thesis.file.path, 'wb') as f:
+            f.write(b'corrupted')
+        jobs.enqueue_file_jobs(self.thesis)
+        self.assertEqual(jobs.run_batch(), (1, 1))
+        job = models.Job.objects.get(kind='verify_file', status=models.Job.STATUSES.failed)
+        self.assertEqual(job.attempts, 1)
+        self.assertIn('does not match', job.last_error)
+
+    def test_priorities_and_retries(self):
+        jobs.enqueue('test_flaky', name='low')
+        jobs.enqueue('test_flaky', priority=5, name='high')
+        self.assertEqual(jobs.run_batch(batch_size=1), (0, 1))
+        self.assertEqual(self.calls, ['high'])
+        job = models.Job.objects.get(arguments='{"name": "high"}')
+        self.assertEqual((job.status, job.attempts), (models.Job.STATUSES.queued, 1))
+        self.assertGreater(job.next_attempt, timezone.now())
+        self.assertEqual(jobs.run_batch(), (0, 1))
+        models.Job.objects.update(next_attempt=timezone.now())
+        self.assertEqual(jobs.run_batch(), (2, 0))
+        self.assertEqual(self.calls, ['high', 'low', 'high', 'low'])
+        self.assertEqual(jobs.queue_depth(), {})
+
+    def tearDown(self):
+        jobs.HANDLERS.pop('test_flaky')
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root)
+
+
+class StatisticsTestCase(TestCase):
+    mock_password = 'testpass123'
+
+    def setUp(self):
+        self.faculty = models.Faculty.objects.create(code='W8', name='Computer Science')
+        self.supervisors = [models.User.objects.create_user(email='supervisor{}@test.test'.format(i),
+                                                            faculty=self.faculty if i == 0 else None)
+                            for i in range(2)]
+
+    def create_thesis(self, i, supervisor, level=models.LEVELS.Bachelor):
+        student = models.User.objects.create_user(email='student{}@test.test'.format(i))
+        topic = models.Topic.objects.create(name='Topic {}'.format(i), student=student, supervisor=supervisor,
+                                            level=level, checked=True)
+        return models.Thesis.objects.create(topic=topic, student=student, supervisor=supervisor, finished=True)
+
+    def stored(self):
+        return {(row.metric, row.level, row.supervisor_id): row.count
+                for row in models.Statistic.objects.exclude(count=0)}
+
+    def assertCountersMatch(self):
+        stored = self.stored()
+        statistics.rebuild()
+        self.assertEqual(stored, self.stored())
+
+    def test_counters_follow_changes(self):
+        theses = [self.create_thesis(i, self.supervisors[i % 2]) for i in range(4)]
+        models.Topic.objects.create(name='Available', supervisor=self.supervisors[0], available=True)
+        review = models.Review.objects.create(thesis=theses[0], author=self.supervisors[1])
+        models.Defense.objects.create(thesis=theses[1], successful=False, second_defense=True)
+        key = (models.Statistic.METRICS.reviews_pending, models.LEVELS.Bachelor, self.supervisors[0].id)
+        self.assertEqual(self.stored()[key], 1)
+        self.assertCountersMatch()
+
+        # Changes passed on to the reviews and defenses of the theses
+        topic = theses[0].topic
+        topic.level = models.LEVELS.Master
+        topic.save()
+        theses[1].supervisor = self.supervisors[0]
+        theses[1].save()
+        review.file = 'theses/review.txt'
+        review.save(update_fields=['file'])
+        self.assertNotIn(key, self.stored())
+        self.assertCountersMatch()
+        theses[2].topic.delete()
+        self.supervisors[1].delete()
+        self.assertCountersMatch()
+
+    def test_bulk_assignment_is_counted(self):
+        for i in range(3):
+            self.create_thesis(i, self.supervisors[0])
+        assignment.apply_assignment(assignment.plan_assignment(
+            reviewers=models.User.objects.filter(pk=self.supervisors[1].pk)))
+        self.assertEqual(self.stored()[models.Statistic.METRICS.reviews_pending, models.LEVELS.Bachelor,
+                                      self.supervisors[0].id], 3)
+        self.assertCountersMatch()
+
+    def test_dashboard(self):
+        self.create_thesis(0, self.supervisors[0])
+        self.create_thesis(1, self.supervisors[1], level=models.LEVELS.Master)
+        summary = statistics.dashboard()
+        finished = [label for metric, label in models.Statistic.METRICS].index('Finished theses')
+        self.assertEqual(summary['totals'][finished], 2)
+        self.assertEqual([name for name, numbers in summary['faculties']], ['No faculty', str(self.faculty)])
+        self.assertEqual([numbers[finished] for name, numbers in summary['levels']], [1, 1])
+        summary = statistics.dashboard(faculty=self.faculty.id)
+        self.assertEqual(summary['totals'][finished], 1)
+
+        admin = models.User.objects.create_superuser(email='admin@test.test', password=self.mock_password)
+        self.client.login(username=admin.email, password=self.mock_password)
+        url = reverse('admin:site_app_statistic_changelist')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, {'level': models.LEVELS.Master})
+        self.assertContains(response, 'Finished theses')
+        self.create_thesis(2, self.supervisors[1], level=models.LEVELS.Master)
+        # The dashboard reads the counters, not the counted rows
+        with self.assertNumQueries(len(queries)):
+            self.client.get(url, {'level': models.LEVELS.Master})
+        self.assertRedirects(self.client.post(url), url)
+
+
+class ExportTestCase(TestCase):
+    mock_password = 'testpass123'
+
+    def setUp(self):
+        self.faculty = models.Faculty.objects.create(code='W8', name='Computer Science')
+        self.admin = models.User.objects.create_superuser(email='admin@test.test', password=self.mock_password)
+        supervisor = models.User.objects.create_user(email='supervisor@test.test', first_name='Ada',
+                                                     last_name='Lovelace')
+        for i in range(5):
+            student = models.User.objects.create_user(email='student{}@test.test'.format(i), first_name='Student',
+                                                      last_name=str(i), faculty=self.faculty if i < 3 else None)
+            topic = models.Topic.objects.create(name='Topic {}'.format(i), student=student, supervisor=supervisor,
+                                                level=models.LEVELS.Master if i % 2 else models.LEVELS.Bachelor)
+            thesis = models.Thesis.objects.create(topic=topic, student=student, supervisor=supervisor, finished=True,
+                                                  finished_date=timezone.now() - timedelta(days=i * 10))
+            models.Defense.objects.create(thesis=thesis, successful=i != 2, second_defense=i == 2)
+        self.client.login(username=self.admin.email, password=self.mock_password)
+
+    def export(self, name, **params):
+        response = self.client.get(reverse('export', args=[name]), params)
+        self.assertEqual(response.status_code, 200)
+        return list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode('utf-8'))))
+
+    @override_settings(EXPORT_BATCH_SIZE=2)
+    def test_rows_are_read_in_batches(self):
+        rows = exports.filter_rows('theses')
+        # Three full batches, the last one being empty
+        with self.assertNumQueries(3):
+            exported = list(exports.export_rows('theses', rows))
+        self.assertEqual(len(exported), 6)
+        self.assertEqual(exported[1][1:6], ['Topic 0', 'Bachelor', 'Student 0', '000001', 'W8'])
+        self.assertEqual(exported[1][6:8], ['Ada Lovelace', 'yes'])
+        self.assertEqual(self.export('theses')[1:], [[str(value) for value in row] for row in exported[1:]])
+
+    def test_filters(self):
+        self.assertEqual(len(self.export('defenses', faculty=self.faculty.pk)), 4)
+        self.assertEqual([row[2] for row in self.export('defenses', level=models.LEVELS.Master)[1:]],
+                         ['Master', 'Master'])
+        today = timezone.localtime(timezone.now()).date()
+        rows = self.export('theses', date_from=(today - timedelta(days=15)).isoformat(), date_to=today.isoformat())
+        self.assertEqual([row[1] for row in rows[1:]], ['Topic 0', 'Topic 1'])
+        response = self.client.get(reverse('export', args=['theses']), {'date_from': today.isoformat(),
+                                                                        'date_to': '2000-01-01'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_admin_action_and_access(self):
+        selected = models.Defense.objects.values_list('pk', flat=True)[:2]
+        data = {'action': 'export_csv', '_selected_action': list(selected)}
+        response = self.client.post(reverse('admin:site_app_defense_changelist'), data)
+        self.assertEqual(len(list(response.streaming_content)), 3)
+        self.client.login(username='student0@test.test', password='')
+        self.assertEqual(self.client.get(reverse('export', args=['theses'])).status_code, 403)
+
+
+    @override_settings(EXPORT_BATCH_SIZE=2)
+    def test_xlsx_is_streamed(self):
+        response = self.client.get(reverse('export', args=['theses']), {'format': 'xlsx'})
+        self.assertEqual(response['Content-Type'], exports.XLSX_CONTENT_TYPE)
+        parts = list(response.streaming_content)
+        self.assertGreater(len(parts), 1)
+        with zipfile.ZipFile(io.BytesIO(b''.join(parts))) as workbook:
+            sheet = ElementTree.fromstring(workbook.read('xl/worksheets/sheet1.xml'))
+        namespace = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+        rows = [[''.join(cell.itertext()) for cell in row] for row in sheet.iter(namespace + 'row')]
+        # Empty cells are left out of the worksheet
+        self.assertEqual(rows, [[value for value in row if value] for row in self.export('theses')])
+
+    def test_formulas_are_neutralized(self):
+        models.Topic.objects.filter(name='Topic 0').update(name='=HYPERLINK("http://evil.test")')
+        models.User.objects.filter(email='student1@test.test').update(first_name='@Student')
+        rows = self.export('theses')
+        self.assertEqual(rows[1][1], '\'=HYPERLINK("http://evil.test")')
+        self.assertEqual(rows[2][3], "'@Student 1")
+
+
+class BenchmarkTestCase(TestCase):
+
+    def test_seed_and_run(self):
+        created = benchmarks.seed(students=30, batch_size=20, index=False)
+        # A topic of every student and the topics offered for each of the two batches of students
+        offered = int(20 * benchmarks.OFFERED_TOPICS) + int(10 * benchmarks.OFFERED_TOPICS)
+        self.assertEqual(created['topics'], 30 + offered)
+        self.assertEqual(models.User.objects.filter(groups__name='Student').count(), 30)
+        self.assertEqual(created['reviews'], models.Review.objects.filter(deadline__isnull=False).count())
+        stored = {(row.metric, row.level, row.supervisor_id): row.count for row in models.Statistic.objects.all()}
+        statistics.rebuild()
+        self.assertEqual(stored, {(row.metric, row.level, row.supervisor_id): row.count
+                                  for row in models.Statistic.objects.all()})
+
+        results = benchmarks.run(requests=3, warmup=1, names=['login', 'topic_list', 'reviews', 'admin_topic'])
+        self.assertEqual([result['name'] for result in results['scenarios']],
+                         ['login', 'topic_list', 'reviews', 'admin_topic'])
+        for result in results['scenarios']:
+            self.assertEqual((result['requests'], result['errors']), (3, 0))
+            self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+            self.assertGreater(result['queries_min'], 0)
+        self.assertEqual(results['rows']['theses'], models.Thesis.objects.count())
+        self.assertEqual(len(benchmarks.compare(json.loads(json.dumps(results)), results)), 4)
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual([benchmarks.percentile(values, share) for share in (0.5, 0.95, 0.99)], [50, 95, 99])
+        self.assertIsNone(benchmarks.percentile([], 0.5))
+
+
+class ContentAddressedStorageTestCase(TestCase):
+    content = b'thesis content'
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.storage = storage.ContentAddressedStorage(location=self.media_root)
+
+    def test_identical_files_share_blob(self):
+        self.storage.save('theses/student_1/a.pdf', ContentFile(self.content))
+        self.storage.save('theses/student_2/b.pdf', ContentFile(self.content))
+        self.assertEqual(models.StoredBlob.objects.get().refcount, 2)
+        self.assertEqual(self.storage.size('theses/student_1/a.pdf'), len(self.content))
+        with self.storage.open('theses/student_2/b.pdf') as f:
+            self.assertEqual(f.read(), self.content)
+        self.assertEqual(self.storage.listdir('theses'), (['student_1', 'student_2'], []))
+
+    def test_resave_gets_new_name(self):
+        name = self.storage.save('theses/thesis_1/review.doc', ContentFile(b'first'))
+        other = self.storage.save(name, ContentFile(b'second'))
+        self.assertNotEqual(other, name)
+        with self.storage.open(name) as f:
+            self.assertEqual(f.read(), b'first')
+        self.assertEqual(self.storage.replace(name, ContentFile(b'second')), name)
+        with self.storage.open(name) as f:
+            self.assertEqual(f.read(), b'second')
+        self.assertEqual(sorted(models.StoredBlob.objects.values_list('refcount', flat=True)), [0, 2])
+
+    def test_reviews_of_one_thesis_are_kept(self):
+        supervisor = models.User.objects.create_user(email='supervisor@test.test', password='testpass123')
+        student = models.User.objects.create_user(email='student@test.test', password='testpass123')
+        topic = models.Topic.objects.create(name='Topic', supervisor=supervisor, student=student)
+        thesis = models.Thesis.objects.create(student=student, supervisor=supervisor, topic=topic, finished=True)
+        reviews = [models.Review.objects.create(thesis=thesis, author=author) for author in (supervisor, student)]
+        with override_settings(MEDIA_ROOT=self.media_root):
+            for review, content in zip(reviews, (b'review A', b'review B')):
+                review.file.save('review.pdf', ContentFile(content))
+            for review, content in zip(reviews, (b'review A', b'review B')):
+                review.refresh_from_db()
+                with review.file.storage.open(review.file.name) as f:
+                    self.assertEqual(f.read(), content)
+
+    def test_garbage_collection(self):
+        self.storage.save('theses/student_1/orphan.pdf', ContentFile(self.content))
+        self.assertEqual(storage.collect_garbage(self.storage, grace=timedelta(0), dry_run=True)[:2], (1, 0))
+        self.assertEqual(storage.collect_garbage(self.storage, grace=timedelta(0)), (1, 1, len(self.content)))
+        self.assertFalse(models.StoredBlob.objects.exists())
+        blob_path = os.path.join(self.media_root, storage.blob_name(hashlib.sha256(self.content).hexdigest()))
+        self.assertFalse(os.path.exists(blob_path))
+
+    def tearDown(self):
+        shutil.rmtree(self.media_root)
+
+
+class MailQueueTestCase(TestCase):
+
+    def setUp(self):
+        self.user = models.User.objects.create_user(email='mail@test.test', password='testpass123')
+
+    def test_email_user_is_queued(self):
+        mail.outbox = []
+        self.user.email_user('Subject', 'Body')
+        self.assertEqual(len(mail.outbox), 0)
+        queued = models.QueuedMail.objects.get()
+        self.assertEqual(queued.to, self.user.email)
+        self.assertEqual(queued.status, models.QueuedMail.STATUSES.queued)
+
+    @override_settings(EMAIL_BACKEND='site_app.mail.QueuedEmailBackend')
+    def test_backend_queues_messages(self):
+        message = EmailMultiAlternatives('Subject', 'Body', 'from@test.test', ['a@test.test', 'b@test.test'])
+        message.attach_alternative('<p>Body</p>', 'text/html')
+        message.send()
+        queued = models.QueuedMail.objects.get()
+        self.assertEqual(queued.to, 'a@test.test\nb@test.test')
+        self.assertEqual(queued.html_body, '<p>Body</p>')
+
+    @override_settings(EMAIL_BACKEND='site_app.mail.QueuedEmailBackend',
+                       MAIL_QUEUE_BACKEND='django.core.mail.backends.locmem.EmailBackend')
+    def test_queued_message_keeps_attachments_and_headers(self):
+        message = EmailMultiAlternatives('Subject', 'Zażółć', 'from@test.test', ['a@test.test'], ['b@test.test'],
+                                         reply_to=['reply@test.test'], headers={'X-Thesis': '7'})
+        message.attach_alternative('<p>Body</p>', 'text/html')
+        message.attach('review.txt', 'Review text', 'text/plain')
+        message.send()
+        mail.outbox = []
+        self.assertEqual(queue.send_batch(), (1, 0))
+        sent = mail.outbox[0]
+        self.assertEqual(sent.recipients(), ['a@test.test', 'b@test.test'])
+        mime = sent.message()
+        self.assertEqual((mime['Reply-To'], mime['X-Thesis'], mime['Bcc']), ('reply@test.test', '7', None))
+        parts = [part.get_content_type() for part in mime.walk()]
+        self.assertEqual(parts, ['multipart/mixed', 'multipart/alternative', 'text/plain', 'text/html', 'text/plain'])
+        self.assertEqual(mime.get_payload(1).get_filename(), 'review.txt')
+        self.assertIn('Zażółć'.encode('utf-8'), mime.as_bytes(linesep='\r\n'))
+
+    @override_settings(MAIL_QUEUE_MAX_ATTEMPTS=2)
+    def test_rejected_message_is_retried(self):
+        self.user.email_user('Subject', 'Body')
+
+        class RejectingConnection(object):
+            def open(self):
+                pass
+
+            def close(self):
+                pass
+
+            def send_messages(self, messages):
+                return 0
+
+        self.assertEqual(queue.send_batch(connection=RejectingConnection()), (0, 1))
+        queued = models.QueuedMail.objects.get()
+        self.assertEqual((queued.status, queued.attempts), (models.QueuedMail.STATUSES.queued, 1))
+        self.assertIn('not accepted', queued.last_error)
+
+    @override_settings(MAIL_QUEUE_BACKEND='django.core.mail.backends.locmem.EmailBackend')
+    def test_batch_is_sent(self):
+        mail.outbox = []
+        for i in range(3):
+            self.user.email_user('Subject {}'.format(i), 'Body')
+        self.assertEqual(queue.send_batch(batch_size=2), (2, 0))
+        self.assertEqual(queue.send_batch(batch_size=2), (1, 0))
+        self.assertEqual(queue.send_batch(batch_size=2), (0, 0))
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(models.QueuedMail.objects.filter(status=models.QueuedMail.STATUSES.sent).count(), 3)
+
+    @override_settings(MAIL_QUEUE_MAX_ATTEMPTS=2, MAIL_QUEUE_RETRY_DELAY=60)
+    def test_failed_message_is_retried(self):
+        self.user.email_user('Subject', 'Body')
+
+        class BrokenConnection(object):
+            def open(self):
+                pass
+
+            def close(self):
+                pass
+
+            def send_messages(self, messages):
+                raise IOError('Connection refused')
+
+        self.assertEqual(queue.send_batch(connection=BrokenConnection()), (0, 1))
+        queued = models.QueuedMail.objects.get()
+        self.assertEqual(queued.status, models.QueuedMail.STATUSES.queued)
+        self.assertGreater(queued.next_attempt, timezone.now() + timedelta(seconds=50))
+        # The message is not due before its next attempt
+        self.assertEqual(queue.send_batch(connection=BrokenConnection()), (0, 0))
+        models.QueuedMail.objects.update(next_attempt=timezone.now())
+        self.assertEqual(queue.send_batch(connection=BrokenConnection()), (0, 1))
+        self.assertEqual(models.QueuedMail.objects.get().status, models.QueuedMail.STATUSES.failed)
+
+    def test_stale_claim_is_released(self):
+        self.user.email_user('Subject', 'Body')
+        self.assertEqual(len(queue.claim_batch(10)), 1)
+        self.assertEqual(len(queue.claim_batch(10)), 0)
+        self.assertEqual(len(queue.claim_batch(10, now=timezone.now() + queue.CLAIM_LEASE)), 1)
+
+    @override_settings(MAIL_QUEUE_BACKEND='django.core.mail.backends.smtp.EmailBackend', EMAIL_HOST='127.0.0.1')
+    def test_batch_is_sent_over_one_smtp_connection(self):
+        server = LocalSMTPServer()
+        try:
+            for i in range(3):
+                self.user.email_user('Subject {}'.format(i), 'Body')
+            with self.settings(EMAIL_PORT=server.port):
+                self.assertEqual(queue.send_batch(), (3, 0))
+        finally:
+            server.stop()
+        self.assertEqual(len(server.messages), 3)
+        self.assertEqual(server.connections, 1)
+
+
+class LocalSMTPServer(smtpd.SMTPServer):
+    """
+    SMTP server running in a thread on a free local port, recording the received messages and connections.
+    """
+
+    def __init__(self):
+        self.messages, self.connections = [], 0
+        self._map = {}
+        smtpd.SMTPServer.__init__(self, ('127.0.0.1', 0), None, map=self._map, decode_data=True)
+        self.port = self.socket.getsockname()[1]
+        self._thread = threading.Thread(target=asyncore.loop, kwargs={'timeout': 0.05, 'map': self._map})
+        self._thread.start()
+
+    def handle_accepted(self, conn, addr):
+        self.connections += 1
+        smtpd.SMTPChannel(self, conn, addr, map=self._map, decode_data=True)
+
+    def process_message(self, peer, mailfrom, rcpttos, data, **kwargs):
+        self.messages.append((mailfrom, rcpttos, data))
+
+    def stop(self):
+        for channel in list(self._map.values()):
+            channel.close()
+        self._thread.join()
+
+
+class RosterImportTestCase(TestCase):
+    roster = (
+        'Email,Index Number,First Name,Last Name,Degree,Faculty,Department,Password,Groups\n'
+        'first@test.test,200001,Anna,Nowak,Master,W4,K1,secret123,Student\n'
+        'second@test.test,200002,Jan,Kowalski,,,,,Student;Reviewer\n'
+        'invalid,200003,,,,,,,\n'
+        'third@test.test,200004,,,Unknown,,,,\n'
+    )
+
+    def setUp(self):
+        self.students = models.Group.objects.create(name='Student')
+        models.Group.objects.create(name='Reviewer')
+        self.faculty = models.Faculty.objects.create(code='W4', name='Computer Science')
+
+    def run_import(self, content, **kwargs):
+        return roster.import_roster(io.BytesIO(content.encode('utf-8')), 'roster.csv', **kwargs)
+
+    def test_users_are_created(self):
+        result = self.run_import(self.roster, workers=2, batch_size=2)
+        self.assertEqual((result.created, result.updated), (2, 0))
+        self.assertEqual([line for line, message in result.errors], [4, 5])
+        first = models.User.objects.get(email='first@test.test')
+        self.assertEqual((first.index_number, first.degree, first.faculty_id), ('200001', 'Master', self.faculty.id))
+        self.assertTrue(first.check_password('secret123'))
+        self.assertTrue(first.is_student)
+        second = models.User.objects.get(email='second@test.test')
+        self.assertFalse(second.has_usable_password())
+        self.assertEqual(set(second.groups.values_list('name', flat=True)), {'Student', 'Reviewer'})
+
+    def test_existing_users_are_updated(self):
+        existing = models.User.objects.create_user(email='first@test.test', password='oldpass123')
+        by_index = models.User.objects.create_user(email='other@test.test', index_number='200002')
+        self.students.user_set.add(existing)
+        result = self.run_import(self.roster, workers=0)
+        self.assertEqual((result.created, result.updated), (0, 2))
+        existing.refresh_from_db()
+        self.assertEqual(existing.last_name, 'Nowak')
+        self.assertTrue(existing.check_password('secret123'))
+        self.assertEqual(existing.groups.count(), 1)
+        # Users without a password in the roster keep their own
+        by_index.refresh_from_db()
+        self.assertEqual(by_index.first_name, 'Jan')
+        self.assertTrue(by_index.has_usable_password())
+
+    def test_users_are_matched_ignoring_email_case_and_default_index(self):
+        existing = models.User.objects.create_user(email='First@Test.test')
+        unnumbered = models.User.objects.create_user(email='other@test.test')
+        result = self.run_import('email,index_number,last_name\nfirst@test.test,000001,Nowak\n'
+                                 'new@test.test,000001,Kowalski\n', workers=0)
+        self.assertEqual((result.created, result.updated), (1, 1))
+        existing.refresh_from_db()
+        self.assertEqual(existing.last_name, 'Nowak')
+        self.assertEqual(models.User.objects.get(pk=unnumbered.pk).last_name, unnumbered.last_name)
+
+    def test_row_limit(self):
+        with self.assertRaises(roster.RosterError):
+            self.run_import(self.roster, workers=0, max_rows=3)
+        self.assertFalse(models.User.objects.exists())
+
+    def test_default_groups(self):
+        self.run_import('email\nplain@test.test\n', workers=0, groups=['Reviewer'])
+        self.assertTrue(models.User.objects.get(email='plain@test.test').is_reviewer)
+        with self.assertRaises(roster.RosterError):
+            self.run_import('email\n', workers=0, groups=['Unknown'])
+
+    def test_admin_upload(self):
+        admin = models.User.objects.create_superuser(email='admin@test.test', password='testpass123')
+        self.client.login(username=admin.email, password='testpass123')
+        upload = SimpleUploadedFile('roster.csv', self.roster.encode('utf-8'), content_type='text/csv')
+        response = self.client.post(reverse('admin:site_app_user_import'),
+                                    {'roster': upload, 'groups': [self.students.id]})
+        self.assertRedirects(response, reverse('admin:site_app_user_changelist'))
+        self.assertEqual(models.User.objects.filter(groups=self.students).count(), 2)
+        with self.settings(ROSTER_IMPORT_MAX_ROWS=1):
+            upload = SimpleUploadedFile('roster.csv', self.roster.encode('utf-8'), content_type='text/csv')
+            response = self.client.post(reverse('admin:site_app_user_import'), {'roster': upload})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('more than 1 rows', str(response.context['form'].errors))
+
+
+class ReviewerAssignmentTestCase(TestCase):
+
+    def setUp(self):
+        reviewers = models.Group.objects.create(name='Reviewer')
+        self.supervisor = models.User.objects.create_user(email='supervisor@test.test')
+        self.reviewers = [models.User.objects.create_user(email='reviewer{}@test.test'.format(i)) for i in range(2)]
+        for user in [self.supervisor] + self.reviewers:
+            reviewers.user_set.add(user)
+        self.theses = [self.create_thesis(i, self.reviewers[0] if i < 3 else self.supervisor) for i in range(6)]
+        # Neither unfinished nor reviewed theses are assigned
+        self.create_thesis(6, self.supervisor, finished=False)
+        models.Review.objects.create(thesis=self.create_thesis(7, self.supervisor), author=self.reviewers[1])
+
+    def create_thesis(self, i, supervisor, finished=True):
+        student = models.User.objects.create_user(email='student{}@test.test'.format(i))
+        topic = models.Topic.objects.create(name='Topic {}'.format(i), student=student, supervisor=supervisor)
+        return models.Thesis.objects.create(topic=topic, student=student, supervisor=supervisor, finished=finished)
+
+    def test_hungarian_finds_minimal_assignment(self):
+        costs = [[7, 3, 9, 4, 8], [2, 6, 5, 9, 1], [8, 4, 3, 7, 6], [5, 9, 2, 1, 7]]
+        columns = assignment.hungarian(costs)
+        self.assertEqual(len(set(columns)), len(costs))
+        best = min(sum(costs[row][column] for row, column in enumerate(permutation))
+                   for permutation in itertools.permutations(range(5), 4))
+        self.assertEqual(sum(costs[row][column] for row, column in enumerate(columns)), best)
+
+    def solver_costs(self):
+        theses = [(i % 4 + 1, 100 + i, i % 3 or None) for i in range(12)]
+        reviewers = [(i + 1, i % 2 + 1) for i in range(5)]
+        return assignment.build_costs(theses, reviewers, [2, 0, 1, 0, 3], 4)
+
+    @skipIf(assignment.linear_sum_assignment is None, 'SciPy is not installed')
+    def test_solvers_find_same_cost(self):
+        costs = self.solver_costs()
+        rows = costs.tolist()
+        scipy_total = sum(rows[row][column] for row, column in assignment.solve(costs))
+        self.assertEqual(sum(rows[row][column] for row, column in enumerate(assignment.hungarian(rows))), scipy_total)
+
+    def test_fallback_solver_limit(self):
+        costs = self.solver_costs()
+        with patch.object(assignment, 'linear_sum_assignment', None):
+            pairs = assignment.solve(costs)
+            self.assertEqual(sorted(row for row, column in pairs), list(range(12)))
+            with patch.object(assignment, 'FALLBACK_MAX_THESES', 11):
+                with self.assertRaises(assignment.AssignmentError):
+                    assignment.solve(costs)
+
+    def test_assignment_is_balanced_and_avoids_conflicts(self):
+        plan = assignment.plan_assignment()
+        self.assertEqual(sorted(thesis_id for thesis_id, reviewer_id in plan.pairs),
+                         [thesis.id for thesis in self.theses])
+        supervisors = dict(models.Thesis.objects.values_list('id', 'supervisor_id'))
+        self.assertFalse([pair for pair in plan.pairs if supervisors[pair[0]] == pair[1]])
+        # The second reviewer has a pending review already
+        self.assertEqual(sorted(plan.loads.values()), [2, 2, 3])
+
+        # One check and one insert inside a savepoint, one count of the new reviews and the update of the counters
+        with self.assertNumQueries(8):
+            reviews = assignment.apply_assignment(plan)
+        self.assertEqual(len(reviews), 6)
+        self.assertEqual(models.Review.objects.filter(deadline__isnull=True).count(), 0)
+        # Nothing is left to assign
+        self.assertEqual(len(assignment.plan_assignment()), 0)
+
+    def test_thesis_without_eligible_reviewer(self):
+        plan = assignment.plan_assignment(reviewers=models.User.objects.filter(pk=self.supervisor.pk))
+        self.assertEqual(sorted(plan.unassigned), [thesis.id for thesis in self.theses[3:]])
+        self.assertEqual(len(plan), 3)
+
+    def test_admin_action(self):
+        admin = models.User.objects.create_superuser(email='admin@test.test', password='testpass123')
+        self.client.login(username=admin.email, password='testpass123')
+        data = {'action': 'assign_reviewers', '_selected_action': [thesis.id for thesis in self.theses[:2]]}
+        response = self.client.post(reverse('admin:site_app_thesis_changelist'), data)
+        self.assertContains(response, 'Create 2 reviews')
+        self.assertEqual(models.Review.objects.count(), 1)
+        data['apply'] = 'yes'
+        self.client.post(reverse('admin:site_app_thesis_changelist'), data)
+        self.assertEqual(models.Review.objects.count(), 3)
+
+
+class DefenseSchedulingTestCase(TestCase):
+
+    def setUp(self):
+        self.supervisor = models.User.objects.create_user(email='supervisor@test.test')
+        self.other_supervisor = models.User.objects.create_user(email='other@test.test')
+        self.reviewer = models.User.objects.create_user(email='reviewer@test.test')
+        self.defenses = [self.create_defense(i, self.supervisor) for i in range(3)]
+        self.defenses.append(self.create_defense(3, self.other_supervisor))
+        # The reviewer of the last thesis takes part in the defense of the first one too
+        models.Review.objects.create(thesis=self.defenses[0].thesis, author=self.reviewer)
+        models.Review.objects.create(thesis=self.defenses[3].thesis, author=self.reviewer)
+        # Friday and Monday, two periods a day
+        self.periods = scheduling.generate_periods(date(2026, 10, 16), 2, time(9), time(10), timedelta(minutes=30))
+
+    def create_defense(self, i, supervisor):
+        student = models.User.objects.create_user(email='student{}@test.test'.format(i), first_name='Student',
+                                                  last_name=str(i))
+        topic = models.Topic.objects.create(name='Topic {}'.format(i), student=student, supervisor=supervisor)
+        thesis = models.Thesis.objects.create(topic=topic, student=student, supervisor=supervisor, finished=True)
+        return models.Defense.objects.create(thesis=thesis, successful=False, second_defense=False)
+
+    def test_periods_skip_weekends(self):
+        self.assertEqual(len(self.periods), 4)
+        self.assertEqual([period.weekday() for period in self.periods], [4, 4, 0, 0])
+        self.assertEqual(self.periods[1] - self.periods[0], timedelta(minutes=30))
+
+    def test_schedule_has_no_conflicts(self):
+        schedule = scheduling.plan_schedule(models.Defense.objects.all(), self.periods, ['A', 'B'])
+        self.assertEqual(len(schedule), 4)
+        self.assertEqual(scheduling.apply_schedule(schedule, batch_size=3), 4)
+        self.assertEqual(scheduling.find_conflicts(models.Defense.objects.all()), [])
+        self.assertEqual(set(models.Defense.objects.values_list('room', flat=True)) - {'A', 'B'}, set())
+        # The defense without shared people runs in parallel with another one
+        self.assertEqual(len(set(models.Defense.objects.values_list('date', flat=True))), 3)
+
+    def test_defenses_without_slot(self):
+        schedule = scheduling.plan_schedule(models.Defense.objects.all(), self.periods[:2], ['A', 'B'])
+        self.assertEqual(len(schedule), 3)
+        self.assertEqual(len(schedule.unscheduled), 1)
+
+    def test_fixed_defenses_block_slots(self):
+        fixed = self.defenses[0]
+        models.Defense.objects.filter(pk=fixed.pk).update(date=self.periods[0], room='A', scheduled=True)
+        schedule = scheduling.plan_schedule(models.Defense.objects.exclude(pk=fixed.pk), self.periods, ['A'])
+        self.assertNotIn(self.periods[0], [date for date, room in schedule.slots.values()])
+        self.assertEqual(len(schedule), 3)
+
+    def test_fixed_defense_blocks_every_overlapped_period(self):
+        fixed = self.defenses[3]
+        models.Defense.objects.filter(pk=fixed.pk).update(date=self.periods[0] + timedelta(minutes=15), room='A',
+                                                          scheduled=True)
+        schedule = scheduling.plan_schedule(models.Defense.objects.filter(pk=self.defenses[1].pk), self.periods,
+                                            ['A'])
+        self.assertEqual(schedule.slots[self.defenses[1].pk], (self.periods[2], 'A'))
+
+    def test_command_schedules_only_unscheduled_defenses(self):
+        scheduled = self.defenses[3]
+        models.Defense.objects.filter(pk=scheduled.pk).update(date=self.periods[1], room='B', scheduled=True)
+        # Defenses waiting for a slot are scheduled whatever their date
+        models.Defense.objects.exclude(pk=scheduled.pk).update(date=self.periods[0] - timedelta(days=30))
+        call_command('schedule_defenses', '2026-10-16', '--days=2', '--day-end=10:00', '--rooms=A,B',
+                     stdout=io.StringIO(), stderr=io.StringIO())
+        self.assertEqual(models.Defense.objects.get(pk=scheduled.pk).room, 'B')
+        self.assertFalse(models.Defense.objects.filter(scheduled=False).exists())
+        self.assertEqual(models.Defense.objects.filter(date__gte=self.periods[0]).count(), 4)
+        self.assertEqual(scheduling.find_conflicts(models.Defense.objects.all()), [])
+
+    def test_conflicts_are_found(self):
+        models.Defense.objects.update(date=self.periods[0], room='')
+        models.Defense.objects.filter(pk=self.defenses[3].pk).update(room='A')
+        conflicts = scheduling.find_conflicts(models.Defense.objects.all())
+        reasons = {reason for first, second, reason in conflicts}
+        self.assertIn('person #{}'.format(self.supervisor.id), reasons)
+        self.assertIn('person #{}'.format(self.reviewer.id), reasons)
+
+    def test_overlapping_defenses_conflict(self):
+        first, second = self.defenses[:2]
+        models.Defense.objects.filter(pk=first.pk).update(date=self.periods[0], room='A')
+        models.Defense.objects.filter(pk=second.pk).update(date=self.periods[0] + timedelta(minutes=15), room='A')
+        defenses = models.Defense.objects.filter(pk__in=[first.pk, second.pk])
+        self.assertIn((first.pk, second.pk, 'room A'), scheduling.find_conflicts(defenses))
+        models.Defense.objects.filter(pk=second.pk).update(date=self.periods[1])
+        self.assertEqual(scheduling.find_conflicts(defenses), [])
+
+    def test_export(self):
+        models.Defense.objects.update(date=self.periods[0], room='A')
+        f = io.StringIO()
+        scheduling.export_csv(models.Defense.objects.filter(pk=self.defenses[0].pk), f)
+        rows = list(csv.reader(io.StringIO(f.getvalue())))
+        self.assertEqual(rows[0], ['date', 'room', 'topic', 'student', 'supervisor', 'reviewers'])
+        self.assertEqual(rows[1][:4], ['2026-10-16 09:00', 'A', 'Topic 0', 'Student 0'])
+        self.assertEqual(rows[1][5], self.reviewer.get_full_name())
+
+
 class SendReviewTestCase(TestCase):
     mock_data = {
         'rev_email': 'reviewer@test.test',
@@ -0,0 +1,233 @@
+"""
+Chunked, resumable uploads of thesis and review files. The protocol consists of three requests:
+
+1. POST to the upload list with kind, object_id, filename, size and an optional sha256 checksum creates an upload.
+2. The client sends the file in consecutive chunks as raw bodies of PUT requests to the upload, with the Upload-Offset
+   header set to the position of the chunk. The response contains the offset of the next chunk.
+3. GET of the upload returns the offset to resume from after the connection was interrupted.
+
+Chunks are streamed straight into a partial file and hashed as they arrive, so memory use does not depend on the file
+or chunk size. A request claims the upload before writing its chunk, concurrent requests for the same upload are
+rejected without touching the partial file. Once the last chunk is received, the checksum is verified and the partial
+file is moved into the path given by get_file_path of the thesis or review.
+"""
+import hashlib
+import os
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.db.models import Q
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import ChunkedUpload, Thesis, Review
+from . import jobs
+
+READ_SIZE = 64 * 1024
+# Claims of requests that did not finish writing their chunk within this time are taken over by the next request
+CLAIM_TIMEOUT = timedelta(minutes=10)
+
+# Running checksums of the uploads handled by this process, together with the offset they were computed up to
+_hashers = {}
+
+
+class UploadError(Exception):
+    """
+    Error of the upload protocol. Attributes:
+    status
+    """
+
+    def __init__(self, message, status=400):
+        super(UploadError, self).__init__(message)
+        self.status = status
+
+
+class PartialFile(File):
+    """
+    Completely received partial file. Storages move files providing temporary_file_path() instead of copying them.
+    """
+
+    def temporary_file_path(self):
+        return self.file.name
+
+
+def get_target(user, kind, object_id):
+    """
+    Gets the thesis or review the file is uploaded for and checks that user may upload it. Theses are uploaded by
+    their students, reviews by their authors.
+
+    :param user: (User) The uploading user
+    :param kind: (string) Either 'thesis' or 'review'
+    :param object_id: (int) ID of the thesis or review
+    :raises: UploadError
+    :return: The thesis or review
+    :rtype: Model
+    """
+    model, owner_field = (Thesis, 'student_id') if kind == ChunkedUpload.KINDS.thesis else (Review, 'author_id')
+    try:
+        target = model.objects.get(pk=object_id)
+    except model.DoesNotExist:
+        raise UploadError('No such {}'.format(kind), status=404)
+    if not user.is_admin and getattr(target, owner_field) != user.id:
+        raise UploadError('You can not upload this file', status=403)
+    return target
+
+
+def start_upload(user, kind, object_id, filename, size, sha256=''):
+    """
+    Creates a new upload and its empty partial file.
+
+    :param user: (User) The uploading user
+    :param kind: (string) Either 'thesis' or 'review'
+    :param object_id: (int) ID of the thesis or review
+    :param filename: (string) Name of the uploaded file
+    :param size: (int) Size of the file in bytes
+    :param sha256: (string) Optional expected checksum of the file
+    :raises: UploadError
+    :return: The created upload
+    :rtype: ChunkedUpload
+    """
+    if size > settings.MAX_UPLOAD_SIZE:
+        raise UploadError('File is larger than {} bytes'.format(settings.MAX_UPLOAD_SIZE), status=413)
+    get_target(user, kind, object_id)
+    upload = ChunkedUpload.objects.create(id=uuid.uuid4().hex, owner=user, kind=kind, object_id=object_id,
+                                          filename=os.path.basename(filename), size=size, checksum=sha256.lower())
+    os.makedirs(settings.CHUNKED_UPLOAD_DIR, exist_ok=True)
+    open(upload.partial_path(), 'wb').close()
+    _hashers[upload.id] = (0, hashlib.sha256())
+    return upload
+
+
+def _get_hasher(upload):
+    # Another process may have received the previous chunks, in which case the partial file is hashed again
+    offset, hasher = _hashers.get(upload.id, (None, None))
+    if offset == upload.offset:
+        return hasher
+    hasher = hashlib.sha256()
+    with open(upload.partial_path(), 'rb') as f:
+        remaining = upload.offset
+        while remaining > 0:
+            data = f.read(min(READ_SIZE, remaining))
+            if not data:
+                raise UploadError('Partial file is shorter than the received data', status=409)
+            hasher.update(data)
+            remaining -= len(data)
+    return hasher
+
+
+def write_chunk(upload, offset, stream, length):
+    """
+    Writes a chunk read from the stream into the partial file. Completes the upload after its last chunk.
+
+    :param upload: (ChunkedUpload) The upload
+    :param offset: (int) Position of the chunk in the file
+    :param stream: (file) Stream to read the chunk from, e.g. the request
+    :param length: (int) Length of the chunk
+    :raises: UploadError
+    :return: The upload with updated offset
+    :rtype: ChunkedUpload
+    """
+    if upload.completed:
+        raise UploadError('Upload is already completed', status=409)
+    if offset != upload.offset:
+        raise UploadError('Expected a chunk at offset {}'.format(upload.offset), status=409)
+    if length > settings.CHUNKED_UPLOAD_MAX_CHUNK_SIZE or offset + length > upload.size:
+        raise UploadError('Chunk is too large', status=413)
+
+    # Only one of concurrent requests sending the same chunk may write it
+    claim = timezone.now()
+    unclaimed = Q(claimed__isnull=True) | Q(claimed__lt=claim - CLAIM_TIMEOUT)
+    if not ChunkedUpload.objects.filter(unclaimed, pk=upload.pk, offset=offset, completed=False).update(claimed=claim):
+        _hashers.pop(upload.id, None)
+        raise UploadError('Chunk is already being received', status=409)
+    try:
+        hasher = _get_hasher(upload)
+        with open(upload.partial_path(), 'r+b') as f:
+            f.seek(offset)
+            remaining = length
+            while remaining > 0:
+                data = stream.read(min(READ_SIZE, remaining))
+                if not data:
+                    break
+                f.write(data)
+                hasher.update(data)
+                remaining -= len(data)
+            f.truncate()
+    except Exception:
+        ChunkedUpload.objects.filter(pk=upload.pk, claimed=claim).update(claimed=None)
+        raise
+    written = length - remaining
+
+    if not ChunkedUpload.objects.filter(pk=upload.pk, claimed=claim).update(offset=offset + written, claimed=None):
+        # The claim expired and another request took the upload over
+        _hashers.pop(upload.id, None)
+        raise UploadError('Chunk is already being received', status=409)
+    upload.offset = offset + written
+    _hashers[upload.id] = (upload.offset, hasher)
+    if upload.offset == upload.size:
+        complete_upload(upload, hasher)
+    return upload
+
+
+def complete_upload(upload, hasher):
+    """
+    Verifies the checksum of a completely received file and moves it into its final place.
+
+    :param upload: (ChunkedUpload) The upload
+    :param hasher: Running SHA-256 checksum of the received data
+    :raises: UploadError
+    """
+    _hashers.pop(upload.id, None)
+    if upload.checksum and hasher.hexdigest() != upload.checksum:
+        # The data is corrupted, the client has to send the file again
+        ChunkedUpload.objects.filter(pk=upload.pk).update(offset=0)
+        upload.offset = 0
+        open(upload.partial_path(), 'wb').close()
+        raise UploadError('Checksum mismatch', status=422)
+
+    target = get_target(upload.owner, upload.kind, upload.object_id)
+    with PartialFile(open(upload.partial_path(), 'rb'), name=upload.filename) as content:
+        # Lets the content-addressed storage skip hashing the file again
+        content.sha256 = hasher.hexdigest()
+        target.file.save(upload.filename, content, save=False)
+    if upload.kind == ChunkedUpload.KINDS.review:
+        target.finished_date = timezone.now()
+    target.save()
+    jobs.enqueue_file_jobs(target)
+    if os.path.exists(upload.partial_path()):
+        os.remove(upload.partial_path())
+    upload.completed = True
+    upload.save(update_fields=['completed'])
+
+
+def upload_state(upload):
+    """
+    Gets the state of an upload reported to the client.
+
+    :param upload: (ChunkedUpload) The upload
+    :return: ID, URL, offset, size and completion of the upload
+    :rtype: dict
+    """
+    return {'id': upload.id, 'url': reverse('upload_chunk', args=[upload.id]), 'offset': upload.offset,
+            'size': upload.size, 'completed': upload.completed}
+
+
+def clear_stale_uploads(older_than):
+    """
+    Deletes unfinished uploads created before given moment together with their partial files.
+
+    :param older_than: (datetime) Uploads created before this moment are deleted
+    :return: Number of deleted uploads
+    :rtype: int
+    """
+    stale = ChunkedUpload.objects.filter(completed=False, created__lt=older_than)
+    count = 0
+    for upload in stale.iterator():
+        if os.path.exists(upload.partial_path()):
+            os.remove(upload.partial_path())
+        _hashers.pop(upload.id, None)
+        count += 1
+    stale.delete()
+    return count
@@ -1,10 +1,20 @@
 from django.conf.urls import url
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.views import login, logout
-from . import views, forms
+from . import api, views, forms
 
 urlpatterns = [
     url(r'^$', views.ProfileView.as_view(), name='profile'),
+    url(r'^download/thesis/(?P<pk>\d+)$', views.ThesisDownloadView.as_view(), name='thesis_file'),
+    url(r'^download/review/(?P<pk>\d+)$', views.ReviewDownloadView.as_view(), name='review_file'),
+    url(r'^uploads/$', views.UploadStartView.as_view(), name='upload_start'),
+    url(r'^uploads/(?P<pk>[0-9a-f]{32})$', views.UploadChunkView.as_view(), name='upload_chunk'),
+    url(r'^api/(?P<resource>topics|theses|reviews|defenses)/$', api.ResourceListView.as_view(), name='api_list'),
+    url(r'^api/(?P<resource>topics|theses|reviews|defenses)/(?P<pk>\d+)$', api.ResourceDetailView.as_view(),
+        name='api_detail'),
+    url(r'^export/(?P<name>theses|reviews|defenses)$', views.ExportView.as_view(), name='export'),
+    url(r'^metrics$', views.MetricsView.as_view(), name='metrics'),
+    url(r'^reviews/deadlines$', views.DeadlineListView.as_view(), name='deadlines'),
     url(r'^reviews', views.ReviewListView.as_view(), name='reviews'),
     url(r'^topic_list', views.TopicListView.as_view(), name='topic_list'),
     url(r'^login', login, {'authentication_form': forms.LoginForm, 'template_name': 'login.html'}, name='login'),
@@ -1,21 +1,39 @@
 from django.utils import timezone
 from django.contrib.auth.decorators import login_required
-from django.http import Http404
-from django.shortcuts import redirect
+from django.core.exceptions import PermissionDenied
+from django.http import Http404, HttpResponse, JsonResponse
+from django.middleware.csrf import get_token
+from django.shortcuts import get_object_or_404, redirect
+from django.template.loader import render_to_string
+from django.utils.cache import get_conditional_response, patch_cache_control
 from django.utils.decorators import method_decorator
+from django.utils.http import http_date, quote_etag
+from django.views.generic import DetailView
 from django.views.generic import ListView
 from django.views.generic import TemplateView
+from django.views.generic import View
 from functools import wraps
 from site_app.forms import ReviewUploadForm
+from . import caching
+from . import downloads
+from . import exports
 from . import models
 from . import forms
+from . import jobs
+from . import metrics
+from . import pagination
+from . import plagiarism
+from . import roles
+from . import search
+from . import similarity
+from . import uploads
 
 
 def check_group(group_name):
     def _check_group(view_func):
         @wraps(view_func)
         def wrapper(request, *args, **kwargs):
-            if request.user.groups.filter(name=group_name).exists() or request.user.is_admin:
+            if roles.has_role(request.user, group_name):
                 return view_func(request, *args, **kwargs)
             return redirect('/')
 
@@ -29,28 +47,260 @@ class ProfileView(TemplateView):
     template_name = "profile.html"
 
 
+class KeysetPaginationMixin(object):
+    """
+    Mixin for list views paginating their rows with keyset (cursor) pagination. Attributes:
+    sort_orderings, default_sort
+    The ordering of every sortable column ends with a unique field, so that every row has a distinct position.
+
+    """
+
+    sort_orderings = {'id': ('id',)}
+    default_sort = 'id'
+
+    def get_sort(self):
+        """
+        Gets the column the list is sorted by, prefixed with '-' for descending order.
+
+        :return: Sort column requested by user or the default one
+        :rtype: string
+
+        """
+
+        sort = self.request.GET.get('sort', self.default_sort)
+        return sort if sort.lstrip('-') in self.sort_orderings else self.default_sort
+
+    def get_ordering(self):
+        """
+        Gets the keyset ordering of the list. The last field is unique, so that every row has a distinct position.
+
+        :return: Ordering fields
+        :rtype: list
+
+        """
+
+        sort = self.get_sort()
+        prefix = '-' if sort.startswith('-') else ''
+        return [prefix + field for field in self.sort_orderings[sort.lstrip('-')]]
+
+    def paginate_queryset(self, queryset, page_size):
+        """
+        Fetches the page of rows following the cursor passed in the request.
+
+        :param queryset: (QuerySet) Rows to paginate
+        :param page_size: (int) Number of rows on a page
+        :raises: Http404
+        :return: Paginator (always None), the page, rows on the page and whether there are more pages
+        :rtype: tuple
+
+        """
+
+        try:
+            page = pagination.KeysetPage(queryset, self.get_ordering(), self.request.GET.get('cursor'), page_size)
+        except ValueError:
+            raise Http404('Invalid cursor')
+        return None, page, page.object_list, page.has_next
+
+    def get_page_url(self, **params):
+        """
+        Builds the URL of the list with given query parameters replaced, keeping the remaining ones.
+
+        :param params: Query parameters to replace, None removes the parameter
+        :return: Query string of the URL
+        :rtype: string
+
+        """
+
+        query = self.request.GET.copy()
+        for key, value in params.items():
+            query.pop(key, None)
+            if value is not None:
+                query[key] = value
+        return '?' + query.urlencode()
+
+    def get_pagination_context(self, page):
+        """
+        Gets the URLs of the sortable columns and of the neighbouring pages to pass to the template.
+
+        :param page: (KeysetPage) The current page
+        :return: Context variables: sort, sort_urls, next_page_url and first_page_url
+        :rtype: dict
+
+        """
+
+        sort = self.get_sort()
+        context = {
+            'sort': sort,
+            'sort_urls': {column: self.get_page_url(sort='-' + column if sort == column else column, cursor=None)
+                          for column in self.sort_orderings},
+        }
+        if page.has_next:
+            context['next_page_url'] = self.get_page_url(cursor=page.next_cursor)
+        if self.request.GET.get('cursor'):
+            context['first_page_url'] = self.get_page_url(cursor=None)
+        return context
+
+
+class CachedListMixin(object):
+    """
+    Mixin for keyset-paginated list views caching the rendered table of their rows and answering conditional GET
+    requests. Attributes:
+    cache_sections, table_template_name
+    The table is cached for the versions of the sections it shows and the full path of the request. The page is
+    rendered with the HTML of the table in the table context variable.
+
+    """
+
+    cache_sections = ()
+    table_template_name = None
+
+    def get_versions(self):
+        """
+        Gets the versions of the sections shown by the view, read once per request.
+
+        :return: Dictionary of section name to version
+        :rtype: dict
+
+        """
+
+        if not hasattr(self, '_versions'):
+            self._versions = caching.get_versions(self.cache_sections)
+        return self._versions
+
+    def get_cache_variant(self):
+        """
+        Gets the values identifying the rows shown by the view besides the versions of its sections.
+
+        :return: The full path of the request
+        :rtype: list
+
+        """
+
+        return [self.request.get_full_path()]
+
+    def get(self, request, *args, **kwargs):
+        """
+        Handles the get request, answering with 304 Not Modified if the page the user has is still current. The
+        entity tag also covers the roles of the user, shown in the navigation bar, and the CSRF cookie the forms of
+        the page were rendered for.
+
+        :param request: (HttpRequest) The request performed by user
+        :return: The response containing content of the page
+
+        :rtype HttpResponse
+
+        """
+        versions = self.get_versions()
+        # Sets the CSRF cookie on the first visit, so that the next request has the same entity tag
+        get_token(request)
+        etag = caching.digest(sorted(versions.items()), self.get_cache_variant(), request.user.pk,
+                              roles.get_role_version(request.user.pk), request.META['CSRF_COOKIE'])
+        last_modified = caching.last_modified(versions)
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = super(CachedListMixin, self).get(request, *args, **kwargs)
+        response['ETag'] = quote_etag(etag)
+        response['Last-Modified'] = http_date(last_modified)
+        # Browsers keep the page but check whether it is current on every visit
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+    def get_table_context_data(self):
+        """
+        Gets context data of the table, the paginated rows.
+
+        :return: The context of the table
+        :rtype: dict
+
+        """
+
+        context = super(CachedListMixin, self).get_context_data()
+        context.update(self.get_pagination_context(context['page_obj']))
+        return context
+
+    def get_context_data(self, **kwargs):
+        """
+        Gets context data of the view to pass to the template. The rows are only fetched if the table is not cached.
+
+        :param kwargs: Keyword arguments
+        :return: The context with the HTML of the table
+        :rtype: dict
+
+        """
+
+        parts = [sorted(self.get_versions().items())] + self.get_cache_variant()
+        kwargs['table'] = caching.get_or_render(self.table_template_name, parts, lambda: render_to_string(
+            self.table_template_name, self.get_table_context_data(), self.request))
+        kwargs.setdefault('view', self)
+        return kwargs
+
+
 @method_decorator(login_required, name='dispatch')
 @method_decorator(check_group('Student'), name='dispatch')
-class TopicListView(ListView):
+class TopicListView(CachedListMixin, KeysetPaginationMixin, ListView):
     """
     View class responsible for displaying review list. Presents the Topic model.
 
     """
 
     template_name = "student/topic_list.html"
+    table_template_name = "student/topic_table.html"
+    cache_sections = (caching.TOPICS, caching.USERS)
     model = models.Topic
     context_object_name = 'topic_list'
+    paginate_by = 50
+    # Sortable columns and the keyset ordering used for each of them. The id and name orderings are backed by the
+    # indexes of the Topic model, supervisors are sorted by their names, read from the joined user rows.
+    sort_orderings = {
+        'id': ('id',),
+        'name': ('name', 'id'),
+        'supervisor': ('supervisor__last_name', 'supervisor__first_name', 'id'),
+        'relevance': ('search_rank', 'id'),
+    }
+    default_sort = 'id'
+
+    search_query = ''
+
+    def get_sort(self):
+        """
+        Gets the column the list is sorted by. Search results are sorted by relevance unless user chose a column.
+
+        :return: Sort column requested by user or the default one
+        :rtype: string
+
+        """
+
+        if self.search_query and 'sort' not in self.request.GET:
+            return 'relevance'
+        sort = super(TopicListView, self).get_sort()
+        if sort.lstrip('-') == 'relevance' and not self.search_query:
+            return self.default_sort
+        return sort
 
     def get_queryset(self):
         """
-        Gets the queryset of a Topic model presented by this view
+        Gets the queryset of a Topic model presented by this view, filtered by the search query, level and supervisor
+        chosen in the filter form.
 
         :return: List of available topics
         :rtype: QuerySet
 
         """
 
-        return models.Topic.objects.filter(available=True)
+        queryset = models.Topic.objects.filter(available=True).select_related('supervisor')
+        self.filter_form = forms.TopicFilterForm(self.request.GET or None)
+        if self.filter_form.is_valid():
+            query = self.filter_form.cleaned_data.get('q')
+            level = self.filter_form.cleaned_data.get('level')
+            supervisor = self.filter_form.cleaned_data.get('supervisor')
+            if query:
+                self.search_query = query
+                queryset = search.search_topics(queryset, query)
+            if level:
+                queryset = queryset.filter(level=level)
+            if supervisor:
+                queryset = queryset.filter(supervisor=supervisor)
+        return queryset
 
     def get_context_data(self, **kwargs):
         """
@@ -62,8 +312,12 @@ class TopicListView(ListView):
 
         """
 
-        context = super(TopicListView, self).get_context_data()
-        context['form'] = forms.StudentTopicProposalForm()
+        context = super(TopicListView, self).get_context_data(**kwargs)
+        # Supervisor choices of the forms change together with the users section
+        users_version = self.get_versions()[caching.USERS]
+        context['form'] = caching.render_form('topic_form', forms.StudentTopicProposalForm(), [users_version])
+        context['filter_form'] = caching.render_form('topic_filter_form', self.filter_form,
+                                                     [users_version, self.request.GET.urlencode()])
         return context
 
     def post(self, request):
@@ -85,16 +339,21 @@ class TopicListView(ListView):
         current_user = request.user
         topic.student = current_user
         topic.level = current_user.degree
+        # Likely duplicates are flagged for the supervisor and shown to the student
+        duplicates = similarity.find_duplicates(topic.name, topic.short_description)
+        if duplicates:
+            topic.similar_to = duplicates[0][0]
         topic.save()
 
         self.object_list = self.get_queryset()
         context = self.get_context_data()
+        context['duplicate_topics'] = duplicates
         return self.render_to_response(context)
 
 
 @method_decorator(login_required, name='dispatch')
 @method_decorator(check_group('Reviewer'), name='dispatch')
-class ReviewListView(ListView):
+class ReviewListView(CachedListMixin, KeysetPaginationMixin, ListView):
     """
     View class responsible for displaying review list. Presents the Review model. Only reviewers and administrators will be able to access this
     view.
@@ -102,8 +361,11 @@ class ReviewListView(ListView):
     """
 
     template_name = "reviewer/review_list.html"
+    table_template_name = "reviewer/review_table.html"
+    cache_sections = (caching.REVIEWS, caching.THESES, caching.TOPICS, caching.USERS)
     model = models.Review
     context_object_name = 'review_list'
+    paginate_by = 50
     did_send = False
     object_list = None
 
@@ -111,12 +373,36 @@ class ReviewListView(ListView):
         """
         Gets the queryset of a Review model presented by this view
 
-        :return: List of reviews made by current user
+        :return: List of reviews made by current user, with the related thesis, student and topic
         :rtype: QuerySet
 
         """
 
-        return models.Review.objects.filter(author=self.request.user)
+        return models.Review.objects.filter(author=self.request.user).select_related('thesis__student', 'thesis__topic')
+
+    def get_cache_variant(self):
+        """
+        Gets the values identifying the rows shown by the view besides the versions of its sections.
+
+        :return: The current user and the full path of the request
+        :rtype: list
+
+        """
+
+        return [self.request.user.pk, self.request.get_full_path()]
+
+    def get_table_context_data(self):
+        """
+        Gets context data of the table, the paginated reviews with the plagiarism reports of their theses.
+
+        :return: The context of the table
+        :rtype: dict
+
+        """
+
+        context = super(ReviewListView, self).get_table_context_data()
+        plagiarism.attach_reports(review.thesis for review in context['review_list'])
+        return context
 
     def get_context_data(self, **kwargs):
         """
@@ -129,7 +415,7 @@ class ReviewListView(ListView):
         """
 
         context = super().get_context_data(**kwargs)
-        context['form'] = forms.ReviewUploadForm
+        context['form'] = caching.render_form('review_form', forms.ReviewUploadForm(), [])
         return context
 
     def post(self, request):
@@ -149,6 +435,8 @@ class ReviewListView(ListView):
             review.file = form.cleaned_data.get('review_file')
             review.finished_date = timezone.now()
             review.save()
+            # The file is processed in the background, see site_app.jobs
+            jobs.enqueue_file_jobs(review)
             fail = False
         else:
             fail = True
@@ -159,3 +447,213 @@ class ReviewListView(ListView):
         context['fail'] = fail
         context['errors'] = form.errors
         return self.render_to_response(context)
+
+
+@method_decorator(login_required, name='dispatch')
+@method_decorator(check_group('Reviewer'), name='dispatch')
+class DeadlineListView(TemplateView):
+    """
+    View class responsible for displaying overdue reviews and reviews due this week. Reviewers see their own reviews,
+    administrators see the reviews of everybody.
+
+    """
+
+    template_name = "reviewer/deadline_list.html"
+    list_limit = 200
+
+    def get_context_data(self, **kwargs):
+        """
+        Gets context data of the deadline list view to pass to the template.
+
+        :param kwargs: Keyword arguments
+        :return: The context of the deadline list view
+        :rtype: dict
+
+        """
+
+        context = super(DeadlineListView, self).get_context_data(**kwargs)
+        reviews = models.Review.objects.select_related('author', 'thesis__student', 'thesis__topic')
+        if not self.request.user.is_admin:
+            reviews = reviews.filter(author=self.request.user)
+        context['overdue_list'] = reviews.overdue().order_by('deadline', 'id')[:self.list_limit]
+        context['due_list'] = reviews.due_within(7).order_by('deadline', 'id')[:self.list_limit]
+        return context
+
+
+@method_decorator(login_required, name='dispatch')
+class FileDownloadView(DetailView):
+    """
+    View class responsible for sending the file of a thesis or a review. The file is streamed, supports HTTP ranges
+    and conditional requests and is only available to the users involved in the review process.
+
+    """
+
+    def get(self, request, *args, **kwargs):
+        """
+        Handles the download request
+
+        :param request: (HttpRequest) The request performed by user
+        :raises: Http404, PermissionDenied
+        :return: The response streaming the file
+
+        :rtype HttpResponse
+
+        """
+        obj = self.get_object()
+        if not obj.is_accessible_by(request.user):
+            raise PermissionDenied
+        if not obj.file:
+            raise Http404('No file was uploaded')
+        return downloads.serve_file(request, obj.file)
+
+
+class ThesisDownloadView(FileDownloadView):
+    """
+    View class responsible for sending the thesis file.
+
+    """
+
+    queryset = models.Thesis.objects.only('id', 'student', 'supervisor', 'file')
+
+
+class ReviewDownloadView(FileDownloadView):
+    """
+    View class responsible for sending the review file.
+
+    """
+
+    queryset = models.Review.objects.select_related('thesis').only(
+        'id', 'author', 'file', 'thesis', 'thesis__student', 'thesis__supervisor')
+
+
+@method_decorator(login_required, name='dispatch')
+class UploadStartView(View):
+    """
+    View class responsible for starting chunked uploads of thesis and review files.
+
+    """
+
+    def post(self, request):
+        """
+        Handles the post request creating an upload
+
+        :param request: (HttpRequest) The request performed by user
+        :return: The response containing the state of the created upload
+
+        :rtype JsonResponse
+
+        """
+        form = forms.ChunkedUploadStartForm(request.POST)
+        if not form.is_valid():
+            return JsonResponse({'errors': form.errors}, status=400)
+        try:
+            upload = uploads.start_upload(request.user, **form.cleaned_data)
+        except uploads.UploadError as e:
+            return JsonResponse({'error': str(e)}, status=e.status)
+        return JsonResponse(uploads.upload_state(upload), status=201)
+
+
+@method_decorator(login_required, name='dispatch')
+class UploadChunkView(View):
+    """
+    View class responsible for receiving the chunks of an upload and reporting its progress.
+
+    """
+
+    def get(self, request, pk):
+        """
+        Handles the get request asking for the offset to resume the upload from
+
+        :param request: (HttpRequest) The request performed by user
+        :param pk: (string) ID of the upload
+        :return: The response containing the state of the upload
+
+        :rtype JsonResponse
+
+        """
+        upload = get_object_or_404(models.ChunkedUpload, pk=pk, owner=request.user)
+        return JsonResponse(uploads.upload_state(upload))
+
+    def put(self, request, pk):
+        """
+        Handles the put request sending a chunk of the file. The chunk is read from the request body as a stream.
+
+        :param request: (HttpRequest) The request performed by user
+        :param pk: (string) ID of the upload
+        :return: The response containing the state of the upload
+
+        :rtype JsonResponse
+
+        """
+        upload = get_object_or_404(models.ChunkedUpload, pk=pk, owner=request.user)
+        try:
+            offset = int(request.META['HTTP_UPLOAD_OFFSET'])
+            length = int(request.META['CONTENT_LENGTH'])
+        except (KeyError, ValueError):
+            return JsonResponse({'error': 'Upload-Offset and Content-Length headers are required'}, status=400)
+        try:
+            uploads.write_chunk(upload, offset, request, length)
+        except uploads.UploadError as e:
+            return JsonResponse(dict(uploads.upload_state(upload), error=str(e)), status=e.status)
+        return JsonResponse(uploads.upload_state(upload))
+
+
+@method_decorator(login_required, name='dispatch')
+class ExportView(View):
+    """
+    View class responsible for exporting theses, reviews or defenses as CSV or XLSX. Only available to
+    administrators.
+
+    """
+
+    def get(self, request, name):
+        """
+        Handles the get request, the export is selected by the parameters of the query string
+
+        :param request: (HttpRequest) The request performed by user
+        :param name: (string) Name of the export, either 'theses', 'reviews' or 'defenses'
+        :raises: PermissionDenied
+        :return: The response streaming the exported rows
+
+        :rtype HttpResponse
+
+        """
+        if not request.user.is_admin:
+            raise PermissionDenied
+        form = forms.ExportFilterForm(request.GET)
+        if not form.is_valid():
+            return JsonResponse({'errors': form.errors}, status=400)
+        filters = dict(form.cleaned_data)
+        file_format = filters.pop('format') or 'csv'
+        if filters['faculty'] is not None:
+            filters['faculty'] = filters['faculty'].pk
+        try:
+            return exports.export_response(name, file_format, **filters)
+        except exports.ExportError as e:
+            return JsonResponse({'error': str(e)}, status=501)
+
+
+@method_decorator(login_required, name='dispatch')
+class MetricsView(View):
+    """
+    View class responsible for serving the request metrics in the Prometheus text format. Only available to
+    administrators.
+
+    """
+
+    def get(self, request):
+        """
+        Handles the get request
+
+        :param request: (HttpRequest) The request performed by user
+        :raises: PermissionDenied
+        :return: The metrics of all workers
+
+        :rtype HttpResponse
+
+        """
+        if not request.user.is_admin:
+            raise PermissionDenied
+        # Measurements of this worker not added to the shared counters yet
+        metrics.flush()
+        return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')